@@ -1,54 +1,58 @@
 import os
 import sys
 import json
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+import time
+from ner_cache import NerCache
+from prefilter import ProductPrefilter
+from gazetteer import Gazetteer, merge_mentions
+from categories import normalizer
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from mention_sentiment import score_mentions_batch
+from ner_spans import SpanTagger, span_names, span_offsets, span_confidences
+from serving_snapshot import publish_snapshot
 
 # Ensure the script can find your Flask 'app' module
 sys.path.append(os.getcwd())
-from app import app, db, RedditPost
+from app import app, db, RedditPost, RedditComment
 
 MODEL_NAME = "dslim/bert-base-NER"
+# The NER cache holds entity spans (see ner_spans.py), not the old pipeline's token dicts
+SPANS_MODEL_ID = f"{MODEL_NAME}:spans"
+# Posts per extract_posts() call when re-processing a whole database
+EXTRACT_BATCH_SIZE = 64
 
-print("Loading BERT NER model... (this may take a moment)")
-try:
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForTokenClassification.from_pretrained(MODEL_NAME)
-    # **KEY CHANGE**: We set aggregation_strategy=None to get token-level details
-    ner_pipeline = pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy=None)
-    print("Model loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    raise
+# Shared across the phone/laptop/tablet extractors (see ner_cache.py)
+ner_cache = NerCache()
+# Skips posts with no brand/model signal before they reach the model (PREFILTER_MODE)
+prefilter = ProductPrefilter.for_category('phone')
+# EXTRACTOR_MODE=merge adds dictionary matches from gazetteer.py on top of the BERT output
+EXTRACTOR_MODE = os.environ.get('EXTRACTOR_MODE', 'bert')
+gazetteer = Gazetteer.for_category('phone') if EXTRACTOR_MODE == 'merge' else None
+normalize_mentions = normalizer('phone')
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('phone_extract')
 
-def group_consecutive_entities(ner_results):
-    """
-    Intelligently groups adjacent tokens that are part of the same entity.
-    For example: [('Google', 'B-ORG'), ('Pixel', 'I-ORG')] becomes "GooglePixel".
-    """
-    grouped_entities = []
-    current_entity_words = []
-    
-    for token in ner_results:
-        entity_label = token['entity']
-        word = token['word']
+# The model is loaded on first use so the helpers above can be imported cheaply
+ner_pipeline = None
 
-        if entity_label.startswith('B-'): # Start of a new entity
-            if current_entity_words:
-                grouped_entities.append("".join(current_entity_words).replace('##', ''))
-            current_entity_words = [word]
-        elif entity_label.startswith('I-'): # Inside an entity, continue it
-            if current_entity_words:
-                current_entity_words.append(word)
-        else: # Outside an entity, so end the current one
-            if current_entity_words:
-                grouped_entities.append("".join(current_entity_words).replace('##', ''))
-            current_entity_words = []
-            
-    # Add any leftover entity at the end of the text
-    if current_entity_words:
-        grouped_entities.append("".join(current_entity_words).replace('##', ''))
-        
-    return grouped_entities
+def load_ner_pipeline():
+    """Loads the BERT NER pipeline once and reuses it for every later call."""
+    global ner_pipeline
+    if ner_pipeline is None:
+        print("Loading BERT NER model... (this may take a moment)")
+        load_start = time.perf_counter()
+        try:
+            from transformers import AutoTokenizer, AutoModelForTokenClassification
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+            model = AutoModelForTokenClassification.from_pretrained(MODEL_NAME)
+            # Tokenizer + model without the HF "ner" pipeline; returns entity spans per text
+            ner_pipeline = SpanTagger(tokenizer, model)
+            print("Model loaded successfully.")
+            registry.set_gauge('model_load_seconds', round(time.perf_counter() - load_start, 3), category='phone')
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            raise
+    return ner_pipeline
 
 def extract_full_phone_names(text: str):
     """
@@ -57,10 +61,44 @@ def extract_full_phone_names(text: str):
     if not text or not isinstance(text, str):
         return []
     
-    ner_results = ner_pipeline(text)
-    full_names = group_consecutive_entities(ner_results)
+    with registry.time_stage('ner', items=1, category='phone'):
+        found = ner_cache.get_or_compute(text, SPANS_MODEL_ID, load_ner_pipeline())
+    full_names = span_names(found)
     return full_names
 
+def extract_posts(posts, with_confidence=False):
+    """
+    Batched extraction used by extraction_worker.py: prefilters every post, runs a
+    single NER call over the cache misses and groups entities per post. Also sets
+    `mention_sentiment` on each post, scored around each mention's NER offsets.
+    With `with_confidence`, also returns each post's {entity: confidence} (cascade.py).
+    """
+    # Comments have no title, so they are run on their body alone
+    texts = [f"{post.title}. {post.body or ''}" if post.title else (post.body or '') for post in posts]
+    keep = [prefilter.should_extract(text) for text in texts]
+    to_run = [text for text, wanted in zip(texts, keep) if wanted]
+    with registry.time_stage('ner', items=len(to_run), category='phone'):
+        # One tokenizer + model pass over the misses; entities come back as spans (see ner_spans.py)
+        found_per_post = iter(ner_cache.get_or_compute_many(
+            to_run, SPANS_MODEL_ID, lambda batch: load_ner_pipeline()(batch, batch_size=len(batch))))
+
+    results, spans, confidences = [], [], []
+    for post, wanted in zip(posts, keep):
+        found = next(found_per_post) if wanted else []
+        entities = span_names(found)
+        spans.append(span_offsets(found))
+        confidences.append(span_confidences(found))
+        if gazetteer is not None:
+            cleaned_text = f"{post.cleaned_title or ''} {post.cleaned_body or ''}"
+            entities = merge_mentions(entities, gazetteer.extract(cleaned_text), normalize_mentions)
+        results.append(entities)
+
+    with registry.time_stage('mention_sentiment', items=len(posts), category='phone'):
+        scored = score_mentions_batch(texts, results, spans)
+    for post, pairs in zip(posts, scored):
+        post.mention_sentiment = json.dumps(pairs)
+    return (results, confidences) if with_confidence else results
+
 def process_all_posts():
     """Processes all posts in the database to extract full phone names."""
     with app.app_context():
@@ -70,16 +108,28 @@ def process_all_posts():
             return
 
         print(f"Re-processing {len(posts)} total posts with improved extraction...")
+        load_ner_pipeline()
 
-        for post in posts:
-            full_text = f"{post.title}. {post.body or ''}"
-            # Use the new function to get complete names
-            phones = extract_full_phone_names(full_text)
-            post.extracted_phones = json.dumps(phones)
-            db.session.add(post)
+        # Same batched path as the worker, so mention sentiment is filled in too
+        for start in range(0, len(posts), EXTRACT_BATCH_SIZE):
+            chunk = posts[start:start + EXTRACT_BATCH_SIZE]
+            for post, phones in zip(chunk, extract_posts(chunk)):
+                post.extracted_phones = json.dumps(phones)
+                db.session.add(post)
 
-        db.session.commit()
+        with registry.time_stage('db_write', items=len(posts), category='phone'):
+            db.session.commit()
         print(f"Successfully re-processed and updated {len(posts)} posts.")
+        print(ner_cache.report())
+        print(prefilter.report())
+        registry.inc('ner_cache_lookups_total', ner_cache.hits, category='phone', result='hit')
+        registry.inc('ner_cache_lookups_total', ner_cache.misses, category='phone', result='miss')
+        registry.set_gauge('ner_cache_hit_rate', round(ner_cache.hit_rate, 4), category='phone')
+        registry.set_gauge('prefilter_skip_ratio', round(prefilter.skip_ratio, 4), category='phone')
+        registry.dump()
+        log_stage_summary(registry)
+    # Let serve.py workers pick up the new trends
+    publish_snapshot()
 
 if __name__ == "__main__":
     process_all_posts()
@@ -1,42 +1,303 @@
 import os
-from google import genai
-from google.genai import types
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+import urllib.error
+import urllib.request
 
-# Initialize Gemini client with your API key
-os.environ["API_KEY"] = "YOUR_GOOGLE_GEMINI_API_KEY"
-client = genai.Client(api_key=os.environ["API_KEY"])
+from gazetteer import merge_mentions
+from mention_sentiment import score_mentions_batch
 
-def extract_phone_names_with_gemini(text):
+# --- Gemini Configuration ---
+# The API key comes from the environment; GEMINI_BASE_URL can point at gemini_stub.py
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com').rstrip('/')
+# Posts packed into one prompt, bounded by a character budget as well
+POSTS_PER_PROMPT = int(os.environ.get('GEMINI_POSTS_PER_PROMPT', 25))
+MAX_PROMPT_CHARS = 60000
+MAX_POST_CHARS = 2000
+# In-flight requests, and request starts per minute across all of them
+CONCURRENCY = int(os.environ.get('GEMINI_CONCURRENCY', 4))
+REQUESTS_PER_MINUTE = float(os.environ.get('GEMINI_RPM', 60))
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0
+REQUEST_TIMEOUT = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+PRODUCT_NOUNS = {'phone': 'mobile phone', 'laptop': 'laptop', 'tablet': 'tablet'}
+
+FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+class GeminiError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimiter:
     """
-    Uses Gemini API to extract mobile phone names from given text via prompt.
-    Returns list of product names extracted.
+    Spaces request starts at least 60/rpm seconds apart across all concurrent
+    tasks. The client keeps one for its lifetime, so the spacing also holds
+    across extract_many() calls (each of which runs its own event loop).
     """
-    prompt = f"""Extract all mobile phone product names (brand + model) from the following text, return as a JSON list of strings:
 
-    Text: \"\"\"{text}\"\"\"
-    
-    JSON List of product names:"""
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        # Not an asyncio.Lock: those are bound to one event loop
+        self._lock = threading.Lock()
+
+    async def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def build_prompt(category, texts):
+    """One prompt for a batch of posts; each post is tagged with its position as ID."""
+    noun = PRODUCT_NOUNS.get(category, category)
+    posts = "\n\n".join(
+        f'<post id="{i}">\n{text[:MAX_POST_CHARS].replace("</post>", "")}\n</post>' for i, text in enumerate(texts))
+    return (f"Extract all {noun} product names (brand + model) from each post below.\n"
+            f"Return only a JSON object mapping every post id to a JSON list of product name strings, "
+            f"using [] for posts that mention none.\n\n{posts}")
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",  # Or your preferred Gemini model
-        contents=prompt
-    )
 
-    # Gemini returns raw text response, parse it as JSON
-    import json
+def parse_response(text, count):
+    """
+    Maps the model's JSON answer back to the batch: a list of name lists, with None
+    for posts the answer left out or garbled.
+    """
     try:
-        extracted = json.loads(response.text)
-        return extracted
-    except Exception as e:
-        print(f"Failed to parse Gemini response: {e}")
-        return []
+        answer = json.loads(FENCE_RE.sub('', text.strip()))
+    except json.JSONDecodeError:
+        return [None] * count
+    if isinstance(answer, list):  # [{"id": ..., "products": [...]}, ...]
+        answer = {str(item.get('id')): item.get('products') for item in answer if isinstance(item, dict)}
+    if not isinstance(answer, dict):
+        return [None] * count
+    results = []
+    for i in range(count):
+        names = answer.get(str(i))
+        if not isinstance(names, list):
+            results.append(None)
+            continue
+        results.append([name.strip() for name in names if isinstance(name, str) and name.strip()])
+    return results
+
+
+def pack(texts, posts_per_prompt=POSTS_PER_PROMPT, max_chars=MAX_PROMPT_CHARS):
+    """Splits text indexes into prompt-sized batches by count and character budget."""
+    batches, batch, size = [], [], 0
+    for i, text in enumerate(texts):
+        length = min(len(text), MAX_POST_CHARS)
+        if batch and (len(batch) >= posts_per_prompt or size + length > max_chars):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(i)
+        size += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class GeminiClient:
+    """
+    Batched Gemini extraction: cached texts are answered from disk, the rest are
+    packed many posts per prompt and sent concurrently under a rate limit, with
+    retries and backoff. extract_many() returns None for posts that still failed.
+    """
+
+    def __init__(self, category='phone', cache=None, registry=None, model=GEMINI_MODEL,
+                 base_url=GEMINI_BASE_URL, api_key=GEMINI_API_KEY, posts_per_prompt=POSTS_PER_PROMPT,
+                 concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE):
+        self.category = category
+        self.cache = cache
+        self.registry = registry
+        self.model = model
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model}:generateContent"
+        self.api_key = api_key
+        self.posts_per_prompt = posts_per_prompt
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.limiter = RateLimiter(requests_per_minute)
+        self.requests = 0
+        self.retries = 0
+        self.posts_sent = 0
+        self.failed_posts = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.request_seconds = 0.0
+
+    @property
+    def model_id(self):
+        return f"gemini:{self.model}:{self.category}"
 
-# Example of integrating with existing Reddit post processing code:
+    def _post(self, prompt):
+        """One blocking generateContent call; returns (answer text, usage metadata)."""
+        body = json.dumps({
+            'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+            'generationConfig': {'responseMimeType': 'application/json', 'temperature': 0},
+        }).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Content-Type': 'application/json', 'x-goog-api-key': self.api_key})
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                data = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get('Retry-After') if e.headers else None
+            raise GeminiError(f"HTTP {e.code}", status=e.code,
+                              retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        except (urllib.error.URLError, TimeoutError, OSError, json.JSONDecodeError) as e:
+            raise GeminiError(str(e))
+        try:
+            parts = data['candidates'][0]['content']['parts']
+        except (KeyError, IndexError, TypeError):
+            raise GeminiError("Response has no candidates", status=200)
+        return ''.join(part.get('text', '') for part in parts), data.get('usageMetadata', {})
+
+    async def _request(self, prompt, limiter, semaphore):
+        for attempt in range(MAX_ATTEMPTS):
+            async with semaphore:
+                await limiter.wait()
+                start = time.perf_counter()
+                try:
+                    text, usage = await asyncio.to_thread(self._post, prompt)
+                    status = 'ok'
+                except GeminiError as e:
+                    status, error = str(e.status or 'error'), e
+                elapsed = time.perf_counter() - start
+                self.requests += 1
+                self.request_seconds += elapsed
+                if self.registry is not None:
+                    self.registry.observe('gemini_request_seconds', elapsed, category=self.category)
+                    self.registry.inc('gemini_requests_total', category=self.category, status=status)
+            if status == 'ok':
+                self.prompt_tokens += usage.get('promptTokenCount', 0)
+                self.output_tokens += usage.get('candidatesTokenCount', 0)
+                return text
+            if error.status is not None and error.status not in RETRY_STATUSES:
+                return None
+            if attempt + 1 < MAX_ATTEMPTS:
+                self.retries += 1
+                delay = error.retry_after or BACKOFF_BASE * 2 ** attempt
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        return None
+
+    async def _extract_async(self, texts):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = pack(texts, self.posts_per_prompt)
+        answers = await asyncio.gather(*(
+            self._request(build_prompt(self.category, [texts[i] for i in batch]), self.limiter, semaphore)
+            for batch in batches))
+        results = [None] * len(texts)
+        for batch, answer in zip(batches, answers):
+            if answer is not None:
+                for i, names in zip(batch, parse_response(answer, len(batch))):
+                    results[i] = names
+        return results
+
+    def extract_many(self, texts):
+        """Product names per text, or None where Gemini failed after retries."""
+        results = [self.cache.get(text, self.model_id) if self.cache else None for text in texts]
+        missing = list(dict.fromkeys(text for text, cached in zip(texts, results) if cached is None))
+        if missing:
+            self.posts_sent += len(missing)
+            computed = dict(zip(missing, asyncio.run(self._extract_async(missing))))
+            for text, names in computed.items():
+                if names is None:
+                    self.failed_posts += 1
+                elif self.cache:
+                    self.cache.put(text, self.model_id, names)
+            results = [computed[text] if cached is None else cached for text, cached in zip(texts, results)]
+        return results
+
+    def report(self):
+        per_prompt = self.posts_sent / self.requests if self.requests else 0.0
+        return (f"Gemini: {self.posts_sent} posts in {self.requests} requests ({per_prompt:.1f} posts/request, "
+                f"{self.retries} retries), {self.prompt_tokens} prompt + {self.output_tokens} output tokens, "
+                f"{self.failed_posts} posts fell back to BERT.")
+
+
+class GeminiExtractor:
+    """
+    NER_BACKEND=gemini: drop-in for a category's *_bert.py module, like
+    spacy_extractor.SpacyExtractor. Posts Gemini fails on are extracted with the
+    wrapped BERT module instead, so every post still gets mentions.
+    """
+
+    def __init__(self, category, module, client=None):
+        self.category = category
+        self.module = module
+        self.client = client or GeminiClient(category, cache=module.ner_cache, registry=module.registry)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def load_ner_pipeline(self):
+        # BERT is the fallback, so it is loaded up front like in the other backends
+        return self.module.load_ner_pipeline()
+
+    def extract_posts(self, posts):
+        module = self.module
+        texts = [f"{post.title}. {post.body or ''}" if post.title else (post.body or '') for post in posts]
+        keep = [module.prefilter.should_extract(text) for text in texts]
+        to_run = [text for text, wanted in zip(texts, keep) if wanted]
+        with module.registry.time_stage('ner', items=len(to_run), category=self.category, backend='gemini'):
+            outputs = iter(self.client.extract_many(to_run))
+
+        results, fallback = [], []
+        for i, (post, wanted) in enumerate(zip(posts, keep)):
+            names = next(outputs) if wanted else []
+            if names is None:
+                fallback.append(i)
+                results.append(None)
+                continue
+            if module.gazetteer is not None:
+                cleaned_text = f"{post.cleaned_title or ''} {post.cleaned_body or ''}"
+                names = merge_mentions(names, module.gazetteer.extract(cleaned_text), module.normalize_mentions)
+            results.append(list(dict.fromkeys(names)))
+
+        if fallback:
+            module.registry.inc('gemini_fallback_posts_total', len(fallback), category=self.category)
+            # BERT's extract_posts() also sets mention_sentiment on these posts
+            for i, names in zip(fallback, module.extract_posts([posts[i] for i in fallback])):
+                results[i] = names
+        fell_back = set(fallback)
+        answered = [i for i in range(len(posts)) if i not in fell_back]
+        with module.registry.time_stage('mention_sentiment', items=len(answered), category=self.category):
+            # No offsets from the LLM; mention_sentiment locates each name in the text
+            scored = score_mentions_batch([texts[i] for i in answered], [results[i] for i in answered],
+                                          [() for _ in answered])
+        for i, pairs in zip(answered, scored):
+            posts[i].mention_sentiment = json.dumps(pairs)
+        return results
+
+
+def extract_phone_names_with_gemini(text):
+    """
+    Uses Gemini API to extract mobile phone names from given text via prompt.
+    Returns list of product names extracted.
+    """
+    return GeminiClient('phone').extract_many([text])[0] or []
 
-# During iteration over each post (inside your existing loop in collect_data.py)
 
-# Sample:
-# phone_names = extract_phone_names_with_gemini(post.title)
-# For each extracted phone name:
-#   Store it in a new database table or existing related table linking with post.id
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Extract product names from texts with batched Gemini calls.")
+    parser.add_argument('texts', nargs='+')
+    parser.add_argument('--category', default='phone', choices=sorted(PRODUCT_NOUNS))
+    args = parser.parse_args()
 
+    client = GeminiClient(args.category)
+    for text, names in zip(args.texts, client.extract_many(args.texts)):
+        print(f"{text[:60]!r}: {names}")
+    print(client.report())
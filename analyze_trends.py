@@ -1,57 +1,66 @@
 # Save this as analyze_trends.py
 
-import spacy
+import argparse
 from collections import Counter
 from app import app, db, RedditPost # Import components from our Flask app
+from compact_posts import YIELD_PER
+from spacy_extractor import load_spacy, pipe_entities, SPACY_BATCH_SIZE, SPACY_N_PROCESS
 
-def analyze_product_trends():
+def analyze_product_trends(batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS):
     """
     Analyzes positive/neutral posts to extract and count product names using NER.
     """
     print("Loading spaCy model...")
-    # Load the pre-trained English model
+    # Only the NER component is loaded; the parser and lemmatizer are excluded
     try:
-        nlp = spacy.load("en_core_web_sm")
+        load_spacy()
     except OSError:
         print("Spacy model 'en_core_web_sm' not found.")
         print("Please run: python -m spacy download en_core_web_sm")
         return
 
-    product_mentions = []
-    
+    product_mentions = Counter()
+    analyzed = 0
+
     print("Connecting to database and fetching posts...")
     with app.app_context():
-        # Query for posts with a positive or neutral sentiment
-        posts_to_analyze = RedditPost.query.filter(
+        # Query for posts with a positive or neutral sentiment; only the title is
+        # needed, so skip loading bodies, cleaned text and URLs
+        titles = (title for (title,) in RedditPost.query.with_entities(RedditPost.title).filter(
             RedditPost.sentiment_label.in_(['positive', 'neutral'])
-        ).all()
-
-        if not posts_to_analyze:
-            print("No positive or neutral posts found in the database.")
-            return
-            
-        print(f"Analyzing {len(posts_to_analyze)} posts for product names...")
-
-        # We will use the original title for NER as it has proper casing (e.g., "iPhone")
-        for post in posts_to_analyze:
-            doc = nlp(post.title)
-            # Extract entities recognized as products or organizations
-            for ent in doc.ents:
-                if ent.label_ in ["PRODUCT", "ORG"]:
-                    product_mentions.append(ent.text)
+        ).yield_per(YIELD_PER))
+
+        print(f"Analyzing posts for product names (batch size {batch_size}, {n_process} process(es))...")
+
+        # We will use the original title for NER as it has proper casing (e.g., "iPhone").
+        # Titles are streamed from the DB straight into nlp.pipe.
+        for entities in pipe_entities(titles, batch_size=batch_size, n_process=n_process):
+            analyzed += 1
+            # Entities recognized as products or organizations
+            product_mentions.update(text for text, _, _ in entities)
+
+    if not analyzed:
+        print("No positive or neutral posts found in the database.")
+        return
+    print(f"Analyzed {analyzed} posts.")
 
     if not product_mentions:
         print("No product names were identified.")
         return
 
     # Count the most common product mentions
-    trend_counts = Counter(product_mentions)
-    
+    trend_counts = product_mentions
+
     print("\n--- Top 20 Trending Products (from Positive/Neutral Posts) ---")
     for product, count in trend_counts.most_common(20):
         print(f"{product}: {count} mentions")
 
 # Main execution block
 if __name__ == '__main__':
-    
-    analyze_product_trends()
+    parser = argparse.ArgumentParser(description="Count PRODUCT/ORG entities in positive/neutral post titles with spaCy.")
+    parser.add_argument('--batch-size', type=int, default=SPACY_BATCH_SIZE)
+    parser.add_argument('--n-process', type=int, default=SPACY_N_PROCESS,
+                        help="spaCy worker processes for nlp.pipe.")
+    args = parser.parse_args()
+
+    analyze_product_trends(batch_size=args.batch_size, n_process=args.n_process)
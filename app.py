@@ -1,14 +1,45 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, jsonify, render_template, request, g, Response
 from flask_sqlalchemy import SQLAlchemy
 import json
 from collections import Counter
 import re
 import datetime
+import os
+import time
+import gzip
+import hashlib
+import threading
+from sqlalchemy import event
+from pipeline_metrics import MetricsRegistry, load_snapshots, render_prometheus
+from serving_snapshot import SnapshotReader
+from recommend import Recommender, ASPECTS
+from schema import ensure_columns
+from mention_sentiment import sentiment_shares, share_rows
+from trend_history import TrendHistory
+from heavy_hitters import TrendingReader
+from categories import CATEGORIES
+from live_updates import TrendBroadcaster
+
+try:
+    import brotli
+except ImportError:  # gzip only; pip install brotli adds Content-Encoding: br
+    brotli = None
 
 # Initialize Flask app
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///reddit_posts.db'
+# REDDIT_POSTS_DB_URI lets benchmark.py point the app at a scratch database
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('REDDIT_POSTS_DB_URI', 'sqlite:///reddit_posts.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# serve.py sets these: read-only pooled connections, and answering from the
+# snapshot the pipelines publish instead of querying on every request
+APP_READ_ONLY = os.environ.get('APP_READ_ONLY', '0') == '1'
+app.config['SERVE_SNAPSHOT'] = os.environ.get('SERVE_SNAPSHOT', '0') == '1'
+if APP_READ_ONLY:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 8)),
+        'max_overflow': 4,
+        'connect_args': {'check_same_thread': False},
+    }
 
 # DB setup
 db = SQLAlchemy(app)
@@ -27,6 +58,7 @@ class RedditPost(db.Model):
     sentiment_compound = db.Column(db.Float, nullable=True)
     sentiment_label = db.Column(db.String(50), nullable=True)
     extracted_phones = db.Column(db.Text, nullable=True)  # Will store a JSON string list
+    mention_sentiment = db.Column(db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
 
     @property
     def phones(self):
@@ -44,19 +76,100 @@ class RedditPost(db.Model):
     def __repr__(self):
         return f"<Post ID: {self.id}>"
 
+class RedditComment(db.Model):
+    id = db.Column(db.String, primary_key=True)
+    post_id = db.Column(db.String, db.ForeignKey('reddit_post.id'), nullable=False, index=True)
+    parent_id = db.Column(db.String, nullable=True)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    body = db.Column(db.Text, nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    cleaned_body = db.Column(db.Text, nullable=True)
+    sentiment_compound = db.Column(db.Float, nullable=True)
+    sentiment_label = db.Column(db.String(50), nullable=True)
+    extracted_phones = db.Column(db.Text, nullable=True)  # Same JSON list format as posts
+    mention_sentiment = db.Column(db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
+
+    post = db.relationship('RedditPost', backref=db.backref('comments', lazy='dynamic'))
+
+    # Comments have no title; these let them go through the *_bert.py extract_posts() as-is
+    @property
+    def title(self):
+        return ''
+
+    @property
+    def cleaned_title(self):
+        return None
+
+    @property
+    def phones(self):
+        if self.extracted_phones:
+            try:
+                return json.loads(self.extracted_phones)
+            except json.JSONDecodeError:
+                return []
+        return []
+
+    def __repr__(self):
+        return f"<Comment ID: {self.id} on {self.post_id}>"
+
 # Create database tables if they don't exist
 with app.app_context():
     db.create_all()
+    ensure_columns(db, RedditPost, RedditComment)
+    if APP_READ_ONLY:
+        def _set_query_only(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA query_only = ON")
+        event.listen(db.engine, 'connect', _set_query_only)
+        # Drop the connection create_all() used so every pooled one is read-only
+        db.engine.dispose()
+
+snapshot_reader = SnapshotReader()
+# Pushes /api/trends diffs to /api/trends/stream clients when a pipeline publishes
+trend_broadcaster = TrendBroadcaster(snapshot_reader)
+# Per-product features built by recommend.py; loaded once, reloaded when rebuilt
+recommender = Recommender()
+
+# Heavy-hitter sketches the extraction worker and streaming pipeline dump
+trending_reader = TrendingReader()
+# Ranking history appended by the normalize scripts; opened on first use
+trend_history = None
+
+# Product cards for the client: built and compressed once per feature build,
+# then served from memory. Browsers may reuse them for CARDS_MAX_AGE seconds.
+CARDS_MAX_AGE = int(os.environ.get('CARDS_MAX_AGE', 60))
+MAX_CARDS = 100
+# (category, limit) -> (CategoryFeatures they were built from, ETag, {encoding: body}).
+# Limits are validated to 1..MAX_CARDS, so this holds at most MAX_CARDS entries per category.
+card_bodies = {}
+# Threaded servers (python app.py, WsgiToAsgi's pool) build and prune bodies concurrently
+card_bodies_lock = threading.Lock()
+
+# Request latency for the API; pipeline scripts dump their own stage metrics
+# into pipeline_metrics/ and /metrics serves both together.
+metrics_registry = MetricsRegistry('app')
+metrics_registry.describe('http_request_seconds', 'API request latency in seconds')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if request.endpoint != 'metrics' and hasattr(g, 'request_start'):
+        endpoint = request.endpoint or 'unknown'
+        metrics_registry.observe('http_request_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+        metrics_registry.inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
 
 @app.route('/')
 def home():
     # You will need to create a basic index.html in a 'templates' folder
     return "<h1>Trend Analysis Project</h1><p>Navigate to /api/trends to see results.</p>"
 
-@app.route('/api/reddit-posts')
-def api_reddit_posts():
+def recent_posts_payload():
     posts = RedditPost.query.order_by(RedditPost.created.desc()).limit(20).all()
-    results = [
+    return [
         {
             'id': post.id,
             'subreddit': post.subreddit,
@@ -68,25 +181,226 @@ def api_reddit_posts():
             'extracted_phones': post.phones
         } for post in posts
     ]
-    return jsonify(results)
+
+def trends_payload():
+    """
+    Aggregates phone names from all processed posts and comments and returns a
+    ranked list of the most mentioned products.
+    """
+    trend_counts = Counter()
+    # Only the JSON column is needed, so skip loading whole rows
+    for model in (RedditPost, RedditComment):
+        for (extracted,) in model.query.with_entities(model.extracted_phones).filter(model.extracted_phones != None):
+            try:
+                trend_counts.update(json.loads(extracted))
+            except json.JSONDecodeError:
+                continue
+
+    if not trend_counts:
+        return {"message": "No trends found yet. Run the extraction script."}
+    return trend_counts.most_common(30)
+
+def trend_sentiment_payload():
+    """
+    Positive/negative share per product, from the per-mention sentiment the
+    extraction stores next to each mention (not the whole-post label).
+    """
+    values = []
+    for model in (RedditPost, RedditComment):
+        values.extend(value for (value,) in
+                      model.query.with_entities(model.mention_sentiment).filter(model.mention_sentiment != None))
+
+    rows = share_rows(sentiment_shares(values))
+    if not rows:
+        return {"message": "No mention sentiment yet. Re-run the extraction script."}
+    return rows
+
+def build_serving_snapshot():
+    """Everything the read endpoints serve, computed once; see serving_snapshot.py."""
+    return {
+        'recent_posts': recent_posts_payload(),
+        'trends': trends_payload(),
+        'trend_sentiment': trend_sentiment_payload(),
+    }
+
+def _snapshot_response(key):
+    body = snapshot_reader.body(key) if app.config['SERVE_SNAPSHOT'] else None
+    if body is None:
+        return None
+    return Response(body, mimetype='application/json')
+
+@app.route('/api/reddit-posts')
+def api_reddit_posts():
+    return _snapshot_response('recent_posts') or jsonify(recent_posts_payload())
 
 @app.route('/api/trends')
 def api_trends():
+    return _snapshot_response('trends') or jsonify(trends_payload())
+
+@app.route('/api/trends/stream')
+def api_trends_stream():
+    """
+    Server-Sent Events: the current ranking ("ranking" event), then a "diff"
+    event whenever a pipeline publishes a new snapshot. Use instead of polling
+    /api/trends; every client gets the same diff, computed once per update.
+    This view holds a thread per open stream, which only works on a threaded
+    server (python app.py). Behind WsgiToAsgi every stream would block the
+    adapter's single thread, so serve.py answers this path natively instead.
+    """
+    stream = trend_broadcaster.stream(request.headers.get('Last-Event-ID'))
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/trends/sentiment')
+def api_trend_sentiment():
+    return _snapshot_response('trend_sentiment') or jsonify(trend_sentiment_payload())
+
+def _limit_arg(default, maximum):
+    """?limit= as an int between 1 and `maximum`; ValueError for anything else."""
+    limit = int(request.args.get('limit', default))
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit must be between 1 and {maximum}")
+    return limit
+
+@app.route('/api/recommend')
+def api_recommend():
     """
-    This endpoint now correctly aggregates phone names from all processed posts
-    and returns a ranked list of the most mentioned products.
+    Ranks products by popularity, momentum, sentiment and engagement, optionally
+    within a budget and weighted towards one aspect (?prefer=camera).
     """
-    all_phones = []
-    # Filter for posts where extraction has been completed
-    posts = RedditPost.query.filter(RedditPost.extracted_phones != None).all()
-    for post in posts:
-        all_phones.extend(post.phones)
-    
-    if not all_phones:
-        return jsonify({"message": "No trends found yet. Run the extraction script."})
-        
-    trend_counts = Counter(all_phones)
-    return jsonify(trend_counts.most_common(30))
+    category = request.args.get('category', 'phone')
+    prefer = request.args.get('prefer') or None
+    if prefer is not None and prefer not in ASPECTS:
+        return jsonify({"error": f"Unknown aspect '{prefer}'. Expected one of: {', '.join(ASPECTS)}"}), 400
+    try:
+        budget = float(request.args['budget']) if request.args.get('budget') else None
+        limit = _limit_arg(10, 50)
+    except ValueError:
+        return jsonify({"error": "budget must be a number and limit an integer from 1 to 50."}), 400
+
+    features = recommender.features(category)
+    if features is None:
+        return jsonify({"message": f"No recommendation features for '{category}' yet. Run recommend.py build."})
+    return jsonify({
+        'category': category,
+        'budget': budget,
+        'prefer': prefer,
+        'features_built_at': features.built_at,
+        'recommendations': features.recommend(budget, prefer, limit),
+    })
+
+def get_trend_history():
+    global trend_history
+    if trend_history is None:
+        trend_history = TrendHistory()
+    return trend_history
+
+@app.route('/api/trends/history')
+def api_trend_history():
+    """
+    One product's mentions, rank and sentiment over time as parallel arrays:
+    ?product=Google Pixel 8&category=phone&since=2026-09-01&until=2026-10-01
+    """
+    product = request.args.get('product')
+    if not product:
+        return jsonify({"error": "product is required."}), 400
+    try:
+        history = get_trend_history().history(request.args.get('category', 'phone'), product,
+                                              since=request.args.get('since'), until=request.args.get('until'))
+    except ValueError:
+        return jsonify({"error": "since and until must be ISO dates or epoch seconds."}), 400
+    if history is None:
+        return jsonify({"error": f"No history for '{product}'."}), 404
+    return jsonify(history)
+
+@app.route('/api/trends/changes')
+def api_trend_changes():
+    """Rank changes of the current top products between two runs: ?category=phone&from=2026-10-01&to=2026-10-08"""
+    category = request.args.get('category', 'phone')
+    try:
+        limit = _limit_arg(30, 200)
+        changes = get_trend_history().rank_changes(category, request.args.get('from'), request.args.get('to'), limit)
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO dates or epoch seconds, limit an integer from 1 to 200."}), 400
+    if changes is None:
+        return jsonify({"message": f"No {category} ranking history yet. Run the normalize script."})
+    return jsonify(changes)
+
+@app.route('/api/trending')
+def api_trending():
+    """
+    Top products of the last hour from the workers' merged sketches, not the
+    database: ?category=phone (default: all categories)&limit=20
+    """
+    category = request.args.get('category') or None
+    try:
+        limit = _limit_arg(20, 100)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer from 1 to 100."}), 400
+    rows = trending_reader.top(category, limit)
+    if not rows:
+        return jsonify({"message": "Nothing trending yet. Run the extraction worker or the streaming pipeline."})
+    return jsonify(rows)
+
+def _card_body(category, limit, features):
+    with card_bodies_lock:
+        cached = card_bodies.get((category, limit))
+        if cached is not None and cached[0] is features:
+            return cached
+        # A new feature build makes every body of this category stale
+        for key in [key for key, value in card_bodies.items() if key[0] == category and value[0] is not features]:
+            del card_bodies[key]
+    # Compressed outside the lock; two requests racing here just build the same body twice
+    body = json.dumps({'category': category, 'built_at': features.built_at, 'items': features.cards(limit)},
+                      separators=(',', ':')).encode('utf-8')
+    encoded = {'identity': body, 'gzip': gzip.compress(body, 9)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body, quality=11)
+    cached = (features, hashlib.sha1(body).hexdigest()[:20], encoded)
+    with card_bodies_lock:
+        card_bodies[(category, limit)] = cached
+    return cached
+
+@app.route('/api/category/<name>/items')
+def api_category_items(name):
+    """
+    Everything the client's category page shows, in one small response:
+    product cards (name, trend score, description, sentiment, top post link).
+    ?limit=24. Compressed with br/gzip per Accept-Encoding and revalidated by ETag.
+    """
+    if name not in CATEGORIES:
+        return jsonify({"error": f"Unknown category '{name}'. Expected one of: {', '.join(CATEGORIES)}"}), 404
+    try:
+        limit = _limit_arg(24, MAX_CARDS)
+    except ValueError:
+        return jsonify({"error": f"limit must be an integer from 1 to {MAX_CARDS}."}), 400
+    features = recommender.features(name)
+    if features is None:
+        return jsonify({"message": f"No {name} products yet. Run recommend.py build.", "items": []})
+
+    _, etag, encoded = _card_body(name, limit, features)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in encoded]) or 'identity'
+        response = Response(encoded[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    # Weak: the br, gzip and plain bodies are the same JSON
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = f"public, max-age={CARDS_MAX_AGE}"
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus-style metrics: API latency plus the last run of every pipeline script."""
+    metrics_registry.set_gauge('sse_clients', trend_broadcaster.clients)
+    body = render_prometheus([metrics_registry.snapshot()] + load_snapshots())
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,286 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime as dt
+import multiprocessing
+from collections import deque
+
+from categories import CATEGORIES, get_category, collect_module
+from job_queue import JobQueue
+from pipeline_metrics import MetricsRegistry, log_event, log_stage_summary
+
+# --- Backfill Configuration ---
+# Progress per dump file, so an interrupted backfill resumes where it stopped
+CHECKPOINT_PATH = os.environ.get('BACKFILL_CHECKPOINT_PATH', 'backfill_checkpoints.db')
+# Matching submissions sent to a pool worker (and committed) at a time
+BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 2000))
+# Long stretches of other subreddits still advance the checkpoint every this many lines
+CHECKPOINT_LINES = 1_000_000
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Batches handed to the pool but not yet written; bounds memory however big the dump is
+BATCHES_IN_FLIGHT_PER_WORKER = 2
+# Pushshift dumps are compressed with --long=31
+ZSTD_MAX_WINDOW = 2 ** 31
+PROGRESS_INTERVAL = 30
+# Existing ids are looked up this many at a time (SQLite's bound-variable limit)
+ID_LOOKUP_CHUNK = 500
+# Read before json.loads, so lines from other subreddits are skipped without parsing them
+SUBREDDIT_RE = re.compile(r'"subreddit"\s*:\s*"([^"]+)"')
+REMOVED_BODIES = ('[removed]', '[deleted]')
+
+
+def open_dump(path):
+    """Text stream over a dump: .zst (Pushshift) or plain .ndjson/.jsonl."""
+    if not path.endswith('.zst'):
+        return open(path, encoding='utf-8', errors='replace')
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading .zst dumps needs: pip install zstandard") from None
+    reader = zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW).stream_reader(open(path, 'rb'), closefd=True)
+    return io.TextIOWrapper(reader, encoding='utf-8', errors='replace')
+
+
+def subreddit_routes(categories):
+    """Lower-cased subreddit -> [(category, subreddit as spelled in the collector)]."""
+    routes = {}
+    for category in categories:
+        for sub in collect_module(category).target_subreddits:
+            routes.setdefault(sub.lower(), []).append((category, sub))
+    return routes
+
+
+def _record(data):
+    """The dump fields collect_posts() reads from PRAW, or None for unusable lines."""
+    if not data.get('id') or not data.get('title') or data.get('created_utc') is None:
+        return None
+    body = data.get('selftext') or ''
+    return {
+        'id': data['id'],
+        'title': data['title'],
+        'score': int(data.get('score') or 0),
+        'url': data.get('url') or f"https://www.reddit.com{data.get('permalink', '')}",
+        'num_comments': int(data.get('num_comments') or 0),
+        'body': '' if body in REMOVED_BODIES else body,
+        'created_utc': int(float(data['created_utc'])),
+    }
+
+
+_collectors = {}
+
+
+def _init_worker(categories):
+    # Each pool process imports the collectors (NLTK data, VADER) once
+    sys.path.append(os.getcwd())
+    for category in categories:
+        _collectors[category] = collect_module(category)
+
+
+def _prepare(batch):
+    """
+    Runs in a pool process: cleans and scores one batch of (category,
+    subreddit, record). Returns ({category: [row dicts]}, seconds spent).
+    """
+    start = time.perf_counter()
+    rows = {}
+    for category, sub, record in batch:
+        collector = _collectors[category]
+        compound, label = collector.get_sentiment(record['title'])
+        rows.setdefault(category, []).append({
+            'id': record['id'], 'subreddit': sub, 'title': record['title'],
+            'score': record['score'], 'url': record['url'], 'num_comments': record['num_comments'],
+            'body': record['body'], 'created': dt.datetime.fromtimestamp(record['created_utc']),
+            'cleaned_title': collector.clean_text(record['title']),
+            'cleaned_body': collector.clean_text(record['body']),
+            'sentiment_compound': compound, 'sentiment_label': label,
+        })
+    return rows, time.perf_counter() - start
+
+
+class BackfillCheckpoints:
+    """
+    Per-file progress: the number of input lines whose matching submissions
+    are committed. A restart skips that many lines; a batch that was being
+    written when the backfill died is replayed, and its rows already in the
+    DB are skipped by id.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS backfill_checkpoint ("
+            " path TEXT PRIMARY KEY,"
+            " lines INTEGER NOT NULL,"
+            " posts INTEGER NOT NULL,"
+            " finished INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def get(self, path):
+        """(lines, posts, finished) for a dump, (0, 0, False) if it was never started."""
+        row = self._conn.execute("SELECT lines, posts, finished FROM backfill_checkpoint WHERE path = ?",
+                                 (os.path.abspath(path),)).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else (0, 0, False)
+
+    def save(self, path, lines, posts, finished=False):
+        self._conn.execute(
+            "INSERT INTO backfill_checkpoint (path, lines, posts, finished, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET lines = excluded.lines, posts = excluded.posts,"
+            " finished = excluded.finished, updated_at = excluded.updated_at",
+            (os.path.abspath(path), lines, posts, int(finished), time.time()))
+
+    def reset(self, path):
+        self._conn.execute("DELETE FROM backfill_checkpoint WHERE path = ?", (os.path.abspath(path),))
+
+    def close(self):
+        self._conn.close()
+
+
+class Backfill:
+    """
+    Streams dump files line by line, keeps the submissions of the collectors'
+    target subreddits, has a process pool clean and score them in batches and
+    bulk-inserts the results into each category's DB. Only a bounded number of
+    batches is in flight, so memory stays flat however large the dump is.
+    """
+
+    def __init__(self, categories, workers=DEFAULT_WORKERS, batch_size=BATCH_SIZE,
+                 checkpoints=None, enqueue=False):
+        self.categories = list(categories)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoints = checkpoints or BackfillCheckpoints()
+        self.queue = JobQueue() if enqueue else None
+        self.registry = MetricsRegistry('backfill')
+        self.routes = subreddit_routes(self.categories)
+        self._collectors = {category: collect_module(category) for category in self.categories}
+
+    def _write(self, category, rows):
+        """Inserts the rows whose ids are not stored yet; returns the new ids."""
+        cfg = get_category(category)
+        collector = self._collectors[category]
+        model = collector.RedditPost
+        db = getattr(collector, cfg['db'])
+        with getattr(collector, cfg['app']).app_context(), \
+                self.registry.time_stage('db_write', items=len(rows), category=category) as batch:
+            ids = [row['id'] for row in rows]
+            existing = set()
+            for i in range(0, len(ids), ID_LOOKUP_CHUNK):
+                existing.update(row.id for row in model.query.with_entities(model.id)
+                                .filter(model.id.in_(ids[i:i + ID_LOOKUP_CHUNK])).all())
+            new_rows = []
+            for row in rows:
+                if row['id'] not in existing:
+                    existing.add(row['id'])
+                    new_rows.append(row)
+            if new_rows:
+                # OR IGNORE: a collector may have inserted some of them since the lookup
+                db.session.execute(model.__table__.insert().prefix_with('OR IGNORE'), new_rows)
+                db.session.commit()
+            batch.items = len(new_rows)
+        new_ids = [row['id'] for row in new_rows]
+        self.registry.inc('posts_ingested_total', len(new_ids), category=category)
+        self.registry.inc('backfill_duplicates_total', len(rows) - len(new_ids), category=category)
+        if self.queue is not None:
+            self.queue.enqueue(category, new_ids)
+        return new_ids
+
+    def run_file(self, pool, path):
+        start_line, posts, finished = self.checkpoints.get(path)
+        if finished:
+            print(f"{path}: already backfilled ({posts} posts). Use --restart to read it again.")
+            return 0
+        if start_line:
+            print(f"{path}: resuming after line {start_line} ({posts} posts so far)")
+        max_in_flight = self.workers * BATCHES_IN_FLIGHT_PER_WORKER
+        # (pending pool result or None, input lines covered once it is written)
+        in_flight = deque()
+        batch, written, line_no, last_mark = [], 0, 0, start_line
+        started = last_report = time.monotonic()
+
+        def finish_oldest():
+            nonlocal posts, written
+            result, lines = in_flight.popleft()
+            if result is not None:
+                rows, seconds = result.get()
+                self.registry.observe('backfill_prepare_seconds', seconds)
+                for category, category_rows in rows.items():
+                    written += len(self._write(category, category_rows))
+                posts += sum(len(category_rows) for category_rows in rows.values())
+            self.checkpoints.save(path, lines, posts)
+
+        def dispatch(lines):
+            nonlocal batch, last_mark
+            while len(in_flight) >= max_in_flight:
+                finish_oldest()
+            in_flight.append((pool.apply_async(_prepare, (batch,)) if batch else None, lines))
+            batch, last_mark = [], lines
+
+        with open_dump(path) as f:
+            for line_no, line in enumerate(f, 1):
+                if line_no <= start_line:
+                    continue
+                # Crossposts also carry their parent's "subreddit", so any match only means "parse it"
+                if any(sub.lower() in self.routes for sub in SUBREDDIT_RE.findall(line)):
+                    try:
+                        data = json.loads(line)
+                        record = _record(data)
+                        targets = self.routes.get(str(data.get('subreddit', '')).lower(), ())
+                    except (ValueError, TypeError, AttributeError) as e:
+                        self.registry.inc('backfill_bad_lines_total')
+                        log_event('backfill_bad_line', path=path, line=line_no, error=str(e))
+                        record = None
+                    if record is not None:
+                        batch.extend((category, sub, record) for category, sub in targets)
+                if len(batch) >= self.batch_size or line_no - last_mark >= CHECKPOINT_LINES:
+                    dispatch(line_no)
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    rate = (line_no - start_line) / (last_report - started)
+                    print(f"{path}: line {line_no} ({rate:,.0f} lines/s), {written} new posts")
+            dispatch(line_no)
+            while in_flight:
+                finish_oldest()
+        self.checkpoints.save(path, line_no, posts, finished=True)
+        self.registry.inc('backfill_lines_total', line_no - start_line)
+        elapsed = time.monotonic() - started
+        print(f"{path}: {line_no - start_line} lines in {elapsed:.1f}s, "
+              f"{written} new posts ({written / elapsed * 60 if elapsed else 0:,.0f}/min)")
+        return written
+
+    def run(self, paths, restart=False):
+        total = 0
+        with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.categories,)) as pool:
+            for path in paths:
+                if restart:
+                    self.checkpoints.reset(path)
+                total += self.run_file(pool, path)
+        self.registry.dump()
+        log_stage_summary(self.registry)
+        return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk-load historical submissions from Pushshift-style dumps.")
+    parser.add_argument('paths', nargs='+', help="RS_*.zst submission dumps (or uncompressed .ndjson)")
+    parser.add_argument('--categories', nargs='+', default=list(CATEGORIES), choices=list(CATEGORIES))
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Clean/sentiment processes.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--enqueue', action='store_true',
+                        help="Queue the new posts for extraction_worker.py as they are written.")
+    parser.add_argument('--restart', action='store_true', help="Ignore saved checkpoints for these files.")
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    backfill = Backfill(args.categories, workers=args.workers, batch_size=args.batch_size, enqueue=args.enqueue)
+    written = backfill.run(args.paths, restart=args.restart)
+    print(f"Backfilled {written} new posts.")
+    if written and not args.enqueue:
+        print("Queue them for extraction with: python extraction_worker.py --enqueue-missing --drain")
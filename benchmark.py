@@ -0,0 +1,487 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import datetime as dt
+from collections import Counter
+
+from synthetic_corpus import iter_posts
+
+# --- Benchmark Configuration ---
+DEFAULT_SIZES = [10000, 100000, 1000000]
+ALL_STAGES = ['preprocess', 'extract', 'gazetteer', 'normalize', 'aggregate', 'heavy_hitters', 'history', 'api']
+# Run only when asked for: they load the real BERT and spaCy models
+MODEL_STAGES = ['backends', 'gemini']
+# Trend history: three months of hourly normalize runs, queried HISTORY_QUERIES times
+HISTORY_SNAPSHOTS = 24 * 90
+HISTORY_QUERIES = 200
+# Heavy hitters: the corpus is split round-robin over this many "workers" whose
+# sketches are merged, and both are compared with exact counts at these K
+HH_WORKERS = 4
+HH_TOP_K = (10, 30, 100)
+# Real models are slow, so the backend comparison runs on a sample of the corpus
+BACKEND_SAMPLE = 2000
+BACKEND_BATCH_SIZE = 32
+# The Gemini stage runs against gemini_stub.py with this much simulated latency
+GEMINI_STUB_LATENCY = 0.2
+CHUNK_SIZE = 10000
+API_REPEATS = 20
+
+# Benchmarks must never touch the real databases, the shared NER cache or the
+# product catalog, so point them at a scratch directory before any pipeline
+# module is imported. Always overridden, never defaulted: bench_api empties the
+# posts table, so an exported REDDIT_POSTS_DB_URI must not leak in.
+SCRATCH_DIR = tempfile.mkdtemp(prefix='trend_bench_')
+SCRATCH_ENV = {
+    'REDDIT_POSTS_DB_URI': f"sqlite:///{os.path.join(SCRATCH_DIR, 'bench_posts.db')}",
+    'NER_CACHE_PATH': os.path.join(SCRATCH_DIR, 'bench_ner_cache.db'),
+    'PRODUCT_CATALOG_PATH': os.path.join(SCRATCH_DIR, 'bench_product_catalog.db'),
+    'TREND_HISTORY_PATH': os.path.join(SCRATCH_DIR, 'bench_trend_history.db'),
+}
+for name, value in SCRATCH_ENV.items():
+    if os.environ.get(name, value) != value:
+        print(f"Ignoring {name}={os.environ[name]}: benchmarks only use scratch data.", file=sys.stderr)
+    os.environ[name] = value
+
+# --- Stub NER model ---
+# Mimics BERT NER's wordpieces: model numbers are split into pieces, punctuation
+# is its own token and every word that is not a product is tagged O.
+STUB_BRANDS = {"iphone", "samsung", "galaxy", "pixel", "google", "oneplus", "redmi", "poco",
+               "nothing", "moto", "xiaomi", "vivo", "realme", "s21", "s22", "s23", "s24", "s25"}
+STUB_CONTINUATIONS = {"pro", "max", "plus", "ultra", "fe", "note", "nord", "ce", "edge", "phone", "gt"}
+WORD_RE = re.compile(r'\S+')
+PIECE_RE = re.compile(r'[A-Za-z]+|\d+|\S')
+
+
+def stub_tokens(text):
+    """(label, start, end) for every wordpiece of `text`, O tokens included."""
+    tokens = []
+    inside = False
+    for match in WORD_RE.finditer(text):
+        word = match.group().strip('?,.!:;()')
+        lowered = word.lower()
+        if lowered in STUB_BRANDS:
+            label, inside = 'B-MISC', True
+        elif inside and (lowered in STUB_CONTINUATIONS or any(ch.isdigit() for ch in lowered)):
+            label = 'I-MISC'
+        else:
+            label, inside = 'O', False
+        # Offsets point at the stripped word, as the real tokenizer's would
+        word_start = match.start() + match.group().index(word) if word else match.end()
+        word_end = word_start + len(word)
+        for piece in PIECE_RE.finditer(match.group()):
+            start, end = match.start() + piece.start(), match.start() + piece.end()
+            if word_start <= start and end <= word_end:
+                tokens.append((label if start == word_start or label == 'O' else 'I-MISC', start, end))
+            else:
+                tokens.append(('O', start, end))
+    return tokens
+
+
+# dslim/bert-base-NER's labels
+STUB_ID2LABEL = {0: 'O', 1: 'B-MISC', 2: 'I-MISC', 3: 'B-PER', 4: 'I-PER', 5: 'B-ORG', 6: 'I-ORG', 7: 'B-LOC', 8: 'I-LOC'}
+STUB_LABEL_IDS = {label: label_id for label_id, label in STUB_ID2LABEL.items()}
+
+
+def stub_model_output(texts):
+    """
+    Stand-in for one tokenizer + model pass over a batch: (logits, offsets), padded
+    like the real thing, with [CLS]/[SEP]/padding at offset (0, 0).
+    """
+    import numpy as np
+
+    token_lists = [stub_tokens(text) for text in texts]
+    width = max((len(tokens) for tokens in token_lists), default=0) + 2
+    logits = np.zeros((len(texts), width, len(STUB_ID2LABEL)), dtype=np.float32)
+    logits[:, :, 0] = 6.0
+    offsets = np.zeros((len(texts), width, 2), dtype=np.int64)
+    for i, tokens in enumerate(token_lists):
+        for j, (label, start, end) in enumerate(tokens, 1):
+            logits[i, j, 0] = 0.0
+            logits[i, j, STUB_LABEL_IDS[label]] = 6.0
+            offsets[i, j] = (start, end)
+    return logits, offsets
+
+
+def pipeline_token_dicts(text, logits, offsets):
+    """
+    What the HF "ner" pipeline (aggregation_strategy=None) did with one text's
+    model output: softmax, then a dict per token with its argmax label, O dropped.
+    """
+    import numpy as np
+
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    scores = np.exp(shifted) / np.exp(shifted).sum(axis=-1, keepdims=True)
+    tokens = []
+    for index, ((start, end), token_scores) in enumerate(zip(offsets.tolist(), scores)):
+        if start == end:
+            continue
+        label_id = int(token_scores.argmax())
+        token = {'entity': STUB_ID2LABEL[label_id], 'score': token_scores[label_id], 'index': index,
+                 'word': text[start:end], 'start': start, 'end': end}
+        if token['entity'] != 'O':
+            tokens.append(token)
+    return tokens
+
+
+def span_tagger_spans(texts, logits, offsets, kinds):
+    """SpanTagger's post-model half on the same output: argmax into label ids, then array grouping."""
+    import numpy as np
+    from ner_spans import spans_from_labels
+
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    probabilities = np.exp(shifted) / np.exp(shifted).sum(axis=-1, keepdims=True)
+    label_ids = probabilities.argmax(axis=-1)
+    scores = np.take_along_axis(probabilities, label_ids[..., None], axis=-1)[..., 0]
+    return spans_from_labels(texts, kinds[label_ids], scores, offsets)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# --- Stages ---
+# Each stage walks the corpus chunk by chunk and times only its own work.
+
+def bench_preprocess(size, seed):
+    from mobile_collect_data import clean_text, get_sentiment
+
+    def work(chunk):
+        for post in chunk:
+            get_sentiment(post['title'])
+            clean_text(post['title'])
+            clean_text(post['body'])
+
+    elapsed = 0.0
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        elapsed += _timed(work, chunk)[1]
+    return {'seconds': elapsed, 'items': size}
+
+
+def bench_extract(size, seed):
+    """
+    Everything between the model and the entity names, on stub model output
+    batched like extract_posts(): SpanTagger's label-id arrays (timed as the
+    stage) against the old pipeline's per-token dicts + aggregate_spans().
+    """
+    from ner_spans import aggregate_spans, label_kinds
+    from prefilter import ProductPrefilter
+    prefilter = ProductPrefilter.for_category('phone')
+    kinds = label_kinds(STUB_ID2LABEL)
+
+    def token_dict_path(batch, logits, offsets):
+        return [aggregate_spans(text, pipeline_token_dicts(text, text_logits, text_offsets))
+                for text, text_logits, text_offsets in zip(batch, logits, offsets)]
+
+    elapsed = dict_elapsed = 0.0
+    entities = 0
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        texts = [text for text in (f"{post['title']}. {post['body'] or ''}" for post in chunk)
+                 if prefilter.should_extract(text)]
+        for start in range(0, len(texts), BACKEND_BATCH_SIZE):
+            batch = texts[start:start + BACKEND_BATCH_SIZE]
+            logits, offsets = stub_model_output(batch)
+            found, seconds = _timed(span_tagger_spans, batch, logits, offsets, kinds)
+            elapsed += seconds
+            entities += sum(len(spans) for spans in found)
+            dict_elapsed += _timed(token_dict_path, batch, logits, offsets)[1]
+    return {'seconds': elapsed, 'items': size, 'entities': entities,
+            'token_dict_seconds': round(dict_elapsed, 4),
+            'speedup_vs_token_dicts': round(dict_elapsed / max(elapsed, 1e-9), 2),
+            'prefilter_skip_ratio': round(prefilter.skip_ratio, 4)}
+
+
+def bench_gazetteer(size, seed):
+    from gazetteer import Gazetteer
+    gazetteer = Gazetteer.for_category('phone')
+
+    def work(chunk):
+        return sum(len(gazetteer.extract(f"{post['title']} {post['body']}")) for post in chunk)
+
+    elapsed, entities = 0.0, 0
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        found, seconds = _timed(work, chunk)
+        elapsed += seconds
+        entities += found
+    return {'seconds': elapsed, 'items': size, 'entities': entities}
+
+
+def bench_normalize(size, seed):
+    from normalize_trends import normalize_phone_list
+
+    elapsed, mentions = 0.0, 0
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        raw = [post['mentions'] for post in chunk]
+        mentions += sum(len(m) for m in raw)
+        elapsed += _timed(lambda lists: [normalize_phone_list(m) for m in lists], raw)[1]
+    return {'seconds': elapsed, 'items': size, 'mentions': mentions}
+
+
+def bench_aggregate(size, seed):
+    from normalize_trends import normalize_phone_list
+
+    def work(normalized, counts):
+        for names in normalized:
+            counts.update(names)
+
+    counts = Counter()
+    elapsed = 0.0
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        normalized = [normalize_phone_list(post['mentions']) for post in chunk]
+        elapsed += _timed(work, normalized, counts)[1]
+    top = _timed(counts.most_common, 30)[1]
+    return {'seconds': elapsed + top, 'items': size, 'distinct_products': len(counts)}
+
+
+def _topk_accuracy(summary, exact, k):
+    truth = {name for name, _ in exact.most_common(k)}
+    found = summary.top(k)
+    errors = [(count - exact[name]) / exact[name] for name, count in found]
+    return {'recall': round(len({name for name, _ in found} & truth) / k, 4),
+            'mean_relative_error': round(statistics.mean(errors), 5) if errors else None,
+            'max_relative_error': round(max(errors), 5) if errors else None}
+
+
+def bench_heavy_hitters(size, seed):
+    import random
+    import string
+    from normalize_trends import normalize_phone_list
+    from heavy_hitters import HeavyHitters
+
+    rng = random.Random(seed)
+    exact = Counter()
+    single = HeavyHitters()
+    workers = [HeavyHitters() for _ in range(HH_WORKERS)]
+
+    def work(lists):
+        for names in lists:
+            single.update(names)
+
+    elapsed = 0.0
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        # One junk mention per post stands in for the long tail the .title() fallback lets through
+        normalized = [normalize_phone_list(post['mentions'] + [''.join(rng.choices(string.ascii_lowercase, k=7))])
+                      for post in chunk]
+        elapsed += _timed(work, normalized)[1]
+        for i, names in enumerate(normalized):
+            exact.update(names)
+            workers[i % HH_WORKERS].update(names)
+    merged = workers[0]
+    merge_seconds = _timed(lambda: [merged.merge(worker) for worker in workers[1:]])[1]
+    counter_bytes = sys.getsizeof(exact) + sum(sys.getsizeof(name) + sys.getsizeof(count) for name, count in exact.items())
+    return {'seconds': elapsed, 'items': size, 'mentions': sum(exact.values()), 'distinct': len(exact),
+            'sketch_bytes': single.nbytes, 'counter_bytes': counter_bytes, 'merge_seconds': round(merge_seconds, 4),
+            'accuracy': {label: {f"top{k}": _topk_accuracy(summary, exact, k) for k in HH_TOP_K}
+                         for label, summary in (('single', single), (f"merged_{HH_WORKERS}", merged))}}
+
+
+def bench_history(size, seed):
+    import random
+    from normalize_trends import normalize_phone_list
+    from trend_history import TrendHistory
+
+    counts = Counter()
+    for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+        for post in chunk:
+            counts.update(normalize_phone_list(post['mentions']))
+    rng = random.Random(seed)
+    store = TrendHistory()
+    start_time = time.time() - HISTORY_SNAPSHOTS * 3600
+
+    def write():
+        for hour in range(HISTORY_SNAPSHOTS):
+            # Each run's counts drift a little, so ranks move between snapshots
+            jittered = Counter({name: max(1, int(count * rng.uniform(0.8, 1.2))) for name, count in counts.items()})
+            store.record('phone', jittered, taken_at=start_time + hour * 3600)
+
+    write_seconds = _timed(write)[1]
+    products = [name for name, _ in counts.most_common(50)]
+    history_samples, change_samples = [], []
+    for i in range(HISTORY_QUERIES):
+        start = time.perf_counter()
+        points = store.history('phone', products[i % len(products)])
+        history_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        store.rank_changes('phone', start_time + rng.uniform(0, HISTORY_SNAPSHOTS) * 3600)
+        change_samples.append(time.perf_counter() - start)
+    store.close()
+    return {'seconds': sum(history_samples) + sum(change_samples), 'items': 2 * HISTORY_QUERIES,
+            'snapshots': HISTORY_SNAPSHOTS, 'points_per_product': len(points['taken_at']),
+            'write_seconds': round(write_seconds, 3),
+            'db_bytes': os.path.getsize(store.path),
+            'history': _latency_summary(history_samples), 'rank_changes': _latency_summary(change_samples)}
+
+
+def bench_backends(size, seed):
+    """
+    Throughput of the real NER backends through the same extract_posts() path the
+    worker uses (prefilter, NER, grouping, mention sentiment), on the same posts.
+    """
+    from types import SimpleNamespace
+    from categories import extractor_module
+
+    sample = []
+    for chunk in iter_posts(min(size, BACKEND_SAMPLE), seed, chunk_size=CHUNK_SIZE):
+        sample.extend(SimpleNamespace(title=post['title'], body=post['body'], cleaned_title=None,
+                                      cleaned_body=None) for post in chunk)
+
+    backends = {}
+    for backend in ('bert', 'spacy'):
+        extractor = extractor_module('phone', backend)
+        extractor.load_ner_pipeline()
+        # Each backend caches under its own model id in the scratch NER cache, so both start cold
+        elapsed, entities = 0.0, 0
+        for start in range(0, len(sample), BACKEND_BATCH_SIZE):
+            results, seconds = _timed(extractor.extract_posts, sample[start:start + BACKEND_BATCH_SIZE])
+            elapsed += seconds
+            entities += sum(len(found) for found in results)
+        backends[backend] = {'seconds': round(elapsed, 4), 'entities': entities,
+                             'posts_per_sec': round(len(sample) / max(elapsed, 1e-9), 1)}
+    return {'seconds': sum(b['seconds'] for b in backends.values()), 'items': 2 * len(sample),
+            'sample': len(sample), 'backends': backends}
+
+
+def bench_gemini(size, seed):
+    """
+    Gemini extraction against the local stub: one post per request versus packed
+    prompts, reported per 1,000 posts (requests, tokens, wall-clock seconds).
+    """
+    from Gemini import GeminiClient, POSTS_PER_PROMPT
+    from gemini_stub import start_stub
+
+    texts = []
+    for chunk in iter_posts(min(size, BACKEND_SAMPLE), seed, chunk_size=CHUNK_SIZE):
+        texts.extend(f"{post['title']}. {post['body'] or ''}" for post in chunk)
+    server, url = start_stub(latency=GEMINI_STUB_LATENCY)
+    runs = {}
+    try:
+        for posts_per_prompt in (1, POSTS_PER_PROMPT):
+            # No cache and no rate limit: this measures the batching alone
+            client = GeminiClient('phone', base_url=url, posts_per_prompt=posts_per_prompt, requests_per_minute=0)
+            results, seconds = _timed(client.extract_many, texts)
+            per_1k = 1000 / len(texts)
+            runs[f"{posts_per_prompt}_per_prompt"] = {
+                'seconds': round(seconds, 4),
+                'requests_per_1k_posts': round(client.requests * per_1k, 1),
+                'tokens_per_1k_posts': round((client.prompt_tokens + client.output_tokens) * per_1k),
+                'seconds_per_1k_posts': round(seconds * per_1k, 3),
+                'failed_posts': sum(names is None for names in results),
+            }
+    finally:
+        server.shutdown()
+    return {'seconds': sum(run['seconds'] for run in runs.values()), 'items': 2 * len(texts),
+            'sample': len(texts), 'stub_latency': GEMINI_STUB_LATENCY, 'runs': runs}
+
+
+def _latency_summary(samples):
+    ordered = sorted(samples)
+    return {
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+
+def bench_api(size, seed):
+    from app import app, db, RedditPost
+
+    with app.app_context():
+        db.session.query(RedditPost).delete()
+        db.session.commit()
+        load_start = time.perf_counter()
+        offset = 0
+        for chunk in iter_posts(size, seed, chunk_size=CHUNK_SIZE):
+            # Prefix ids with a running index: random 7-char ids can collide at 1M posts
+            rows = [{
+                'id': f"{i}_{post['id']}", 'subreddit': post['subreddit'], 'title': post['title'],
+                'score': post['score'], 'url': post['url'], 'num_comments': post['num_comments'],
+                'body': post['body'], 'created': post['created'], 'sentiment_label': 'positive',
+                'sentiment_compound': 0.0, 'extracted_phones': json.dumps(post['mentions']),
+            } for i, post in enumerate(chunk, start=offset)]
+            offset += len(rows)
+            db.session.execute(RedditPost.__table__.insert(), rows)
+            db.session.commit()
+        load_seconds = time.perf_counter() - load_start
+
+    client = app.test_client()
+    endpoints = {}
+    total_seconds = 0.0
+    for path in ('/api/trends', '/api/reddit-posts'):
+        client.get(path)  # warm-up
+        samples = []
+        for _ in range(API_REPEATS):
+            start = time.perf_counter()
+            response = client.get(path)
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, f"{path} returned {response.status_code}"
+        endpoints[path] = _latency_summary(samples)
+        total_seconds += sum(samples)
+    return {'seconds': total_seconds, 'items': API_REPEATS * len(endpoints),
+            'db_load_seconds': round(load_seconds, 3), 'endpoints': endpoints}
+
+
+STAGE_FUNCTIONS = {
+    'preprocess': bench_preprocess,
+    'extract': bench_extract,
+    'gazetteer': bench_gazetteer,
+    'normalize': bench_normalize,
+    'aggregate': bench_aggregate,
+    'heavy_hitters': bench_heavy_hitters,
+    'history': bench_history,
+    'api': bench_api,
+    'backends': bench_backends,
+    'gemini': bench_gemini,
+}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, stages, seed):
+    results = []
+    for size in sizes:
+        for stage in stages:
+            print(f"Running {stage:<10} on {size:>9,} posts...", end=' ', flush=True)
+            result = STAGE_FUNCTIONS[stage](size, seed)
+            result.update({'stage': stage, 'size': size,
+                           'items_per_sec': round(result['items'] / max(result['seconds'], 1e-9), 1)})
+            result['seconds'] = round(result['seconds'], 4)
+            print(f"{result['seconds']:.3f}s ({result['items_per_sec']:,.0f}/s)")
+            results.append(result)
+    return {
+        'meta': {
+            'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+            'seed': seed,
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic Reddit corpus.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs='+', default=ALL_STAGES, choices=ALL_STAGES + MODEL_STAGES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    report = run_benchmarks(args.sizes, args.stages, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nWrote {len(report['results'])} results to {args.output}")
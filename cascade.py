@@ -0,0 +1,76 @@
+import os
+import re
+
+from categories import vocabulary
+from entity_resolution import get_resolver
+
+# --- Cascade Configuration ---
+# Posts with an entity BERT is less sure of than this go to the LLM
+CASCADE_MIN_CONFIDENCE = float(os.environ.get('CASCADE_MIN_CONFIDENCE', 0.80))
+
+
+class Normalizability:
+    """
+    Whether a mention ends up as a known product: a generic brand or noise term
+    (dropped on purpose), a PATTERN_MAP match, or a catalog alias. Anything else
+    only survives normalization as a title-cased guess.
+    """
+
+    def __init__(self, category):
+        generic_brands, noisy_terms, pattern_map = vocabulary(category)
+        self.known_noise = set(generic_brands) | set(noisy_terms)
+        self.patterns = [re.compile(pattern) for pattern in pattern_map]
+        self.resolver = get_resolver(category)
+        self._memo = {}
+
+    def __call__(self, name):
+        clean_name = name.lower().strip()
+        if clean_name not in self._memo:
+            self._memo[clean_name] = (
+                clean_name in self.known_noise
+                or any(pattern.fullmatch(clean_name) for pattern in self.patterns)
+                or self.resolver.resolve(name) is not None
+            )
+        return self._memo[clean_name]
+
+
+class CascadeExtractor:
+    """
+    NER_BACKEND=cascade: BERT extracts every post; only posts with a
+    low-confidence or unnormalizable entity are re-extracted by the Gemini
+    backend, batched into its prompts, and take its answer instead.
+    """
+
+    def __init__(self, category, module, llm=None, min_confidence=CASCADE_MIN_CONFIDENCE):
+        self.category = category
+        self.module = module
+        self.min_confidence = min_confidence
+        self.normalizable = Normalizability(category)
+        if llm is None:
+            from Gemini import GeminiExtractor
+            llm = GeminiExtractor(category, module)
+        self.llm = llm
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def load_ner_pipeline(self):
+        return self.module.load_ner_pipeline()
+
+    def needs_llm(self, names, confidences):
+        return any(confidences.get(name.strip(), 1.0) < self.min_confidence or not self.normalizable(name)
+                   for name in names)
+
+    def extract_posts(self, posts):
+        registry = self.module.registry
+        results, confidences = self.module.extract_posts(posts, with_confidence=True)
+        hard = [i for i, (names, scores) in enumerate(zip(results, confidences)) if self.needs_llm(names, scores)]
+        registry.inc('cascade_posts_total', len(posts), category=self.category)
+        if hard:
+            registry.inc('cascade_escalated_posts_total', len(hard), category=self.category)
+            # The LLM backend also rewrites mention_sentiment for these posts
+            with registry.time_stage('cascade_llm', items=len(hard), category=self.category):
+                answers = self.llm.extract_posts([posts[i] for i in hard])
+            for i, names in zip(hard, answers):
+                results[i] = names
+        return results
@@ -0,0 +1,97 @@
+import os
+import importlib
+
+# --- Category Registry ---
+# Maps each product category to the scripts that collect, extract and normalize it.
+# Modules are imported lazily because most of them load models or DBs on import.
+CATEGORIES = {
+    'phone': {
+        'collect_module': 'mobile_collect_data',
+        'normalize_module': 'normalize_trends',
+        'normalize_fn': 'normalize_phone_list',
+        'bert_module': 'Bert',
+        'extract_fn': 'extract_full_phone_names',
+        'app': 'app',
+        'db': 'db',
+        'extracted_column': 'extracted_phones',
+    },
+    'laptop': {
+        'collect_module': 'laptop_collect_data',
+        'normalize_module': 'laptop_normalize_trends',
+        'normalize_fn': 'normalize_laptop_list',
+        'bert_module': 'laptop_bert',
+        'extract_fn': 'extract_full_laptop_names',
+        'app': 'laptop_app',
+        'db': 'laptop_db',
+        'extracted_column': 'extracted_laptops',
+    },
+    'tablet': {
+        'collect_module': 'tablet_collect_data',
+        'normalize_module': 'tablet_normalize_trends',
+        'normalize_fn': 'normalize_tablet_list',
+        'bert_module': 'tablet_bert',
+        'extract_fn': 'extract_full_tablet_names',
+        'app': 'tablet_app',
+        'db': 'tablet_db',
+        'extracted_column': 'extracted_tablets',
+    },
+}
+
+
+def get_category(name):
+    if name not in CATEGORIES:
+        raise ValueError(f"Unknown category '{name}'. Expected one of: {', '.join(CATEGORIES)}")
+    return CATEGORIES[name]
+
+
+def collect_module(name):
+    """Imports the *_collect_data module (target_subreddits, clean_text, get_sentiment) for a category."""
+    return importlib.import_module(get_category(name)['collect_module'])
+
+
+def bert_module(name):
+    """Imports the *_bert.py extractor (RedditPost model, app/db, extract_posts) for a category."""
+    return importlib.import_module(get_category(name)['bert_module'])
+
+
+# NER_BACKEND=spacy swaps the BERT model for spaCy's en_core_web_sm (see spacy_extractor.py),
+# NER_BACKEND=gemini for batched Gemini calls with BERT as the fallback (see Gemini.py),
+# NER_BACKEND=cascade for BERT with Gemini only on low-confidence posts (see cascade.py)
+NER_BACKENDS = ('bert', 'spacy', 'gemini', 'cascade')
+NER_BACKEND = os.environ.get('NER_BACKEND', 'bert')
+
+
+def extractor_module(name, backend=None):
+    """
+    The extractor the worker and streaming pipeline call extract_posts() on: the
+    category's *_bert.py module, or the spaCy/Gemini/cascade backend wrapping it.
+    """
+    backend = backend or NER_BACKEND
+    if backend not in NER_BACKENDS:
+        raise ValueError(f"Unknown NER backend '{backend}'. Expected one of: {', '.join(NER_BACKENDS)}")
+    module = bert_module(name)
+    if backend == 'spacy':
+        from spacy_extractor import SpacyExtractor
+        return SpacyExtractor(name, module)
+    if backend == 'gemini':
+        from Gemini import GeminiExtractor
+        return GeminiExtractor(name, module)
+    if backend == 'cascade':
+        from cascade import CascadeExtractor
+        return CascadeExtractor(name, module)
+    return module
+
+
+def normalize_module(name):
+    """Imports the *_normalize_trends module (vocabulary, normalizer, DB model) for a category."""
+    return importlib.import_module(get_category(name)['normalize_module'])
+
+
+def vocabulary(name):
+    """Returns (GENERIC_BRANDS, NOISY_TERMS, PATTERN_MAP) for a category."""
+    module = normalize_module(name)
+    return module.GENERIC_BRANDS, module.NOISY_TERMS, module.PATTERN_MAP
+
+
+def normalizer(name):
+    return getattr(normalize_module(name), get_category(name)['normalize_fn'])
@@ -4,12 +4,9 @@ import './Navbar.css';
 
 const Navbar = () => {
   const categories = [
-    { name: 'Electronics', path: '/category/electronics' },
-    { name: 'Services', path: '/category/services' },
-    { name: 'Tools', path: '/category/tools' },
-    { name: 'Software', path: '/category/software' },
-    { name: 'Components', path: '/category/components' },
-    { name: 'Development', path: '/category/development' }
+    { name: 'Phones', path: '/category/phone' },
+    { name: 'Laptops', path: '/category/laptop' },
+    { name: 'Tablets', path: '/category/tablet' }
   ];
 
   return (
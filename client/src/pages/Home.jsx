@@ -4,12 +4,9 @@ import './Home.css';
 
 const Home = () => {
   const categories = [
-    { name: 'Electronics', path: '/category/electronics', icon: '📱' },
-    { name: 'Services', path: '/category/services', icon: '🛠️' },
-    { name: 'Tools', path: '/category/tools', icon: '🔧' },
-    { name: 'Software', path: '/category/software', icon: '💻' },
-    { name: 'Components', path: '/category/components', icon: '🧩' },
-    { name: 'Development', path: '/category/development', icon: '⚙️' }
+    { name: 'Phones', path: '/category/phone', icon: '📱' },
+    { name: 'Laptops', path: '/category/laptop', icon: '💻' },
+    { name: 'Tablets', path: '/category/tablet', icon: '📲' }
   ];
 
   // Items for animation
@@ -4,4 +4,8 @@ import react from '@vitejs/plugin-react'
 // https://vite.dev/config/
 export default defineConfig({
   plugins: [react()],
+  server: {
+    // Flask dev server (python app.py); serve.py listens on 8000
+    proxy: { '/api': 'http://127.0.0.1:5000' },
+  },
 })
@@ -0,0 +1,401 @@
+import io
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from itertools import combinations
+
+import numpy as np
+import scipy.sparse as sp
+
+from categories import CATEGORIES, get_category, collect_module, normalizer
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+
+# --- Co-mention Graph Configuration ---
+# Matrices and the per-post ledger live in one SQLite file so a save is a single transaction
+GRAPH_PATH = os.environ.get('CO_MENTION_PATH', 'co_mention.db')
+# Time slices for "gaining share" queries; older weeks only remain in the total matrix
+BUCKET_DAYS = 7
+MAX_BUCKETS = 52
+# Pairs seen fewer times than this are ignored by the queries
+MIN_SUPPORT = 3
+LEDGER_CHUNK = 500
+
+
+def _to_blob(matrix):
+    buffer = io.BytesIO()
+    sp.save_npz(buffer, matrix.tocsr(), compressed=True)
+    return buffer.getvalue()
+
+
+def _from_blob(blob):
+    return sp.load_npz(io.BytesIO(blob)).tocsr()
+
+
+def _bucket(created):
+    return int(created.timestamp() // (BUCKET_DAYS * 86400))
+
+
+class CoMentionGraph:
+    """
+    Product x product co-mention counts for one category, kept as scipy.sparse
+    CSR matrices: one for all time plus one per week. New posts are buffered and
+    folded in on save() as COO deltas. A ledger of what each post contributed
+    makes updates idempotent: re-extracting a post replaces its old pairs
+    instead of counting them twice.
+    """
+
+    def __init__(self, category, path=GRAPH_PATH):
+        self.category = category
+        self.normalize = normalizer(category)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS co_mention_matrix ("
+            " category TEXT NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (category, name))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS co_mention_post ("
+            " category TEXT NOT NULL, post_id TEXT NOT NULL, products TEXT NOT NULL, bucket INTEGER NOT NULL,"
+            " PRIMARY KEY (category, post_id))"
+        )
+        self._load()
+
+    # --- Storage ---
+
+    def _load(self):
+        self._read_state()
+        self._pending = {'total': ([], [], [])}
+        self._pending_mentions = {}
+        # post_id -> (products, bucket) not saved yet; only the newest update per post counts
+        self._ledger_updates = {}
+
+    def _read_state(self):
+        rows = dict(self._conn.execute(
+            "SELECT name, data FROM co_mention_matrix WHERE category = ?", (self.category,)
+        ).fetchall())
+        # Bumped by every save(), so a writer can tell whether another process saved since it loaded
+        self.version = int(rows.pop('version', b'0'))
+        meta = json.loads(rows.pop('meta')) if 'meta' in rows else {'products': []}
+        self.products = meta['products']
+        self.index = {name: i for i, name in enumerate(self.products)}
+        size = len(self.products)
+        self.total = _from_blob(rows.pop('total')) if 'total' in rows else sp.csr_matrix((size, size), dtype=np.int32)
+        # Posts mentioning each product; the matrices only hold pair counts
+        self.mentions = np.frombuffer(rows.pop('mentions'), dtype=np.int64).copy() if 'mentions' in rows \
+            else np.zeros(size, dtype=np.int64)
+        self.buckets = {int(name.split(':', 1)[1]): _from_blob(blob) for name, blob in rows.items()
+                        if name.startswith('bucket:')}
+
+    def _stored_ledger(self, post_ids):
+        """{post_id: (products, bucket)} as last saved, for the given posts."""
+        stored = {}
+        for start in range(0, len(post_ids), LEDGER_CHUNK):
+            chunk = post_ids[start:start + LEDGER_CHUNK]
+            stored.update((post_id, (json.loads(products), bucket)) for post_id, products, bucket in
+                          self._conn.execute(
+                              "SELECT post_id, products, bucket FROM co_mention_post WHERE category = ? "
+                              f"AND post_id IN ({', '.join('?' for _ in chunk)})",
+                              [self.category, *chunk]).fetchall())
+        return stored
+
+    def save(self):
+        """
+        Applies the buffered post updates and persists matrices + ledger in one
+        transaction. The extraction worker and `rebuild` both write this file:
+        inside the write lock the stored version is checked, the matrices are
+        re-read if another process saved meanwhile, and each post's delta is
+        computed against the ledger as stored right now, so neither writer's
+        counts are lost or applied twice.
+        """
+        with self._lock:
+            if not self._ledger_updates:
+                return 0
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = self._conn.execute(
+                    "SELECT data FROM co_mention_matrix WHERE category = ? AND name = 'version'", (self.category,)
+                ).fetchone()
+                if self.version is None or int(stored[0] if stored else b'0') != self.version:
+                    self._read_state()
+                previous = self._stored_ledger(list(self._ledger_updates))
+                self._pending = {'total': ([], [], [])}
+                self._pending_mentions = {}
+                ledger_rows = []
+                for post_id, (products, bucket) in self._ledger_updates.items():
+                    old = previous.get(post_id)
+                    if old == (products, bucket):
+                        continue
+                    if old is not None:
+                        # A pruned week's pairs only remain in the total; backing them out of the
+                        # week would recreate it with negative counts
+                        self._add(old[0], old[1] if self._retained(old[1]) else None, -1)
+                    self._add(products, bucket, 1)
+                    ledger_rows.append((self.category, post_id, json.dumps(products), bucket))
+                if ledger_rows:
+                    self._write(self._fold(), ledger_rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # The in-memory matrices may hold deltas that never reached the file: re-read on the next save
+                self.version = None
+                raise
+            if ledger_rows:
+                self.version += 1
+            self._pending = {'total': ([], [], [])}
+            self._pending_mentions = {}
+            self._ledger_updates = {}
+            return len(ledger_rows)
+
+    def _fold(self):
+        """Folds the buffered COO deltas into the matrices; returns the matrix keys to write."""
+        size = len(self.products)
+        changed = set()
+        for key, (rows, cols, data) in self._pending.items():
+            if not rows:
+                continue
+            delta = sp.coo_matrix((data, (rows, cols)), shape=(size, size), dtype=np.int32).tocsr()
+            if key == 'total':
+                self.total = self._resized(self.total, size) + delta
+                # Backed-out posts can leave explicit zeros behind
+                self.total.eliminate_zeros()
+            else:
+                base = self.buckets.get(key)
+                self.buckets[key] = delta if base is None else self._resized(base, size) + delta
+                self.buckets[key].eliminate_zeros()
+            changed.add(key)
+        mentions = np.zeros(size, dtype=np.int64)
+        mentions[:len(self.mentions)] = self.mentions
+        for i, delta in self._pending_mentions.items():
+            mentions[i] += delta
+        self.mentions = mentions
+        # Keep only the newest MAX_BUCKETS weeks of time slices
+        for old in sorted(self.buckets)[:-MAX_BUCKETS]:
+            del self.buckets[old]
+            changed.discard(old)
+            changed.add(('drop', old))
+        return changed
+
+    def _write(self, changed, ledger_rows):
+        upserts = [('meta', json.dumps({'products': self.products}).encode()),
+                   ('mentions', self.mentions.tobytes()),
+                   ('version', str(self.version + 1).encode())]
+        for key in changed:
+            if key == 'total':
+                upserts.append(('total', _to_blob(self.total)))
+            elif isinstance(key, tuple):
+                self._conn.execute("DELETE FROM co_mention_matrix WHERE category = ? AND name = ?",
+                                   (self.category, f"bucket:{key[1]}"))
+            else:
+                upserts.append((f"bucket:{key}", _to_blob(self.buckets[key])))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO co_mention_matrix (category, name, data) VALUES (?, ?, ?)",
+            [(self.category, name, blob) for name, blob in upserts],
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO co_mention_post (category, post_id, products, bucket) VALUES (?, ?, ?, ?)",
+            ledger_rows,
+        )
+
+    @staticmethod
+    def _resized(matrix, size):
+        if matrix.shape[0] == size:
+            return matrix
+        matrix = matrix.tocsr(copy=True)
+        matrix.resize((size, size))
+        return matrix
+
+    # --- Updates ---
+
+    def _product_id(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.products)
+            self.products.append(name)
+        return i
+
+    def _retained(self, bucket):
+        """False for a week save() has already pruned (older than the newest MAX_BUCKETS)."""
+        if bucket in self.buckets or bucket in self._pending or len(self.buckets) < MAX_BUCKETS:
+            return True
+        return bucket > min(self.buckets)
+
+    def _add(self, products, bucket, sign):
+        """Buffers a post's pairs for the total and its week's matrix; bucket None skips the week."""
+        ids = sorted({self._product_id(name) for name in products})
+        for i in ids:
+            self._pending_mentions[i] = self._pending_mentions.get(i, 0) + sign
+        for key in ('total', bucket) if bucket is not None else ('total',):
+            rows, cols, data = self._pending.setdefault(key, ([], [], []))
+            for a, b in combinations(ids, 2):
+                rows.extend((a, b))
+                cols.extend((b, a))
+                data.extend((sign, sign))
+
+    def update_many(self, items):
+        """
+        Records (post_id, raw_mentions, created) for freshly extracted posts or
+        comments. Mentions are normalized first; posts whose products and week
+        are unchanged are skipped. The counts move on save(), which backs out
+        each post's previous contribution, if any.
+        """
+        items = list(items)
+        with self._lock:
+            previous = self._stored_ledger([post_id for post_id, _, _ in items])
+            # Not-yet-saved updates win over what is on disk
+            previous.update((post_id, self._ledger_updates[post_id])
+                            for post_id, _, _ in items if post_id in self._ledger_updates)
+
+            changed = 0
+            for post_id, raw_mentions, created in items:
+                products = sorted(set(self.normalize(raw_mentions)))
+                bucket = _bucket(created)
+                if previous.get(post_id) == (products, bucket):
+                    continue
+                self._ledger_updates[post_id] = previous[post_id] = (products, bucket)
+                changed += 1
+            return changed
+
+    # --- Queries ---
+
+    def _row(self, matrix, i):
+        if matrix is None or i >= matrix.shape[0]:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+
+    def alternatives(self, product, k=10, min_support=MIN_SUPPORT):
+        """Products most often mentioned alongside `product`, with their share of its co-mentions and lift."""
+        i = self.index.get(product)
+        if i is None:
+            return []
+        cols, counts = self._row(self.total, i)
+        keep = counts >= min_support
+        cols, counts = cols[keep], counts[keep]
+        if not len(cols):
+            return []
+        order = np.argsort(-counts, kind='stable')[:k]
+        row_total = counts.sum()
+        posts = max(int(self.mentions.sum()), 1)
+        results = []
+        for j in order:
+            other = cols[j]
+            expected = self.mentions[i] * self.mentions[other] / posts
+            results.append({
+                'name': self.products[other],
+                'co_mentions': int(counts[j]),
+                'share': round(float(counts[j] / row_total), 4),
+                'lift': round(float(counts[j] / expected), 2) if expected else None,
+            })
+        return results
+
+    def gaining_share(self, product, recent_weeks=4, baseline_weeks=8, k=10, min_support=MIN_SUPPORT):
+        """
+        Competitors whose share of `product`'s co-mentions grew most in the last
+        `recent_weeks` compared with the `baseline_weeks` before them.
+        """
+        i = self.index.get(product)
+        if i is None or not self.buckets:
+            return []
+        newest = max(self.buckets)
+        size = len(self.products)
+
+        def window_counts(first, last):
+            counts = np.zeros(size, dtype=np.int64)
+            for bucket in range(first, last + 1):
+                cols, data = self._row(self.buckets.get(bucket), i)
+                counts[cols] += data
+            return counts
+
+        recent = window_counts(newest - recent_weeks + 1, newest)
+        baseline = window_counts(newest - recent_weeks - baseline_weeks + 1, newest - recent_weeks)
+        recent_share = recent / max(recent.sum(), 1)
+        baseline_share = baseline / max(baseline.sum(), 1)
+        delta = recent_share - baseline_share
+        candidates = np.flatnonzero((recent + baseline >= min_support) & (delta > 0))
+        order = candidates[np.argsort(-delta[candidates], kind='stable')][:k]
+        return [{
+            'name': self.products[j],
+            'recent_share': round(float(recent_share[j]), 4),
+            'baseline_share': round(float(baseline_share[j]), 4),
+            'change': round(float(delta[j]), 4),
+            'recent_co_mentions': int(recent[j]),
+        } for j in order]
+
+    def close(self):
+        self._conn.close()
+
+
+def rebuild(category, registry=None):
+    """Feeds every extracted post and comment of a category through update_many() and saves."""
+    cfg = get_category(category)
+    collector = collect_module(category)
+    column = cfg['extracted_column']
+    registry = registry or MetricsRegistry(f"{category}_co_mention")
+    graph = CoMentionGraph(category)
+
+    batch_items = []
+    updated = 0
+
+    def flush():
+        nonlocal updated, batch_items
+        with registry.time_stage('co_mention_update', items=len(batch_items), category=category):
+            updated += graph.update_many(batch_items)
+        batch_items = []
+
+    with getattr(collector, cfg['app']).app_context():
+        # Comments use the same "t1_" ids as their extraction jobs (see comment_ingest.py)
+        for model, prefix in ((collector.RedditPost, ''), (collector.RedditComment, 't1_')):
+            extracted = getattr(model, column)
+            query = model.query.with_entities(model.id, extracted, model.created).filter(extracted.isnot(None))
+            for post_id, raw, created in query.yield_per(5000):
+                try:
+                    batch_items.append((prefix + post_id, json.loads(raw), created))
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                if len(batch_items) >= 5000:
+                    flush()
+    flush()
+    with registry.time_stage('co_mention_save', category=category):
+        graph.save()
+    print(f"Co-mention graph for {category}: {len(graph.products)} products, "
+          f"{graph.total.nnz // 2} product pairs, {updated} posts updated.")
+    return graph
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sparse product co-mention graph.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = sub.add_parser('rebuild', help="(Re)count every extracted post; only changed posts are re-applied.")
+    rebuild_parser.add_argument('--categories', nargs='+', default=list(CATEGORIES), choices=list(CATEGORIES))
+    for name in ('alternatives', 'gaining'):
+        query_parser = sub.add_parser(name)
+        query_parser.add_argument('product', help="Canonical product name, e.g. \"Google Pixel 8\"")
+        query_parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+        query_parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    if args.command == 'rebuild':
+        registry = MetricsRegistry('co_mention_rebuild')
+        for category in args.categories:
+            rebuild(category, registry)
+        registry.dump()
+        log_stage_summary(registry)
+    else:
+        start = time.perf_counter()
+        graph = CoMentionGraph(args.category)
+        loaded = time.perf_counter()
+        query = graph.alternatives if args.command == 'alternatives' else graph.gaining_share
+        results = query(args.product, k=args.k)
+        elapsed_ms = (time.perf_counter() - loaded) * 1000
+        if not results:
+            print(f"No co-mention data for '{args.product}'.")
+        for rank, result in enumerate(results, 1):
+            details = ', '.join(f"{key} {value}" for key, value in result.items() if key != 'name')
+            print(f"{rank:>2}. {result['name']:<32} {details}")
+        print(f"Loaded graph in {(loaded - start) * 1000:.1f} ms, query took {elapsed_ms:.2f} ms")
@@ -0,0 +1,159 @@
+import os
+import sys
+import argparse
+import threading
+import datetime as dt
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from praw.models import MoreComments
+
+from categories import CATEGORIES, get_category, collect_module
+from job_queue import JobQueue
+from pipeline_metrics import MetricsRegistry, log_event, log_stage_summary
+
+# --- Comment Ingestion Configuration ---
+# COLLECT_COMMENTS=1 makes the collectors pull comments for every new submission
+COLLECT_COMMENTS = os.environ.get('COLLECT_COMMENTS', '0') == '1'
+# Submissions whose comment trees are fetched at the same time
+COMMENT_WORKERS = int(os.environ.get('COMMENT_WORKERS', 4))
+# Comments kept per submission, highest-voted first (top-level before replies)
+TOP_K_COMMENTS = 20
+MAX_DEPTH = 2
+# Each "load more comments" expansion is an extra API call, so keep this small
+REPLACE_MORE_LIMIT = 2
+# Comment rows are committed after this many submissions have been fetched
+COMMIT_EVERY = 50
+# Comment jobs use Reddit's "t1_" fullname prefix so the worker can tell them from posts
+COMMENT_JOB_PREFIX = 't1_'
+
+_thread_state = threading.local()
+
+
+def _thread_client(collector):
+    # PRAW clients are not thread-safe, so every fetch thread gets its own
+    if getattr(_thread_state, 'reddit', None) is None:
+        _thread_state.reddit = collector.get_reddit_client()
+    return _thread_state.reddit
+
+
+def fetch_comments(reddit, post_id, top_k=TOP_K_COMMENTS, max_depth=MAX_DEPTH,
+                   replace_more_limit=REPLACE_MORE_LIMIT):
+    """
+    Returns up to `top_k` comments of one submission as plain dicts, walking the
+    tree breadth-first in "top" order so top-level comments come first.
+    """
+    submission = reddit.submission(id=post_id)
+    submission.comment_sort = 'top'
+    submission.comment_limit = top_k
+    submission.comments.replace_more(limit=replace_more_limit)
+
+    comments = []
+    pending = deque((comment, 0) for comment in submission.comments)
+    while pending and len(comments) < top_k:
+        comment, depth = pending.popleft()
+        if isinstance(comment, MoreComments):
+            continue
+        if comment.body not in ('[deleted]', '[removed]'):
+            comments.append({
+                'id': comment.id, 'post_id': post_id, 'parent_id': comment.parent_id,
+                'depth': depth, 'body': comment.body, 'score': comment.score,
+                'created': dt.datetime.fromtimestamp(comment.created_utc),
+            })
+        if depth < max_depth:
+            pending.extend((reply, depth + 1) for reply in comment.replies)
+    return comments
+
+
+def collect_comments(category, post_ids, collector=None, registry=None, workers=COMMENT_WORKERS,
+                     top_k=TOP_K_COMMENTS, max_depth=MAX_DEPTH, replace_more_limit=REPLACE_MORE_LIMIT):
+    """
+    Fetches comment trees for the given submissions in parallel, stores them in
+    the category's RedditComment table and queues them for extraction.
+    """
+    cfg = get_category(category)
+    collector = collector or collect_module(category)
+    registry = registry or MetricsRegistry(f"{category}_comments")
+    app = getattr(collector, cfg['app'])
+    db = getattr(collector, cfg['db'])
+    model = collector.RedditComment
+    queue = JobQueue()
+
+    def fetch(post_id):
+        with registry.time_stage('comment_fetch', category=category) as batch:
+            comments = fetch_comments(_thread_client(collector), post_id, top_k, max_depth, replace_more_limit)
+            batch.items = len(comments)
+        return comments
+
+    def store(fetched):
+        if not fetched:
+            return 0
+        with app.app_context():
+            existing = {row.id for row in model.query.with_entities(model.id)
+                        .filter(model.id.in_([comment['id'] for comment in fetched])).all()}
+            rows = []
+            for comment in fetched:
+                if comment['id'] in existing:
+                    continue
+                existing.add(comment['id'])
+                with registry.time_stage('sentiment', items=1, category=category):
+                    compound, label = collector.get_sentiment(comment['body'])
+                with registry.time_stage('clean', items=1, category=category):
+                    cleaned_body = collector.clean_text(comment['body'])
+                rows.append(model(cleaned_body=cleaned_body, sentiment_compound=compound,
+                                  sentiment_label=label, **comment))
+            with registry.time_stage('db_write', items=len(rows), category=category):
+                db.session.add_all(rows)
+                db.session.commit()
+        queue.enqueue(category, [COMMENT_JOB_PREFIX + row.id for row in rows])
+        registry.inc('comments_ingested_total', len(rows), category=category)
+        return len(rows)
+
+    post_ids = list(post_ids)
+    print(f"Fetching comments for {len(post_ids)} {category} submissions ({workers} at a time)...")
+    stored, fetched, done = 0, [], 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, post_id): post_id for post_id in post_ids}
+        for future in as_completed(futures):
+            done += 1
+            try:
+                fetched.extend(future.result())
+            except Exception as e:
+                log_event('comment_fetch_failed', category=category, post_id=futures[future], error=str(e))
+                registry.inc('comment_fetch_errors_total', category=category)
+            if done % COMMIT_EVERY == 0:
+                stored += store(fetched)
+                fetched = []
+    stored += store(fetched)
+    print(f"Stored {stored} new comments.")
+    return stored
+
+
+def recent_post_ids(category, limit):
+    """Ids of the newest stored submissions, for backfilling comments."""
+    cfg = get_category(category)
+    collector = collect_module(category)
+    model = collector.RedditPost
+    with getattr(collector, cfg['app']).app_context():
+        rows = model.query.with_entities(model.id).order_by(model.created.desc()).limit(limit).all()
+    return [row.id for row in rows]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fetch comment trees for stored submissions.")
+    parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    parser.add_argument('--recent', type=int, default=200, help="Backfill the newest N submissions.")
+    parser.add_argument('--workers', type=int, default=COMMENT_WORKERS)
+    parser.add_argument('--top-k', type=int, default=TOP_K_COMMENTS)
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH)
+    parser.add_argument('--replace-more', type=int, default=REPLACE_MORE_LIMIT,
+                        help="'Load more comments' expansions per submission (one API call each).")
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    registry = MetricsRegistry(f"{args.category}_comments")
+    collect_comments(args.category, recent_post_ids(args.category, args.recent), registry=registry,
+                     workers=args.workers, top_k=args.top_k, max_depth=args.max_depth,
+                     replace_more_limit=args.replace_more)
+    registry.dump()
+    log_stage_summary(registry)
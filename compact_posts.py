@@ -0,0 +1,109 @@
+import json
+import math
+from array import array
+from collections import Counter
+
+# --- Compact Read Path Configuration ---
+# Rows fetched per round trip; only the selected columns are ever materialized
+YIELD_PER = 5000
+
+
+class MentionTable:
+    """Interns mention strings to small ints, so each distinct name is stored once."""
+    __slots__ = ('ids', 'names')
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, name):
+        mention_id = self.ids.get(name)
+        if mention_id is None:
+            mention_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return mention_id
+
+    def __len__(self):
+        return len(self.names)
+
+
+class CompactPosts:
+    """
+    The analysis scripts' view of a posts table: per-post created/score plus the
+    extracted mentions, as interned ids in CSR layout (post i owns
+    mention_ids[offsets[i]:offsets[i + 1]]). Per-mention sentiment sits in a
+    parallel array, NaN where the post predates mention_sentiment.
+    """
+    __slots__ = ('table', 'created', 'score', 'offsets', 'mention_ids', 'mention_scores')
+
+    def __init__(self, table=None):
+        self.table = table if table is not None else MentionTable()
+        self.created = array('d')
+        self.score = array('l')
+        self.offsets = array('L', [0])
+        self.mention_ids = array('L')
+        self.mention_scores = array('f')
+
+    def append(self, mentions, created=None, score=0, scores=None):
+        scores = scores or {}
+        for name in mentions:
+            self.mention_ids.append(self.table.intern(name))
+            self.mention_scores.append(scores.get(name, math.nan))
+        self.offsets.append(len(self.mention_ids))
+        self.created.append(created.timestamp() if created is not None else math.nan)
+        self.score.append(score or 0)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        columns = (self.created, self.score, self.offsets, self.mention_ids, self.mention_scores)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def mention_names(self):
+        """Every mention in load order, as the flat list the normalize scripts work on."""
+        names = self.table.names
+        return [names[mention_id] for mention_id in self.mention_ids]
+
+    def mention_counts(self):
+        names = self.table.names
+        return Counter({names[mention_id]: count for mention_id, count in Counter(self.mention_ids).items()})
+
+    def sentiment_pairs(self):
+        """Per post, [(mention, compound), ...] for its scored mentions (mention_sentiment.sentiment_shares input)."""
+        names, ids, scores, offsets = self.table.names, self.mention_ids, self.mention_scores, self.offsets
+        for i in range(len(self)):
+            pairs = [(names[ids[k]], scores[k]) for k in range(offsets[i], offsets[i + 1]) if scores[k] == scores[k]]
+            if pairs:
+                yield pairs
+
+
+def _json_list(raw):
+    try:
+        value = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return value if isinstance(value, list) else []
+
+
+def load_compact(model, column, posts=None, yield_per=YIELD_PER):
+    """
+    Streams only `column`, mention_sentiment, created and score for rows with
+    extracted mentions into a CompactPosts; no ORM objects, bodies or URLs are
+    loaded. Pass `posts` to append another model (e.g. comments) to the same
+    arrays. Call inside the model's app context.
+    """
+    posts = posts if posts is not None else CompactPosts()
+    extracted = getattr(model, column)
+    query = (model.query.with_entities(extracted, model.mention_sentiment, model.created, model.score)
+             .filter(extracted.isnot(None)))
+    for raw, scored, created, score in query.yield_per(yield_per):
+        scores = {name: compound for name, compound in _json_list(scored)} if scored else None
+        posts.append(_json_list(raw), created, score, scores)
+    return posts
+
+
+def describe(posts):
+    return (f"Loaded {len(posts)} posts, {len(posts.mention_ids)} mentions "
+            f"({len(posts.table)} distinct) into {posts.nbytes / 1024:.0f} KiB of arrays.")
@@ -0,0 +1,402 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import argparse
+import threading
+from itertools import chain
+from collections import Counter, defaultdict
+
+from categories import CATEGORIES, get_category, normalize_module, vocabulary
+
+# --- Resolver Configuration ---
+# Product catalog, alias index and memoized resolutions for every category
+DEFAULT_CATALOG_PATH = os.environ.get('PRODUCT_CATALOG_PATH', 'product_catalog.db')
+# Trigram (Dice) overlap a candidate alias needs before we pay for an edit distance
+MIN_TRIGRAM_SIMILARITY = 0.5
+# 1 - levenshtein / longest length; "galaxy s24 ultr" vs "galaxy s24 ultra" is 0.94
+MIN_EDIT_SIMILARITY = 0.8
+# How many trigram candidates get verified with the edit distance
+MAX_CANDIDATES = 5
+# Memoized resolutions are written to SQLite in chunks
+FLUSH_EVERY = 1000
+
+KEY_CLEAN_RE = re.compile(r'[^a-z0-9+]+')
+DIGITS_RE = re.compile(r'\d+')
+# Short suffixes people use instead of the full variant name ("S24U", "14PM")
+SUFFIX_ABBREVIATIONS = {'ultra': 'u', 'plus': '+', 'pro max': 'pm'}
+# Variant words that never identify a product on their own ("8 pro", "15 pro max")
+SUFFIX_WORDS = {'pro', 'max', 'plus', 'ultra', 'lite', 'mini', 'fe', 'u', 'pm', '+'}
+
+
+def alias_key(name):
+    """Lowercases and strips punctuation: 'Nothing Phone (2)' -> 'nothing phone 2'."""
+    return ' '.join(KEY_CLEAN_RE.sub(' ', name.lower()).split())
+
+
+def _compact(key):
+    return key.replace(' ', '')
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _pattern_bits(pattern):
+    """Per-character bitmasks of `pattern`, the preprocessing step of _bit_parallel_distance."""
+    bits = {}
+    for i, char in enumerate(pattern):
+        bits[char] = bits.get(char, 0) | (1 << i)
+    return bits
+
+
+def _bit_parallel_distance(bits, m, text, max_distance=None):
+    """
+    Myers/Hyyro bit-vector edit distance: one pass over `text` with a handful of
+    integer operations per character instead of a full m x n table.
+    """
+    if m == 0:
+        return len(text)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    remaining = len(text)
+    for char in text:
+        eq = bits.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        remaining -= 1
+        # The distance can drop by at most one per remaining character
+        if max_distance is not None and score - remaining > max_distance:
+            return max_distance + 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv & full
+    return score
+
+
+def levenshtein(a, b, max_distance=None):
+    """Edit distance between two strings; gives up once it must exceed `max_distance`."""
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    return _bit_parallel_distance(_pattern_bits(b), len(b), a, max_distance)
+
+
+def alias_variants(canonical, generic_brands):
+    """
+    Spellings people commonly use for a canonical name: without the brand,
+    without the series word, and with abbreviated suffixes. "Samsung Galaxy S24 Ultra"
+    gives "galaxy s24 ultra", "samsung s24 ultra", "s24 ultra", "galaxy s24 u", ...
+    """
+    key = alias_key(canonical)
+    tokens = key.split()
+    variants = {key}
+    # Leading brand/series words ("samsung", "galaxy", "google pixel") are optional
+    leading = 0
+    while leading < len(tokens) - 1 and tokens[leading] in generic_brands:
+        leading += 1
+    for drop in range(1, leading + 1):
+        variants.add(' '.join(tokens[drop:]))
+    if leading >= 2:
+        variants.add(' '.join(tokens[:1] + tokens[leading:]))
+    for variant in list(variants):
+        for long_form, short_form in SUFFIX_ABBREVIATIONS.items():
+            if variant.endswith(' ' + long_form):
+                variants.add(variant[:-len(long_form)].rstrip() + short_form)
+    # Every alias keeps a word that names the product: the series word right before the
+    # model ("pixel" in "google pixel 8 pro") or a model token with letters ("s24"), so
+    # "8 pro", "google 8 pro" and "15 pro max" never become aliases
+    anchors = {token for token in tokens[leading:]
+               if token not in SUFFIX_WORDS and any(c.isalpha() for c in token)}
+    if leading:
+        anchors.add(tokens[leading - 1])
+    return {variant for variant in variants
+            if (DIGITS_RE.search(variant) or ' ' in variant)
+            and any(token.startswith(anchor) for token in variant.split() for anchor in anchors)}
+
+
+class EntityResolver:
+    """
+    Maps raw product mentions that PATTERN_MAP did not recognise onto canonical
+    catalog names. An exact alias lookup (spaced and space-less keys) runs first;
+    otherwise candidates sharing the mention's model numbers are ranked by
+    trigram overlap and the best few are verified with a bounded edit distance.
+    Every answer, including "no match", is memoized in SQLite.
+    """
+
+    def __init__(self, category, path=DEFAULT_CATALOG_PATH):
+        self.category = category
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS product_alias ("
+            " category TEXT NOT NULL, alias TEXT NOT NULL, canonical TEXT NOT NULL,"
+            " source TEXT NOT NULL, PRIMARY KEY (category, alias))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS resolved_mention ("
+            " category TEXT NOT NULL, mention TEXT NOT NULL, canonical TEXT,"
+            " method TEXT NOT NULL, score REAL, PRIMARY KEY (category, mention))"
+        )
+        self.hits = Counter()
+        self._pending = []
+        self._load()
+
+    def _load(self):
+        self.aliases = {}
+        self.compact_aliases = {}
+        self._blocks = defaultdict(list)
+        self._postings = {}
+        self._gram_counts = {}
+        self._block_lengths = {}
+        rows = self._conn.execute(
+            "SELECT alias, canonical FROM product_alias WHERE category = ?", (self.category,)
+        ).fetchall()
+        for alias, canonical in rows:
+            self.aliases[alias] = canonical
+            self.compact_aliases.setdefault(_compact(alias), canonical)
+            # Fuzzy candidates must carry exactly the same model numbers, so
+            # "galaxy s23" can never be corrected into "galaxy s24"
+            self._blocks[tuple(DIGITS_RE.findall(alias))].append(alias)
+        for signature, block in self._blocks.items():
+            postings = defaultdict(list)
+            for alias in block:
+                grams = _trigrams(alias)
+                self._gram_counts[alias] = len(grams)
+                for gram in grams:
+                    postings[gram].append(alias)
+            self._postings[signature] = postings
+            self._block_lengths[signature] = (min(map(len, block)), max(map(len, block)))
+        self._memo = dict(self._conn.execute(
+            "SELECT mention, canonical FROM resolved_mention WHERE category = ?", (self.category,)
+        ).fetchall())
+
+    @property
+    def size(self):
+        return len(set(self.aliases.values()))
+
+    # --- Catalog Maintenance ---
+
+    def rebuild(self, alias_map, source='generated'):
+        """Replaces the category's aliases with `alias_map` ({alias key: canonical}) and clears the memo."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM product_alias WHERE category = ?", (self.category,))
+                self._conn.execute("DELETE FROM resolved_mention WHERE category = ?", (self.category,))
+                self._conn.executemany(
+                    "INSERT INTO product_alias (category, alias, canonical, source) VALUES (?, ?, ?, ?)",
+                    [(self.category, alias, canonical, source) for alias, canonical in alias_map.items()],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending = []
+        self._load()
+
+    # --- Resolution ---
+
+    def _fuzzy(self, key):
+        signature = tuple(DIGITS_RE.findall(key))
+        postings = self._postings.get(signature)
+        if not postings:
+            return None, None
+        # The length difference alone already costs that many edits
+        shortest, longest = self._block_lengths[signature]
+        if len(key) * MIN_EDIT_SIMILARITY > longest or shortest * MIN_EDIT_SIMILARITY > len(key):
+            return None, None
+        grams = _trigrams(key)
+        shared = Counter(chain.from_iterable(postings[gram] for gram in grams if gram in postings))
+        # Dice >= 0.5 needs at least a third of the mention's trigrams to be shared
+        min_overlap = len(grams) / 3
+        candidates = []
+        for alias, overlap in shared.items():
+            if overlap < min_overlap:
+                continue
+            dice = 2 * overlap / (len(grams) + self._gram_counts[alias])
+            if dice >= MIN_TRIGRAM_SIMILARITY:
+                candidates.append((dice, alias, overlap))
+        candidates.sort(reverse=True)
+
+        best, best_score = None, 0.0
+        bits = None
+        for dice, alias, overlap in candidates[:MAX_CANDIDATES]:
+            longest = max(len(key), len(alias))
+            max_distance = int(longest * (1 - MIN_EDIT_SIMILARITY))
+            # One edit touches at most three trigrams, so too little overlap rules the alias out
+            if abs(len(key) - len(alias)) > max_distance or \
+                    max(len(grams), self._gram_counts[alias]) - overlap > 3 * max_distance:
+                continue
+            if bits is None:
+                bits = _pattern_bits(key)
+            distance = _bit_parallel_distance(bits, len(key), alias, max_distance)
+            if distance > max_distance:
+                continue
+            score = 1 - distance / longest
+            if score > best_score:
+                best, best_score = alias, score
+        if best is None:
+            return None, None
+        return self.aliases[best], round(best_score, 3)
+
+    def resolve(self, name):
+        """Returns the canonical product name for a raw mention, or None if nothing is close enough."""
+        key = alias_key(name)
+        if key in self._memo:
+            self.hits['memo'] += 1
+            return self._memo[key]
+        canonical, method, score = self.aliases.get(key), 'alias', 1.0
+        if canonical is None:
+            canonical = self.compact_aliases.get(_compact(key))
+        if canonical is None:
+            canonical, score = self._fuzzy(key)
+            method = 'fuzzy' if canonical else 'unresolved'
+        self.hits[method] += 1
+        self._memo[key] = canonical
+        with self._lock:
+            self._pending.append((self.category, key, canonical, method, score))
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+        return canonical
+
+    def _flush_locked(self):
+        if self._pending:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO resolved_mention (category, mention, canonical, method, score) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self._pending,
+            )
+            self._conn.execute("COMMIT")
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def report(self):
+        total = sum(self.hits.values())
+        if not total:
+            return f"Entity resolver ({self.category}): no lookups, {self.size} catalog products."
+        parts = ', '.join(f"{method} {count}" for method, count in self.hits.most_common())
+        return f"Entity resolver ({self.category}): {total} lookups ({parts}), {self.size} catalog products."
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+_resolvers = {}
+
+
+def get_resolver(category):
+    """Shared per-process resolver; pending resolutions are flushed on exit."""
+    if category not in _resolvers:
+        resolver = _resolvers[category] = EntityResolver(category)
+        atexit.register(resolver.flush)
+    return _resolvers[category]
+
+
+def stored_mentions(category):
+    """Counts every raw mention in the category's extracted column."""
+    cfg = get_category(category)
+    module = normalize_module(category)
+    model = module.RedditPost
+    column = getattr(model, cfg['extracted_column'])
+    mentions = Counter()
+    with getattr(module, cfg['app']).app_context():
+        for (extracted,) in model.query.with_entities(column).filter(column.isnot(None)).yield_per(2000):
+            try:
+                mentions.update(json.loads(extracted))
+            except (json.JSONDecodeError, TypeError):
+                continue
+    return mentions
+
+
+def build_catalog(category):
+    """
+    Builds the alias index from stored mentions: every distinct raw mention that
+    PATTERN_MAP canonicalizes becomes an alias of its canonical name, and each
+    canonical name contributes its generated spelling variants. Aliases that
+    point at more than one product are dropped.
+    """
+    from gazetteer import Gazetteer
+
+    generic_brands = {brand.lower().strip() for brand in vocabulary(category)[0]}
+    gazetteer = Gazetteer.for_category(category)
+    raw_mentions = stored_mentions(category)
+
+    candidates = defaultdict(set)
+    canonical_counts = Counter()
+    for raw, count in raw_mentions.items():
+        key = alias_key(raw)
+        canonical = gazetteer.canonical(key)
+        if canonical:
+            candidates[key].add(canonical)
+            canonical_counts[canonical] += count
+    for canonical in canonical_counts:
+        for variant in alias_variants(canonical, generic_brands):
+            candidates[variant].add(canonical)
+
+    alias_map = {alias: next(iter(names)) for alias, names in candidates.items() if len(names) == 1}
+    ambiguous = len(candidates) - len(alias_map)
+    resolver = get_resolver(category)
+    resolver.rebuild(alias_map, source='stored_mentions')
+    print(f"Built {category} catalog: {len(canonical_counts)} products, {len(alias_map)} aliases "
+          f"({ambiguous} ambiguous aliases dropped) from {len(raw_mentions)} distinct mentions.")
+    return resolver
+
+
+def resolve_unmatched(category, limit=None):
+    """Resolves every stored mention PATTERN_MAP leaves alone and prints the merges + throughput."""
+    from gazetteer import Gazetteer
+
+    gazetteer = Gazetteer.for_category(category)
+    unmatched = [raw for raw in stored_mentions(category)
+                 if alias_key(raw) not in gazetteer.skip_terms and not gazetteer.canonical(alias_key(raw))]
+    if limit:
+        unmatched = unmatched[:limit]
+
+    resolver = get_resolver(category)
+    start = time.perf_counter()
+    merged = [(raw, resolver.resolve(raw)) for raw in unmatched]
+    elapsed = time.perf_counter() - start
+    resolver.flush()
+    resolved = [(raw, canonical) for raw, canonical in merged if canonical]
+    print(f"Resolved {len(resolved)} of {len(unmatched)} unmatched {category} mentions "
+          f"in {elapsed:.2f}s ({len(unmatched) / max(elapsed, 1e-9):,.0f} mentions/sec).")
+    for raw, canonical in resolved[:20]:
+        print(f"  {raw!r} -> {canonical}")
+    print(resolver.report())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Product catalog, alias index and fuzzy entity resolution.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help="Rebuild the alias index from stored mentions.")
+    build_parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    resolve_parser = sub.add_parser('resolve', help="Resolve stored mentions that PATTERN_MAP misses.")
+    resolve_parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    resolve_parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    if args.command == 'build':
+        build_catalog(args.category)
+    else:
+        resolve_unmatched(args.category, args.limit)
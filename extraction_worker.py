@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+from collections import defaultdict
+
+from categories import CATEGORIES, NER_BACKENDS, get_category, bert_module, extractor_module, normalizer
+from job_queue import JobQueue
+from comment_ingest import COMMENT_JOB_PREFIX
+from serving_snapshot import publish_snapshot
+from co_mention import CoMentionGraph
+from heavy_hitters import TrendingWindows, process_source
+from pipeline_metrics import MetricsRegistry, log_event, log_stage_summary
+
+# --- Worker Configuration ---
+DEFAULT_BATCH_SIZE = 32
+# Longest a partial batch waits for more jobs before it is processed anyway
+DEFAULT_MAX_WAIT = 2.0
+POLL_INTERVAL = 0.25
+MAX_ATTEMPTS = 3
+METRICS_DUMP_INTERVAL = 30
+
+
+class ExtractionWorker:
+    """
+    Long-running extractor: loads the BERT model once, then pulls post-id jobs
+    from the SQLite queue that the collectors fill and processes them in
+    micro-batches bounded by size and by wait time.
+    """
+
+    def __init__(self, categories, queue=None, batch_size=DEFAULT_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT, max_attempts=MAX_ATTEMPTS, backend=None, drain=False):
+        self.categories = list(categories)
+        self.queue = queue or JobQueue()
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.backend = backend
+        # Exit once nothing is left to claim instead of polling forever (orchestrator.py)
+        self.drain = drain
+        self.registry = MetricsRegistry('extraction_worker')
+        self._extractors = {}
+        self._graphs = {}
+        self._normalizers = {}
+        # Live top-K per time window for /api/trending (see heavy_hitters.py)
+        self.trending = TrendingWindows(process_source('extraction_worker'))
+        self._stopping = False
+
+    def warm_up(self):
+        """Imports each category's extractor and loads the shared NER model up front."""
+        shared_pipeline = None
+        for category in self.categories:
+            module = extractor_module(category, self.backend)
+            if shared_pipeline is None:
+                shared_pipeline = module.load_ner_pipeline()
+            else:
+                # All categories use the same dslim/bert-base-NER weights, so load them once
+                # (the spaCy backend shares its model at module level already)
+                module.ner_pipeline = shared_pipeline
+            self._extractors[category] = module
+            self._graphs[category] = CoMentionGraph(category)
+            self._normalizers[category] = normalizer(category)
+        print(f"Extraction worker ready for: {', '.join(self.categories)}")
+
+    def request_stop(self, signum=None, frame=None):
+        if not self._stopping:
+            print("Shutdown requested, finishing the current batch...")
+        self._stopping = True
+
+    def _collect_batch(self):
+        """Claims jobs until the batch is full or the oldest job has waited max_wait seconds."""
+        batch = []
+        first_claimed = None
+        while not self._stopping:
+            claimed = self.queue.claim(self.batch_size - len(batch), self.categories)
+            batch.extend(claimed)
+            if batch and first_claimed is None:
+                first_claimed = time.monotonic()
+            if len(batch) >= self.batch_size or (batch and time.monotonic() - first_claimed >= self.max_wait):
+                break
+            if self.drain and not claimed:
+                break
+            time.sleep(POLL_INTERVAL)
+        return batch
+
+    def _process_category(self, category, jobs):
+        cfg = get_category(category)
+        module = self._extractors[category]
+        db = getattr(module, cfg['db'])
+        # Comment jobs carry Reddit's "t1_" prefix (see comment_ingest.py)
+        post_ids = [job['post_id'] for job in jobs if not job['post_id'].startswith(COMMENT_JOB_PREFIX)]
+        comment_ids = [job['post_id'][len(COMMENT_JOB_PREFIX):] for job in jobs
+                       if job['post_id'].startswith(COMMENT_JOB_PREFIX)]
+        with getattr(module, cfg['app']).app_context():
+            rows = []
+            for model, ids in ((module.RedditPost, post_ids), (module.RedditComment, comment_ids)):
+                if ids:
+                    rows.extend(model.query.filter(model.id.in_(ids)).all())
+            if rows:
+                results = module.extract_posts(rows)
+                for row, entities in zip(rows, results):
+                    setattr(row, cfg['extracted_column'], json.dumps(entities))
+                with self.registry.time_stage('db_write', items=len(rows), category=category):
+                    db.session.commit()
+                prefixes = [COMMENT_JOB_PREFIX if isinstance(row, module.RedditComment) else '' for row in rows]
+                with self.registry.time_stage('co_mention_update', items=len(rows), category=category):
+                    self._graphs[category].update_many(
+                        (prefix + row.id, entities, row.created) for prefix, row, entities in zip(prefixes, rows, results))
+                with self.registry.time_stage('trending', items=len(rows), category=category):
+                    normalize = self._normalizers[category]
+                    for row, entities in zip(rows, results):
+                        self.trending.add(category, normalize(entities), row.created.timestamp())
+        return len(rows)
+
+    def process_batch(self, jobs):
+        by_category = defaultdict(list)
+        for job in jobs:
+            by_category[job['category']].append(job)
+
+        for category, category_jobs in by_category.items():
+            job_ids = [job['id'] for job in category_jobs]
+            try:
+                with self.registry.time_stage('worker_batch', category=category) as batch:
+                    batch.items = self._process_category(category, category_jobs)
+            except Exception as e:
+                log_event('extraction_batch_failed', category=category, jobs=len(job_ids), error=str(e))
+                self.registry.inc('worker_jobs_failed_total', len(job_ids), category=category)
+                self.queue.fail(job_ids, e, max_attempts=self.max_attempts)
+                continue
+            self.queue.complete(job_ids)
+            now = time.time()
+            for job in category_jobs:
+                self.registry.observe('ingest_to_entities_seconds', now - job['enqueued_at'], category=category)
+            self.registry.inc('worker_jobs_done_total', len(job_ids), category=category)
+
+    def _publish(self):
+        for category, graph in self._graphs.items():
+            with self.registry.time_stage('co_mention_save', category=category):
+                graph.save()
+        self.trending.dump()
+        # The API only serves the phone DB (see serving_snapshot.py)
+        if 'phone' in self.categories:
+            publish_snapshot()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+        stale = self.queue.requeue_stale()
+        if stale:
+            print(f"Re-queued {stale} jobs left running by a previous worker.")
+        self.warm_up()
+
+        last_dump = time.monotonic()
+        while not self._stopping:
+            jobs = self._collect_batch()
+            if self._stopping:
+                # Don't start new work after a stop request; hand the jobs back
+                self.queue.release([job['id'] for job in jobs])
+                break
+            if self.drain and not jobs:
+                break
+            self.process_batch(jobs)
+            if time.monotonic() - last_dump >= METRICS_DUMP_INTERVAL:
+                self.registry.dump()
+                self._publish()
+                last_dump = time.monotonic()
+
+        self.registry.dump()
+        self._publish()
+        log_stage_summary(self.registry)
+        print(f"Extraction worker stopped. Queue: {self.queue.counts()}")
+
+
+def enqueue_missing(categories, queue):
+    """Queues every post and comment that has not been through extraction yet (one-off backfill)."""
+    for category in categories:
+        cfg = get_category(category)
+        module = bert_module(category)
+        with getattr(module, cfg['app']).app_context():
+            for model, prefix in ((module.RedditPost, ''), (module.RedditComment, COMMENT_JOB_PREFIX)):
+                column = getattr(model, cfg['extracted_column'])
+                # Some writers store '' rather than NULL for "not extracted yet"
+                missing = model.query.with_entities(model.id).filter(column.is_(None) | (column == ''))
+                ids = [prefix + row.id for row in missing.all()]
+                queue.enqueue(category, ids)
+                print(f"Queued {len(ids)} {category} {model.__tablename__} rows for extraction.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Resident NER extraction worker fed by the collectors' job queue.")
+    parser.add_argument('--categories', nargs='+', default=list(CATEGORIES), choices=list(CATEGORIES))
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT,
+                        help="Seconds a partial batch may wait for more jobs.")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    parser.add_argument('--backend', default=None, choices=NER_BACKENDS, help="NER model (default: NER_BACKEND or bert).")
+    parser.add_argument('--enqueue-missing', action='store_true',
+                        help="Queue posts that have never been extracted before starting.")
+    parser.add_argument('--drain', action='store_true',
+                        help="Exit once the queue has no available jobs instead of waiting for more.")
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    worker = ExtractionWorker(args.categories, batch_size=args.batch_size,
+                              max_wait=args.max_wait, max_attempts=args.max_attempts, backend=args.backend,
+                              drain=args.drain)
+    if args.enqueue_missing:
+        enqueue_missing(args.categories, worker.queue)
+    worker.run()
@@ -0,0 +1,181 @@
+import re
+import sys
+import json
+import time
+import argparse
+from functools import lru_cache
+
+from categories import CATEGORIES, get_category, normalize_module, vocabulary
+from prefilter import MODEL_TOKEN_RE, bert_mentions, brand_keywords
+
+# --- Gazetteer Configuration ---
+# Longest product mention we try to match, in tokens ("samsung galaxy z fold 5")
+MAX_WINDOW = 6
+TOKEN_SPLIT_RE = re.compile(r'[^a-z0-9+]+')
+# Window -> canonical lookups kept in memory; every anchor window of every post is a new key
+MEMO_SIZE = 100000
+
+
+class Gazetteer:
+    """
+    Dictionary extractor built from a category's GENERIC_BRANDS / PATTERN_MAP.
+
+    Brand and series keywords are indexed as anchor tokens. At each anchor we try
+    the longest token window first against PATTERN_MAP and emit the canonical
+    name on a match. Window -> canonical lookups are memoized in an LRU of
+    MEMO_SIZE entries, so after warm-up a post costs one split plus a few
+    lookups while memory stays flat on a long-running worker.
+    """
+
+    def __init__(self, generic_brands, noisy_terms, pattern_map, max_window=MAX_WINDOW, memo_size=MEMO_SIZE):
+        self.skip_terms = {term.lower().strip() for term in set(generic_brands) | set(noisy_terms)}
+        self.patterns = [(re.compile(pattern), replacement) for pattern, replacement in pattern_map.items()]
+        # Common words are fine as anchors here: a window still has to fully match a pattern
+        self.anchors = frozenset(brand_keywords(generic_brands, noisy_terms, pattern_map, drop_common=False))
+        self.max_window = max_window
+        self.canonical = lru_cache(maxsize=memo_size)(self._canonical)
+
+    @classmethod
+    def for_category(cls, category):
+        return cls(*vocabulary(category))
+
+    def _canonical(self, phrase):
+        """Returns the canonical product name for a lowercase phrase, or None (memoized as canonical())."""
+        if phrase in self.skip_terms:
+            return None
+        for pattern, replacement in self.patterns:
+            match = pattern.fullmatch(phrase)
+            if match:
+                return (replacement(match) if callable(replacement) else replacement).strip()
+        return None
+
+    def _is_anchor(self, token):
+        return token in self.anchors or MODEL_TOKEN_RE.fullmatch(token) is not None
+
+    def extract_tokens(self, tokens):
+        found = []
+        i, n = 0, len(tokens)
+        while i < n:
+            if not self._is_anchor(tokens[i]):
+                i += 1
+                continue
+            for length in range(min(self.max_window, n - i), 0, -1):
+                name = self.canonical(' '.join(tokens[i:i + length]))
+                if name:
+                    found.append(name)
+                    i += length
+                    break
+            else:
+                i += 1
+        return found
+
+    def extract(self, text):
+        """Returns canonical product names mentioned in text, in order, without duplicates."""
+        if not text or not isinstance(text, str):
+            return []
+        tokens = [t for t in TOKEN_SPLIT_RE.split(text.lower()) if t]
+        return list(dict.fromkeys(self.extract_tokens(tokens)))
+
+
+def merge_mentions(bert_mentions, gazetteer_mentions, normalize):
+    """
+    Merges raw BERT mentions with gazetteer names. BERT mentions that normalize to
+    a product the gazetteer already found are dropped so nothing is counted twice.
+    """
+    covered = set(gazetteer_mentions)
+    merged = list(gazetteer_mentions)
+    for mention in bert_mentions:
+        normalized = normalize([mention])
+        if normalized and all(name in covered for name in normalized):
+            continue
+        merged.append(mention)
+    return merged
+
+
+def extract_category(category, only_missing=True):
+    """Standalone mode: fills the category's extracted column straight from cleaned text."""
+    cfg = get_category(category)
+    module = normalize_module(category)
+    model = module.RedditPost
+    column = getattr(model, cfg['extracted_column'])
+    gazetteer = Gazetteer.for_category(category)
+    with getattr(module, cfg['app']).app_context():
+        db = getattr(module, cfg['db'])
+        query = model.query
+        if only_missing:
+            query = query.filter((column == None) | (column == ''))
+        posts = query.all()
+        if not posts:
+            print(f"No {category} posts need extraction.")
+            return
+        print(f"Running gazetteer extraction on {len(posts)} {category} posts...")
+        start = time.perf_counter()
+        for post in posts:
+            names = gazetteer.extract(f"{post.cleaned_title or ''} {post.cleaned_body or ''}")
+            setattr(post, cfg['extracted_column'], json.dumps(names))
+        elapsed = time.perf_counter() - start
+        db.session.commit()
+    print(f"Finished. Updated {len(posts)} posts ({len(posts) / max(elapsed, 1e-9):,.0f} posts/sec).")
+
+
+def compare_with_bert(category, limit=None):
+    """
+    Benchmarks the gazetteer and measures precision/recall against BERT alone:
+    the sample is re-tagged by dslim/bert-base-NER (prefilter.bert_mentions()),
+    since the stored extracted_* column may hold gazetteer output itself
+    (`extract` above, EXTRACTOR_MODE=merge).
+    """
+    cfg = get_category(category)
+    module = normalize_module(category)
+    model = module.RedditPost
+    normalize = getattr(module, cfg['normalize_fn'])
+    gazetteer = Gazetteer.for_category(category)
+    with getattr(module, cfg['app']).app_context():
+        query = model.query.with_entities(model.title, model.body, model.cleaned_title, model.cleaned_body)
+        rows = query.limit(limit).all() if limit else query.all()
+    if not rows:
+        print(f"No {category} posts to compare on. Run the collector first.")
+        return None
+
+    references = [set(normalize(mentions)) for mentions in bert_mentions(
+        category, [f"{title}. {body or ''}" if title else (body or '') for title, body, _, _ in rows])]
+    texts = [f"{title or ''} {body or ''}" for _, _, title, body in rows]
+    start = time.perf_counter()
+    predictions = [set(gazetteer.extract(text)) for text in texts]
+    elapsed = time.perf_counter() - start
+
+    true_positives = predicted = expected = 0
+    for reference, predicted_names in zip(references, predictions):
+        true_positives += len(predicted_names & reference)
+        predicted += len(predicted_names)
+        expected += len(reference)
+
+    result = {
+        'category': category,
+        'posts': len(rows),
+        'posts_per_sec': round(len(rows) / max(elapsed, 1e-9)),
+        'posts_per_min': round(60 * len(rows) / max(elapsed, 1e-9)),
+        'precision': round(true_positives / predicted, 4) if predicted else 0.0,
+        'recall': round(true_positives / expected, 4) if expected else 0.0,
+    }
+    print(f"Gazetteer vs BERT on {result['posts']} {category} posts")
+    print("-" * 55)
+    print(f"Throughput : {result['posts_per_sec']:,} posts/sec ({result['posts_per_min']:,} posts/min)")
+    print(f"Precision  : {result['precision']:.2%}")
+    print(f"Recall     : {result['recall']:.2%}")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gazetteer fast-path product extractor.")
+    parser.add_argument('command', choices=['extract', 'compare'])
+    parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    parser.add_argument('--all', action='store_true', help="Re-extract every post, not just missing ones.")
+    parser.add_argument('--limit', type=int, default=None, help="Posts to use for 'compare'.")
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        extract_category(args.category, only_missing=not args.all)
+    else:
+        if compare_with_bert(args.category, args.limit) is None:
+            sys.exit(1)
@@ -0,0 +1,89 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Stub Configuration ---
+# Answers generateContent requests like Gemini would for Gemini.py's prompts, so the
+# batching, retry and fallback paths can be run without an API key:
+#   python gemini_stub.py --port 8089 --latency 0.5 --fail-rate 0.05
+#   GEMINI_BASE_URL=http://127.0.0.1:8089 python extraction_worker.py --backend gemini
+POST_RE = re.compile(r'<post id="([^"]+)">\n(.*?)\n</post>', re.DOTALL)
+PRODUCT_RE = re.compile(
+    r"\b(?:iPhone|Galaxy|Pixel|OnePlus|Redmi|Poco|Xiaomi|Vivo|Realme|Moto|Nothing Phone|"
+    r"MacBook|ThinkPad|XPS|ZenBook|iPad|Surface|Tab)"
+    r"(?:\s+(?:\d+\w*|Pro|Max|Plus|Ultra|FE|Note|Nord|CE|Edge|GT|Air|Mini|S\d+\w*|[A-Z]\d+\w*|\(\d\)))*")
+
+
+def stub_answer(prompt):
+    """The JSON object Gemini.py asks for: post id -> product names found by a regex."""
+    return {post_id: list(dict.fromkeys(m.group().strip() for m in PRODUCT_RE.finditer(text)))
+            for post_id, text in POST_RE.findall(prompt)}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    fail_status = 503
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.endswith(':generateContent'):
+            return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            return self._send(self.fail_status, {'error': {'code': self.fail_status, 'message': 'Stub failure'}})
+        try:
+            prompt = json.loads(body)['contents'][0]['parts'][0]['text']
+        except (json.JSONDecodeError, KeyError, IndexError):
+            return self._send(400, {'error': {'code': 400, 'message': 'Bad request'}})
+        answer = json.dumps(stub_answer(prompt))
+        self._send(200, {
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': answer}]}, 'finishReason': 'STOP'}],
+            # Roughly 4 characters per token, like the real tokenizer on English text
+            'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'candidatesTokenCount': len(answer) // 4},
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, latency=0.0, fail_rate=0.0, fail_status=503):
+    """
+    Starts the stub in a daemon thread; returns (server, base_url). port=0 picks a
+    free port. A fail_rate share of requests is answered with fail_status.
+    """
+    handler = type('ConfiguredStubHandler', (StubHandler,),
+                   {'latency': latency, 'fail_rate': fail_rate, 'fail_status': fail_status})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini generateContent API.")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds added to every response.")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests answered with --fail-status.")
+    parser.add_argument('--fail-status', type=int, default=503, help="429/5xx are retried by Gemini.py, 4xx are not.")
+    args = parser.parse_args()
+
+    server, url = start_stub(args.port, args.latency, args.fail_rate, args.fail_status)
+    print(f"Gemini stub listening on {url} (GEMINI_BASE_URL={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
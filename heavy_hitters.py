@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import glob
+import time
+import zlib
+import heapq
+import socket
+import base64
+import hashlib
+import argparse
+import threading
+from array import array
+
+from categories import CATEGORIES
+
+# --- Sketch Configuration ---
+# Fixed memory per window: SKETCH_DEPTH x SKETCH_WIDTH uint32 counters (64 KiB)
+# plus TOPK_CAPACITY candidates, however many distinct strings the stream has.
+SKETCH_WIDTH = int(os.environ.get('SKETCH_WIDTH', 4096))
+SKETCH_DEPTH = int(os.environ.get('SKETCH_DEPTH', 4))
+TOPK_CAPACITY = int(os.environ.get('TOPK_CAPACITY', 200))
+# "Trending now" is the last TRENDING_WINDOWS windows of WINDOW_SECONDS each (1 hour)
+WINDOW_SECONDS = int(os.environ.get('TRENDING_WINDOW_SECONDS', 300))
+TRENDING_WINDOWS = int(os.environ.get('TRENDING_WINDOWS', 12))
+# Workers dump their sketches here; app.py merges every file for /api/trending
+HEAVY_HITTERS_DIR = os.environ.get('HEAVY_HITTERS_DIR', 'heavy_hitters')
+# How often the app re-reads the dumps
+CHECK_INTERVAL = 5.0
+# A dump not rewritten for this long only holds expired windows (its process is gone);
+# readers skip it and remove it
+DUMP_MAX_AGE = WINDOW_SECONDS * TRENDING_WINDOWS
+
+
+def process_source(prefix):
+    """
+    Dump name unique to this process ("extraction_worker-host-1234"), so workers
+    running side by side, or one after another per category, never overwrite
+    each other's windows; the reader merges them all.
+    """
+    return f"{prefix}-{socket.gethostname()}-{os.getpid()}"
+
+
+def _columns(key, depth, width):
+    """
+    One counter per row, each from its own 32 bits of a blake2b digest.
+    Python's hash() is salted per process, and sketches from different workers
+    must agree. Double hashing (h1 + row * h2) is not used: with a power-of-two
+    width, two keys that share the low bits of h1 and h2 collide in every row.
+    """
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * depth).digest()
+    return [row * width + int.from_bytes(digest[4 * row:4 * row + 4], 'little') % width for row in range(depth)]
+
+
+def _pack(counters):
+    return base64.b64encode(zlib.compress(counters.tobytes())).decode('ascii')
+
+
+def _unpack(text):
+    counters = array('I')
+    counters.frombytes(zlib.decompress(base64.b64decode(text)))
+    return counters
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch with conservative update (only the rows at the current
+    minimum are raised). Estimates never undercount. Two sketches of the same
+    shape merge by adding counters.
+    """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = array('I', bytes(4 * width * depth))
+        self.total = 0
+
+    def add(self, key, count=1):
+        """Counts `key` and returns its new estimate."""
+        columns = _columns(key, self.depth, self.width)
+        counters = self.counters
+        estimate = min(counters[column] for column in columns) + count
+        for column in columns:
+            if counters[column] < estimate:
+                counters[column] = estimate
+        self.total += count
+        return estimate
+
+    def estimate(self, key):
+        counters = self.counters
+        return min(counters[column] for column in _columns(key, self.depth, self.width))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches with the same width and depth can be merged")
+        self.counters = array('I', (a + b for a, b in zip(self.counters, other.counters)))
+        self.total += other.total
+
+    @property
+    def nbytes(self):
+        return self.counters.itemsize * len(self.counters)
+
+
+class HeavyHitters:
+    """
+    Space-Saving candidate set of fixed capacity on top of a Count-Min sketch:
+    the sketch counts every key, and the candidates keep the `capacity` keys
+    with the highest estimates. A key that is not a candidate replaces the
+    smallest one once its estimate is higher. The sketch remembers evicted
+    keys' counts, so a key that comes back resumes from its full estimate.
+    """
+
+    def __init__(self, capacity=TOPK_CAPACITY, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.capacity = capacity
+        self.sketch = CountMinSketch(width, depth)
+        self.counts = {}
+        # Lazy min-heap: at most one (count, key) entry per candidate, possibly stale (too low)
+        self._heap = []
+
+    def _min_candidate(self):
+        heap, counts = self._heap, self.counts
+        while heap:
+            count, key = heap[0]
+            current = counts.get(key)
+            if current is None:
+                heapq.heappop(heap)
+            elif current != count:
+                heapq.heapreplace(heap, (current, key))
+            else:
+                return count, key
+        return None
+
+    def add(self, key, count=1):
+        estimate = self.sketch.add(key, count)
+        if key in self.counts:
+            self.counts[key] = estimate
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+        else:
+            smallest, evicted = self._min_candidate()
+            if estimate > smallest:
+                del self.counts[evicted]
+                self.counts[key] = estimate
+                heapq.heapreplace(self._heap, (estimate, key))
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def top(self, k=30):
+        """[(key, estimated count)], highest first (ties by key)."""
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def merge(self, other):
+        """
+        Adds another summary's counts: the sketches are summed and every
+        candidate of either side is re-estimated against the merged sketch.
+        """
+        self.sketch.merge(other.sketch)
+        keys = set(self.counts) | set(other.counts)
+        estimates = sorted(((self.sketch.estimate(key), key) for key in keys), reverse=True)[:self.capacity]
+        self.counts = {key: count for count, key in estimates}
+        self._heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    @property
+    def nbytes(self):
+        """Sketch counters plus a rough size of the candidate strings."""
+        return self.sketch.nbytes + sum(sys.getsizeof(key) + 28 for key in self.counts)
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'width': self.sketch.width, 'depth': self.sketch.depth,
+                'total': self.sketch.total, 'counters': _pack(self.sketch.counters), 'candidates': self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data['capacity'], data['width'], data['depth'])
+        summary.sketch.counters = _unpack(data['counters'])
+        summary.sketch.total = data['total']
+        summary.counts = dict(data['candidates'])
+        summary._heap = [(count, key) for key, count in summary.counts.items()]
+        heapq.heapify(summary._heap)
+        return summary
+
+
+class TrendingWindows:
+    """
+    HeavyHitters per (category, WINDOW_SECONDS window of post creation time),
+    keeping only the last TRENDING_WINDOWS windows. Mentions older than that
+    (backfills) are ignored. Dumped as JSON so the app can merge every
+    worker's windows into one "trending now" list.
+    """
+
+    def __init__(self, source, window_seconds=WINDOW_SECONDS, windows=TRENDING_WINDOWS,
+                 capacity=TOPK_CAPACITY):
+        self.source = source
+        self.window_seconds = window_seconds
+        self.windows = windows
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._summaries = {}
+
+    def add(self, category, names, created=None):
+        """Counts one post's normalized mentions; `created` is its epoch time (default: now)."""
+        now_window = int(time.time() // self.window_seconds)
+        window = min(int((created or time.time()) // self.window_seconds), now_window)
+        if window < now_window - self.windows + 1:
+            return
+        with self._lock:
+            key = (category, window)
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = HeavyHitters(self.capacity)
+                self._prune(now_window)
+            summary.update(names)
+
+    def _prune(self, now_window):
+        oldest = now_window - self.windows + 1
+        for key in [key for key in self._summaries if key[1] < oldest]:
+            del self._summaries[key]
+
+    def dump(self, directory=HEAVY_HITTERS_DIR):
+        """Writes <directory>/<source>.json atomically, like MetricsRegistry.dump()."""
+        with self._lock:
+            self._prune(int(time.time() // self.window_seconds))
+            data = {'source': self.source, 'window_seconds': self.window_seconds, 'written_at': time.time(),
+                    'windows': [{'category': category, 'window': window, 'summary': summary.to_dict()}
+                                for (category, window), summary in self._summaries.items()]}
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.source}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return path
+
+
+def merge_trending(dumps, category=None, windows=TRENDING_WINDOWS, now=None):
+    """
+    Merges the recent windows of every dump (all categories if `category` is
+    None) into one HeavyHitters, or None when there is nothing recent.
+    """
+    merged = None
+    now = now or time.time()
+    for data in dumps:
+        oldest = int(now // data['window_seconds']) - windows + 1
+        for entry in data['windows']:
+            if entry['window'] < oldest or (category and entry['category'] != category):
+                continue
+            summary = HeavyHitters.from_dict(entry['summary'])
+            merged = summary if merged is None else merged.merge(summary)
+    return merged
+
+
+def load_dumps(directory=HEAVY_HITTERS_DIR, max_age=DUMP_MAX_AGE):
+    """Every dump written in the last `max_age` seconds; older ones are deleted."""
+    dumps = []
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if now - data.get('written_at', 0) > max_age:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        dumps.append(data)
+    return dumps
+
+
+class TrendingReader:
+    """
+    The app's view of the dumps: re-read at most every CHECK_INTERVAL seconds,
+    merged once per category in between.
+    """
+
+    def __init__(self, directory=HEAVY_HITTERS_DIR, check_interval=CHECK_INTERVAL):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._merged = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def top(self, category=None, k=30):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_check >= self.check_interval:
+                self._dumps = load_dumps(self.directory)
+                self._merged = {}
+                self._last_check = now
+            if category not in self._merged:
+                self._merged[category] = merge_trending(self._dumps, category)
+            merged = self._merged[category]
+        if merged is None:
+            return []
+        total = merged.sketch.total
+        return [{'name': name, 'mentions': count, 'share': round(count / total, 4) if total else 0.0}
+                for name, count in merged.top(k)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Live top-K products from the workers' heavy-hitter sketches.")
+    parser.add_argument('--category', default=None, choices=sorted(CATEGORIES), help="Default: all categories.")
+    parser.add_argument('-k', type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = TrendingReader().top(args.category, args.k)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if not rows:
+        print(f"Nothing in the last {TRENDING_WINDOWS * WINDOW_SECONDS // 60} minutes. "
+              "Run the extraction worker or the streaming pipeline.")
+    for rank, row in enumerate(rows, 1):
+        print(f"{rank:>3}. {row['name']:<35} {row['mentions']:>7}  {row['share']:.1%}")
+    print(f"Merged sketches in {elapsed_ms:.2f} ms")
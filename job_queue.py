@@ -0,0 +1,163 @@
+import os
+import time
+import sqlite3
+import threading
+
+# --- Queue Configuration ---
+# Collectors enqueue new post ids here; extraction_worker.py drains it.
+QUEUE_PATH = os.environ.get('EXTRACTION_QUEUE_PATH', 'extraction_queue.db')
+# A job claimed longer ago than this is assumed to belong to a dead worker
+STALE_AFTER_SECONDS = 600
+# Collectors enqueue whether or not a worker runs. Pending jobs nobody claimed for this
+# long are dropped; their posts stay unextracted, so `extraction_worker.py --enqueue-missing`
+# queues them again. Done/failed jobs are kept for a day for counts() and debugging.
+PENDING_MAX_AGE = int(os.environ.get('EXTRACTION_QUEUE_MAX_AGE', 7 * 86400))
+FINISHED_MAX_AGE = 86400
+PRUNE_INTERVAL = 300
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of (category, post_id) extraction jobs. Jobs move
+    pending -> running -> done, or back to pending with a backoff delay when
+    they fail, until `max_attempts` is reached and they are marked failed.
+    enqueue() prunes old jobs every PRUNE_INTERVAL seconds so the table stays
+    bounded when no worker drains it.
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_job ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " category TEXT NOT NULL,"
+            " post_id TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " enqueued_at REAL NOT NULL,"
+            " available_at REAL NOT NULL,"
+            " claimed_at REAL,"
+            " last_error TEXT,"
+            " UNIQUE (category, post_id))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_extraction_job_status ON extraction_job (status, available_at)"
+        )
+
+    def enqueue(self, category, post_ids):
+        """Adds jobs for the given posts; posts already queued are reset to pending."""
+        now = time.time()
+        rows = [(category, post_id, now, now) for post_id in post_ids]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO extraction_job (category, post_id, enqueued_at, available_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (category, post_id) DO UPDATE SET "
+                    " status = 'pending', attempts = 0, enqueued_at = excluded.enqueued_at,"
+                    " available_at = excluded.available_at, last_error = NULL "
+                    "WHERE extraction_job.status != 'running'",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self.prune()
+        return len(rows)
+
+    def prune(self, pending_max_age=PENDING_MAX_AGE, finished_max_age=FINISHED_MAX_AGE):
+        """Deletes pending jobs nobody claimed in time and old done/failed jobs; returns how many."""
+        now = time.time()
+        with self._lock:
+            self._last_prune = now
+            cur = self._conn.execute(
+                "DELETE FROM extraction_job WHERE (status = 'pending' AND available_at < ?) "
+                "OR (status IN ('done', 'failed') AND available_at < ?)",
+                (now - pending_max_age, now - finished_max_age),
+            )
+        return cur.rowcount
+
+    def claim(self, limit, categories=None):
+        """Atomically marks up to `limit` available jobs as running and returns them."""
+        now = time.time()
+        query = "SELECT id, category, post_id, attempts, enqueued_at FROM extraction_job WHERE status = 'pending' AND available_at <= ?"
+        params = [now]
+        if categories:
+            query += f" AND category IN ({', '.join('?' for _ in categories)})"
+            params.extend(categories)
+        query += " ORDER BY available_at, id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                jobs = self._conn.execute(query, params).fetchall()
+                self._conn.executemany(
+                    "UPDATE extraction_job SET status = 'running', claimed_at = ? WHERE id = ?",
+                    [(now, job[0]) for job in jobs],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [{'id': j[0], 'category': j[1], 'post_id': j[2], 'attempts': j[3], 'enqueued_at': j[4]}
+                for j in jobs]
+
+    def complete(self, job_ids):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE extraction_job SET status = 'done', last_error = NULL WHERE id = ?",
+                [(job_id,) for job_id in job_ids],
+            )
+
+    def fail(self, job_ids, error, max_attempts=3, backoff_seconds=5.0):
+        """Schedules a retry with exponential backoff, or marks the job failed for good."""
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                row = self._conn.execute("SELECT attempts FROM extraction_job WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                status = 'failed' if attempts >= max_attempts else 'pending'
+                self._conn.execute(
+                    "UPDATE extraction_job SET status = ?, attempts = ?, available_at = ?, last_error = ? WHERE id = ?",
+                    (status, attempts, now + backoff_seconds * 2 ** (attempts - 1), str(error)[:500], job_id),
+                )
+
+    def release(self, job_ids):
+        """Returns claimed jobs to the queue untouched (used on graceful shutdown)."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE extraction_job SET status = 'pending', claimed_at = NULL WHERE id = ? AND status = 'running'",
+                [(job_id,) for job_id in job_ids],
+            )
+
+    def requeue_stale(self, older_than=STALE_AFTER_SECONDS):
+        """Puts back jobs left 'running' by a worker that died mid-batch."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE extraction_job SET status = 'pending', claimed_at = NULL "
+                "WHERE status = 'running' AND claimed_at < ?",
+                (time.time() - older_than,),
+            )
+        return cur.rowcount
+
+    def counts(self):
+        rows = self._conn.execute(
+            "SELECT category, status, COUNT(*) FROM extraction_job GROUP BY category, status"
+        ).fetchall()
+        counts = {}
+        for category, status, count in rows:
+            counts.setdefault(category, {})[status] = count
+        return counts
+
+    def close(self):
+        self._conn.close()
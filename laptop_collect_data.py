@@ -1,8 +1,14 @@
+import sys
 import praw
 import datetime as dt
 import re
 import nltk
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from job_queue import JobQueue
+from reddit_fetch import RedditFetcher, FetchError
+from comment_ingest import COLLECT_COMMENTS, collect_comments
+from schema import ensure_columns
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import json
@@ -28,6 +34,7 @@ class RedditPost(laptop_db.Model):
     sentiment_compound = laptop_db.Column(laptop_db.Float, nullable=True)
     sentiment_label = laptop_db.Column(laptop_db.String(50), nullable=True)
     extracted_laptops = laptop_db.Column(laptop_db.Text, nullable=True)  # JSON string list
+    mention_sentiment = laptop_db.Column(laptop_db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
 
     @property
     def laptops(self):
@@ -45,9 +52,47 @@ class RedditPost(laptop_db.Model):
     def __repr__(self):
         return f"<Laptop Post ID: {self.id}>"
 
+class RedditComment(laptop_db.Model):
+    id = laptop_db.Column(laptop_db.String, primary_key=True)
+    post_id = laptop_db.Column(laptop_db.String, laptop_db.ForeignKey('reddit_post.id'), nullable=False, index=True)
+    parent_id = laptop_db.Column(laptop_db.String, nullable=True)
+    depth = laptop_db.Column(laptop_db.Integer, nullable=False, default=0)
+    body = laptop_db.Column(laptop_db.Text, nullable=False)
+    score = laptop_db.Column(laptop_db.Integer, nullable=False)
+    created = laptop_db.Column(laptop_db.DateTime, nullable=False)
+    cleaned_body = laptop_db.Column(laptop_db.Text, nullable=True)
+    sentiment_compound = laptop_db.Column(laptop_db.Float, nullable=True)
+    sentiment_label = laptop_db.Column(laptop_db.String(50), nullable=True)
+    extracted_laptops = laptop_db.Column(laptop_db.Text, nullable=True)  # Same JSON list format as posts
+    mention_sentiment = laptop_db.Column(laptop_db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
+
+    post = laptop_db.relationship('RedditPost', backref=laptop_db.backref('comments', lazy='dynamic'))
+
+    # Comments have no title; these let them go through laptop_bert.extract_posts() as-is
+    @property
+    def title(self):
+        return ''
+
+    @property
+    def cleaned_title(self):
+        return None
+
+    @property
+    def laptops(self):
+        if self.extracted_laptops:
+            try:
+                return json.loads(self.extracted_laptops)
+            except json.JSONDecodeError:
+                return []
+        return []
+
+    def __repr__(self):
+        return f"<Laptop Comment ID: {self.id} on {self.post_id}>"
+
 # Create tables if they don't exist
 with laptop_app.app_context():
     laptop_db.create_all()
+    ensure_columns(laptop_db, RedditPost, RedditComment)
 
 # NLTK setup (same lightweight checks as other collector)
 try:
@@ -94,16 +139,6 @@ def clean_text(text):
     cleaned_tokens = [lemmatizer.lemmatize(word) for word in tokens if word not in stop_words]
     return ' '.join(cleaned_tokens)
 
-# Reddit API credentials (re-using existing credentials in the repo)
-reddit = praw.Reddit(
-    client_id="",
-    client_secret="",
-    user_agent="",
-    username="",
-    password="",
-)
-print("Authenticated to Reddit for laptop collector.")
-
 # Top 10 laptop-related subreddits (a reasonable selection)
 target_subreddits = [
     'laptops',
@@ -119,43 +154,86 @@ target_subreddits = [
 ]
 
 post_limit = 1000  # per-subreddit fetch limit (same pattern as phones collector)
-new_posts = []
 
-print("Fetching laptop-related posts and preparing to insert into laptop_reddit_posts.db...")
-with laptop_app.app_context():
-    # load existing ids from the laptop DB to avoid duplicates
-    existing_post_ids = {post.id for post in RedditPost.query.with_entities(RedditPost.id).all()}
-
-    for sub in target_subreddits:
-        try:
-            subreddit = reddit.subreddit(sub)
-            for post in subreddit.new(limit=post_limit):
-                if post.id not in existing_post_ids:
-                    compound, label = get_sentiment(post.title)
-                    new_post = RedditPost(
-                        id=post.id,
-                        subreddit=sub,
-                        title=post.title,
-                        score=post.score,
-                        url=post.url,
-                        num_comments=post.num_comments,
-                        body=post.selftext,
-                        created=dt.datetime.fromtimestamp(post.created_utc),
-                        cleaned_title=clean_text(post.title),
-                        cleaned_body=clean_text(post.selftext),
-                        sentiment_compound=compound,
-                        sentiment_label=label,
-                        extracted_laptops=None
-                    )
-                    new_posts.append(new_post)
-                    existing_post_ids.add(post.id)
-        except Exception as e:
-            print(f"Could not process subreddit r/{sub}. Error: {e}")
-
-if new_posts:
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('laptop_collect')
+
+# Reddit API credentials (re-using existing credentials in the repo)
+def get_reddit_client():
+    return praw.Reddit(
+        client_id="",
+        client_secret="",
+        user_agent="",
+        username="",
+        password="",
+    )
+
+def collect_posts(with_comments=COLLECT_COMMENTS):
+    """Fetches new laptop posts from every target subreddit and inserts them into laptop_reddit_posts.db."""
+    reddit = get_reddit_client()
+    print("Authenticated to Reddit for laptop collector.")
+
+    fetcher = RedditFetcher(reddit, registry=registry, category='laptop')
+    queue = JobQueue()
+    new_post_ids = []
+
+    print("Fetching laptop-related posts and preparing to insert into laptop_reddit_posts.db...")
     with laptop_app.app_context():
-        laptop_db.session.add_all(new_posts)
-        laptop_db.session.commit()
-    print(f"Inserted {len(new_posts)} new laptop posts into laptop_reddit_posts.db")
-else:
-    print("No new laptop posts found to insert.")
+        # load existing ids from the laptop DB to avoid duplicates
+        existing_post_ids = {post.id for post in RedditPost.query.with_entities(RedditPost.id).all()}
+
+        for sub in target_subreddits:
+            try:
+                # Each page is committed and queued before the next request, so a failure
+                # halfway through a subreddit (or the run) keeps what was already fetched
+                for submissions in fetcher.new_posts(sub, limit=post_limit):
+                    new_posts = []
+                    for post in submissions:
+                        if post.id not in existing_post_ids:
+                            with registry.time_stage('sentiment', items=1, category='laptop'):
+                                compound, label = get_sentiment(post.title)
+                            with registry.time_stage('clean', items=1, category='laptop'):
+                                cleaned_title = clean_text(post.title)
+                                cleaned_body = clean_text(post.selftext)
+                            new_post = RedditPost(
+                                id=post.id,
+                                subreddit=sub,
+                                title=post.title,
+                                score=post.score,
+                                url=post.url,
+                                num_comments=post.num_comments,
+                                body=post.selftext,
+                                created=dt.datetime.fromtimestamp(post.created_utc),
+                                cleaned_title=cleaned_title,
+                                cleaned_body=cleaned_body,
+                                sentiment_compound=compound,
+                                sentiment_label=label,
+                                extracted_laptops=None
+                            )
+                            new_posts.append(new_post)
+                            existing_post_ids.add(post.id)
+                    if new_posts:
+                        page_ids = [post.id for post in new_posts]
+                        with registry.time_stage('db_write', items=len(new_posts), category='laptop'):
+                            laptop_db.session.add_all(new_posts)
+                            laptop_db.session.commit()
+                        registry.inc('posts_ingested_total', len(new_posts), category='laptop')
+                        # Hand the new posts to extraction_worker.py, if one is running
+                        queue.enqueue('laptop', page_ids)
+                        new_post_ids.extend(page_ids)
+            except FetchError as e:
+                # Retries are done by now: the subreddit is unavailable or Reddit kept failing
+                print(f"Could not process subreddit r/{sub}. Error: {e}")
+
+    if new_post_ids:
+        print(f"Inserted {len(new_post_ids)} new laptop posts into laptop_reddit_posts.db")
+        if with_comments:
+            collect_comments('laptop', new_post_ids, collector=sys.modules[__name__], registry=registry)
+    else:
+        print("No new laptop posts found to insert.")
+
+    registry.dump()
+    log_stage_summary(registry)
+
+if __name__ == '__main__':
+    collect_posts()
@@ -4,6 +4,12 @@ from collections import Counter
 import os
 import sys
 import nltk
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from entity_resolution import get_resolver
+from mention_sentiment import sentiment_shares, format_shares
+from compact_posts import load_compact, describe
+from trend_history import TrendHistory
+from schema import ensure_columns
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
@@ -29,6 +35,7 @@ class RedditPost(laptop_db.Model):
     sentiment_compound = laptop_db.Column(laptop_db.Float, nullable=True)
     sentiment_label = laptop_db.Column(laptop_db.String(50), nullable=True)
     extracted_laptops = laptop_db.Column(laptop_db.Text, nullable=True)
+    mention_sentiment = laptop_db.Column(laptop_db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
 
     @property
     def laptops(self):
@@ -39,6 +46,10 @@ class RedditPost(laptop_db.Model):
                 return []
         return []
 
+# Older databases predate the mention_sentiment column
+with laptop_app.app_context():
+    ensure_columns(laptop_db, RedditPost)
+
 # --- NLTK Configuration ---
 try:
     nltk.data.find('tokenizers/punkt')
@@ -92,6 +103,9 @@ PATTERN_MAP = {
     r"^(razer)? ?blade ?(stealth|advanced)? ?(\d{2})?$": lambda m: f"Razer Blade {m.group(3) if m.group(3) else ''}{' ' + m.group(2).title() if m.group(2) else ''}".strip(),
 }
 
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('laptop_normalize')
+
 def filter_with_nltk_pos(mentions):
     """
     Filters a list of mentions, keeping only those that are likely product names
@@ -130,34 +144,59 @@ def normalize_laptop_list(laptop_list):
                 break
         if not is_matched and len(clean_name) > 3:
             # Basic title case for unmatched items as a fallback
-            normalized_names.append(name.title())
+            # Otherwise the product catalog, opened on first use so importing this module
+            # creates no catalog DB
+            normalized_names.append(get_resolver('laptop').resolve(name) or name.title())
     return normalized_names
 
 def analyze_and_print_trends():
     """
     Main function to fetch, filter, normalize, and print laptop trends.
     """
-    all_extracted_laptops = []
     print("Connecting to laptop database and fetching extracted data...")
-    with laptop_app.app_context():
-        # Query the RedditPost model from the laptop database
-        posts = RedditPost.query.filter(RedditPost.extracted_laptops.isnot(None)).all()
-        for post in posts:
-            # The property is named 'laptops' in the model
-            all_extracted_laptops.extend(post.laptops)
-    
+    with laptop_app.app_context(), registry.time_stage('load', category='laptop') as batch:
+        # Only the mention columns, interned into flat arrays (see compact_posts.py)
+        posts = load_compact(RedditPost, 'extracted_laptops')
+        batch.items = len(posts)
+    print(describe(posts))
+    all_extracted_laptops = posts.mention_names()
+
     print(f"Found a total of {len(all_extracted_laptops)} raw laptop mentions to process.")
 
     # Step 1: NLTK Filtering
     print("\nStep 1: Filtering mentions with NLTK Part-of-Speech tagging...")
-    product_candidates = filter_with_nltk_pos(all_extracted_laptops)
+    with registry.time_stage('pos_filter', items=len(all_extracted_laptops), category='laptop'):
+        product_candidates = filter_with_nltk_pos(all_extracted_laptops)
     print(f"--> Kept {len(product_candidates)} candidates after NLTK filtering.")
     
     # Step 2: Normalization
     print("\nStep 2: Normalizing candidates with regex and custom rules...")
-    final_list = normalize_laptop_list(product_candidates)
+    with registry.time_stage('normalize', items=len(product_candidates), category='laptop'):
+        final_list = normalize_laptop_list(product_candidates)
     
     trend_counts = Counter(final_list)
+
+    # Per-mention sentiment goes through the same filter and normalization, once per raw name
+    canonical_names = {}
+    def canonical(name):
+        if name not in canonical_names:
+            normalized = normalize_laptop_list(filter_with_nltk_pos([name]))
+            canonical_names[name] = normalized[0] if normalized else None
+        return canonical_names[name]
+    with registry.time_stage('mention_sentiment', category='laptop'):
+        shares = sentiment_shares(posts.sentiment_pairs(), canonical)
+    # Append this run's ranking for /api/trends/history (see trend_history.py)
+    if trend_counts:
+        with registry.time_stage('history', items=len(trend_counts), category='laptop'):
+            trend_history = TrendHistory()
+            trend_history.record('laptop', trend_counts, shares)
+            trend_history.close()
+
+    registry.dump()
+    log_stage_summary(registry)
+    resolver = get_resolver('laptop')
+    resolver.flush()
+    print(resolver.report())
     
     print("\n--- Top 20 Final Laptop Trends ---")
     print("-" * 55)
@@ -166,10 +205,11 @@ def analyze_and_print_trends():
         print("No definitive product trends could be identified after cleaning.")
         return
 
-    print(f"{'Rank':<5} | {'Laptop Model':<35} | {'Mentions'}")
-    print("-" * 55)
+    print(f"{'Rank':<5} | {'Laptop Model':<35} | {'Mentions':>8} | {'Pos%':>5} | {'Neg%':>5}")
+    print("-" * 70)
     for i, (model, count) in enumerate(trend_counts.most_common(30), 1):
-        print(f"{i:<5} | {model:<35} | {count}")
+        positive, negative = format_shares(shares.get(model))
+        print(f"{i:<5} | {model:<35} | {count:>8} | {positive:>5} | {negative:>5}")
 
 if __name__ == '__main__':
     analyze_and_print_trends()
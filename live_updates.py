@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+
+from pipeline_metrics import log_event
+
+# --- Live Update Configuration ---
+# How often the broadcaster checks for a newly published snapshot (one check per
+# process, however many clients are connected)
+CHECK_INTERVAL = float(os.environ.get('LIVE_CHECK_INTERVAL', 1.0))
+# SSE comment sent to idle connections so proxies don't time them out
+KEEPALIVE_SECONDS = 15
+# Messages a client may fall behind by before it is dropped (its browser reconnects
+# and starts over from the full ranking)
+MAX_PENDING = 16
+RETRY_MS = 3000
+
+
+def sse_message(event, data, event_id=None):
+    """One Server-Sent Events message, encoded once and written to every client as is."""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def _ranking(payload):
+    """The /api/trends payload as [(name, mentions)], empty for the "no trends yet" message."""
+    return [(name, count) for name, count in payload] if isinstance(payload, list) else []
+
+
+def ranking_diff(before, after):
+    """
+    What changed between two rankings: products that are new or whose rank or
+    mentions moved, and products that dropped out.
+    """
+    previous = {name: (rank, count) for rank, (name, count) in enumerate(before, 1)}
+    changes = []
+    for rank, (name, count) in enumerate(after, 1):
+        rank_before, count_before = previous.pop(name, (None, 0))
+        if rank != rank_before or count != count_before:
+            changes.append({'name': name, 'rank': rank, 'rank_before': rank_before,
+                            'mentions': count, 'mentions_before': count_before})
+    return {'changes': changes, 'removed': sorted(previous)}
+
+
+class _LoopQueue:
+    """
+    Subscriber queue for an asyncio client. publish() runs in the watcher thread,
+    so messages are handed to the client's event loop instead of put directly.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+        except RuntimeError:
+            # The loop is closed (server shutting down); nobody is reading anymore
+            pass
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+class TrendBroadcaster:
+    """
+    In-process fan-out of /api/trends updates to Server-Sent Events clients.
+    One thread watches the serving snapshot the pipelines publish; when a new
+    version lands it computes the ranking diff once, encodes it once and
+    hands the same bytes to every subscriber's queue.
+    """
+
+    def __init__(self, reader, key='trends', check_interval=CHECK_INTERVAL, max_pending=MAX_PENDING):
+        self.reader = reader
+        self.key = key
+        self.check_interval = check_interval
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._version = None
+        self._ranking = []
+        # Full ranking for newly connected clients, encoded once per version
+        self._ranking_message = None
+
+    def _load(self):
+        body = self.reader.body(self.key)
+        return _ranking(json.loads(body)) if body is not None else []
+
+    def _start(self):
+        if self._thread is None:
+            self._version = self.reader.version
+            self._ranking = self._load()
+            self._ranking_message = sse_message('ranking', {'version': self._version, 'ranking': self._ranking},
+                                                self._version)
+            self._thread = threading.Thread(target=self._watch, name='trend-broadcaster', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, last_event_id=None, client=None):
+        """
+        Registers a client; returns (queue of encoded messages, first message).
+        The first message is the full ranking, or None when the client's
+        Last-Event-ID shows it already has the current version.
+        """
+        # Unbounded so the "you're dropped" marker always fits; publish() enforces max_pending
+        if client is None:
+            client = queue.Queue()
+        with self._lock:
+            self._start()
+            self._subscribers.add(client)
+            current = self._ranking_message if str(self._version) != last_event_id else None
+        return client, current
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._subscribers.discard(client)
+
+    @property
+    def clients(self):
+        return len(self._subscribers)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                version = self.reader.version
+                if version is None or version == self._version:
+                    continue
+                ranking = self._load()
+                self.publish(version, ranking)
+            except Exception as e:
+                log_event('trend_broadcast_failed', error=str(e))
+
+    def publish(self, version, ranking):
+        """Sends the diff against the last published ranking to every client."""
+        diff = ranking_diff(self._ranking, ranking)
+        message = sse_message('diff', dict(version=version, **diff), version)
+        with self._lock:
+            self._version, self._ranking = version, ranking
+            self._ranking_message = sse_message('ranking', {'version': version, 'ranking': ranking}, version)
+            if not diff['changes'] and not diff['removed']:
+                return 0
+            dropped = [client for client in self._subscribers if client.qsize() >= self.max_pending]
+            for client in dropped:
+                # Too far behind: end its stream (None) instead of buffering for it
+                self._subscribers.discard(client)
+                client.put(None)
+            for client in self._subscribers:
+                client.put(message)
+            sent = len(self._subscribers)
+        if dropped:
+            log_event('trend_broadcast_dropped', clients=len(dropped))
+        return sent
+
+    def stream(self, last_event_id=None, keepalive=KEEPALIVE_SECONDS):
+        """
+        Generator of SSE bytes for one client; ends when it is dropped. It blocks
+        its thread between messages, so only serve it from a thread per request
+        (python app.py); serve.py uses stream_async() instead.
+        """
+        client, first = self.subscribe(last_event_id)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+            if first is not None:
+                yield first
+            while True:
+                try:
+                    message = client.get(timeout=keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(client)
+
+    async def stream_async(self, last_event_id=None, keepalive=KEEPALIVE_SECONDS):
+        """stream() for asyncio servers: waits on the event loop, so an open stream holds no thread."""
+        client, first = self.subscribe(last_event_id, _LoopQueue(asyncio.get_running_loop()))
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+            if first is not None:
+                yield first
+            while True:
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(client)
@@ -0,0 +1,96 @@
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+# --- Load Test Configuration ---
+DEFAULT_ENDPOINTS = ['/api/trends', '/api/reddit-posts']
+DEFAULT_CONCURRENCY = 32
+DEFAULT_DURATION = 20.0
+WARMUP_SECONDS = 2.0
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 3)
+
+
+def run_endpoint(base_url, path, concurrency, duration):
+    """
+    Hammers one endpoint from `concurrency` threads, each holding a keep-alive
+    connection, and returns throughput and latency for the measured window.
+    """
+    parts = urlsplit(base_url)
+    samples = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_at = time.monotonic() + WARMUP_SECONDS
+    stop_at = start_at + duration
+
+    def client(slot):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            elapsed = time.monotonic() - now
+            if now >= start_at:
+                if ok:
+                    samples[slot].append(elapsed)
+                else:
+                    errors[slot] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(slot,), daemon=True) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(latency for slot in samples for latency in slot)
+    return {
+        'endpoint': path,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_sec': round(len(latencies) / duration, 1),
+        'p50_ms': _percentile(latencies, 0.50),
+        'p95_ms': _percentile(latencies, 0.95),
+        'p99_ms': _percentile(latencies, 0.99),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sustained-concurrency load test for the trends API.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--endpoints', nargs='+', default=DEFAULT_ENDPOINTS)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[DEFAULT_CONCURRENCY])
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="Measured seconds per run.")
+    parser.add_argument('--output', default=None, help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'Endpoint':<22} | {'Conc':>5} | {'Req/s':>9} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | Errors")
+    print("-" * 86)
+    for path in args.endpoints:
+        for concurrency in args.concurrency:
+            result = run_endpoint(args.url, path, concurrency, args.duration)
+            results.append(result)
+            print(f"{path:<22} | {concurrency:>5} | {result['requests_per_sec']:>9} | {result['p50_ms']!s:>8} | "
+                  f"{result['p95_ms']!s:>8} | {result['p99_ms']!s:>8} | {result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': args.url, 'duration': args.duration, 'results': results}, f, indent=2)
+        print(f"Wrote results to {args.output}")
@@ -0,0 +1,148 @@
+import re
+import json
+from bisect import bisect_right
+from collections import defaultdict
+
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+# --- Mention Sentiment Configuration ---
+SENTENCE_RE = re.compile(r'[^.!?\n]+[.!?]*')
+# Where a sentence is split between two products: "Pixel is great, but the iPhone lags"
+CLAUSE_BOUNDARY_RE = re.compile(r',|;|\bbut\b|\bwhile\b|\bwhereas\b|\bhowever\b|\bthough\b|\bvs\b\.?|\bversus\b',
+                                re.IGNORECASE)
+# Same thresholds VADER recommends; the collectors' get_sentiment() folds neutral into positive
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+# Windows repeat a lot (cross-posts, quoted titles), so scores are memoized
+SCORE_CACHE_SIZE = 100000
+
+analyzer = SentimentIntensityAnalyzer()
+_score_cache = {}
+
+
+def _occurrences(text, names, spans):
+    """
+    Every (mention index, start, end) we can place in the text, from the NER
+    spans (ner_spans.span_offsets) or a text search; unplaced mentions get none.
+    """
+    by_name = defaultdict(list)
+    for name, start, end in spans:
+        by_name[name.lower()].append((start, end))
+    lowered = text.lower()
+    occurrences = []
+    for k, name in enumerate(names):
+        found = by_name.get(name.lower().strip())
+        if not found:
+            # Gazetteer/merged mentions have no offsets; fall back to a text search
+            position = lowered.find(name.lower().strip())
+            found = [(position, position + len(name.strip()))] if position >= 0 else []
+        occurrences.extend((k, start, end) for start, end in found)
+    return occurrences
+
+
+def mention_windows(text, names, spans=()):
+    """
+    Returns, per mention, the list of text windows its sentiment is read from:
+    the sentence around each occurrence, split at clause boundaries between
+    products sharing the sentence. Mentions we cannot place get the whole text.
+    """
+    sentences = [(m.start(), m.end()) for m in SENTENCE_RE.finditer(text)]
+    starts = [start for start, _ in sentences]
+    windows = [[] for _ in names]
+    by_sentence = defaultdict(list)
+    for k, start, end in _occurrences(text, names, spans):
+        index = bisect_right(starts, start) - 1
+        if index >= 0:
+            by_sentence[index].append((start, end, k))
+
+    for index, found in by_sentence.items():
+        sentence_start, sentence_end = sentences[index]
+        found.sort()
+        cuts = [sentence_start]
+        for (_, prev_end, _), (next_start, _, _) in zip(found, found[1:]):
+            boundary = None
+            for boundary in CLAUSE_BOUNDARY_RE.finditer(text, prev_end, max(prev_end, next_start)):
+                pass
+            cuts.append(boundary.start() if boundary else max(prev_end, next_start))
+        cuts.append(sentence_end)
+        for position, (_, _, k) in enumerate(found):
+            windows[k].append(text[cuts[position]:cuts[position + 1]])
+
+    return [found or [text] for found in windows]
+
+
+def score_windows(windows):
+    """VADER compound score for each window; every distinct window is scored once."""
+    missing = {window for window in windows if window not in _score_cache}
+    if len(_score_cache) + len(missing) > SCORE_CACHE_SIZE:
+        _score_cache.clear()
+    for window in missing:
+        _score_cache[window] = analyzer.polarity_scores(window)['compound']
+    return [_score_cache[window] for window in windows]
+
+
+def score_mentions_batch(texts, mention_lists, span_lists):
+    """
+    Per-mention sentiment for a batch of posts: collects every window of every
+    mention, scores them in one pass and averages per mention. Returns, per post,
+    [[mention, compound], ...] aligned with its mention list.
+    """
+    per_post = [mention_windows(text, names, spans) for text, names, spans in zip(texts, mention_lists, span_lists)]
+    flat = [window for windows in per_post for mention in windows for window in mention]
+    scores = iter(score_windows(flat))
+    results = []
+    for names, windows in zip(mention_lists, per_post):
+        pairs = []
+        for name, mention in zip(names, windows):
+            values = [next(scores) for _ in mention]
+            pairs.append([name, round(sum(values) / len(values), 4)])
+        results.append(pairs)
+    return results
+
+
+def sentiment_bucket(compound):
+    if compound >= POSITIVE_THRESHOLD:
+        return 'positive'
+    if compound <= NEGATIVE_THRESHOLD:
+        return 'negative'
+    return 'neutral'
+
+
+def sentiment_shares(mention_sentiment_values, canonical=None):
+    """
+    Aggregates stored `mention_sentiment` JSON values into
+    {product: {'mentions', 'positive', 'negative', 'neutral'}}. `canonical` maps a
+    raw mention to a product name, or to None to drop it.
+    """
+    totals = defaultdict(lambda: {'mentions': 0, 'positive': 0, 'negative': 0, 'neutral': 0})
+    for value in mention_sentiment_values:
+        try:
+            pairs = json.loads(value) if isinstance(value, str) else value
+        except json.JSONDecodeError:
+            continue
+        for name, compound in pairs or ():
+            product = canonical(name) if canonical else name
+            if not product:
+                continue
+            entry = totals[product]
+            entry['mentions'] += 1
+            entry[sentiment_bucket(compound)] += 1
+    return totals
+
+
+def share_rows(totals, limit=30):
+    """Top products by mentions with their positive/negative share, ready for JSON or printing."""
+    ranked = sorted(totals.items(), key=lambda item: item[1]['mentions'], reverse=True)[:limit]
+    return [{
+        'name': name,
+        'mentions': entry['mentions'],
+        'positive_share': round(entry['positive'] / entry['mentions'], 3),
+        'negative_share': round(entry['negative'] / entry['mentions'], 3),
+    } for name, entry in ranked]
+
+
+def format_shares(entry):
+    """(positive, negative) percentage strings for the normalize scripts' tables; '-' without data."""
+    if not entry or not entry['mentions']:
+        return '-', '-'
+    return f"{entry['positive'] / entry['mentions']:.0%}", f"{entry['negative'] / entry['mentions']:.0%}"
@@ -1,9 +1,15 @@
+import sys
 import praw
 import datetime as dt
 import re
 import nltk
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from app import app, db, RedditPost
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from job_queue import JobQueue
+from reddit_fetch import RedditFetcher, FetchError
+from comment_ingest import COLLECT_COMMENTS, collect_comments
+from serving_snapshot import publish_snapshot
+from app import app, db, RedditPost, RedditComment
 
 # NLTK setup and downloads
 try:
@@ -45,16 +51,6 @@ def clean_text(text):
     cleaned_tokens = [lemmatizer.lemmatize(word) for word in tokens if word not in stop_words]
     return ' '.join(cleaned_tokens)
 
-# Your Reddit API credentials
-reddit = praw.Reddit(
-    client_id="",
-    client_secret="",
-    user_agent="",
-    username="",
-    password="",
-)
-print("Successfully authenticated with Reddit.")
-
 target_subreddits = [
     'smartphones',
     'SuggestASmartphone',
@@ -73,36 +69,80 @@ target_subreddits = [
     'gadgetsindia'
 ]
 post_limit = 1000
-new_posts = []
-
-print("Fetching and preparing posts for database...")
-with app.app_context():
-    existing_post_ids = {post.id for post in RedditPost.query.with_entities(RedditPost.id).all()}
-
-    for sub in target_subreddits:
-        try:
-            subreddit = reddit.subreddit(sub)
-            for post in subreddit.new(limit=post_limit):
-                if post.id not in existing_post_ids:
-                    compound, label = get_sentiment(post.title)
-                    new_post = RedditPost(
-                        id=post.id, subreddit=sub, title=post.title,
-                        score=post.score, url=post.url, num_comments=post.num_comments,
-                        body=post.selftext, created=dt.datetime.fromtimestamp(post.created_utc),
-                        cleaned_title=clean_text(post.title),
-                        cleaned_body=clean_text(post.selftext),
-                        sentiment_compound=compound, sentiment_label=label,
-                        extracted_phones=None  # This is intentionally left blank
-                    )
-                    new_posts.append(new_post)
-                    existing_post_ids.add(post.id)
-        except Exception as e:
-            print(f"Could not process subreddit r/{sub}. Error: {e}")
-
-if new_posts:
+
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('mobile_collect')
+
+# Your Reddit API credentials
+def get_reddit_client():
+    return praw.Reddit(
+        client_id="",
+        client_secret="",
+        user_agent="",
+        username="",
+        password="",
+    )
+
+def collect_posts(with_comments=COLLECT_COMMENTS):
+    """Fetches new posts from every target subreddit and inserts them into the database."""
+    reddit = get_reddit_client()
+    print("Successfully authenticated with Reddit.")
+
+    fetcher = RedditFetcher(reddit, registry=registry, category='phone')
+    queue = JobQueue()
+    new_post_ids = []
+
+    print("Fetching and preparing posts for database...")
     with app.app_context():
-        db.session.add_all(new_posts)
-        db.session.commit()
-    print(f"Successfully inserted {len(new_posts)} new posts into the database.")
-else:
-    print("No new posts found to insert.")
+        existing_post_ids = {post.id for post in RedditPost.query.with_entities(RedditPost.id).all()}
+
+        for sub in target_subreddits:
+            try:
+                # Each page is committed and queued before the next request, so a failure
+                # halfway through a subreddit (or the run) keeps what was already fetched
+                for submissions in fetcher.new_posts(sub, limit=post_limit):
+                    new_posts = []
+                    for post in submissions:
+                        if post.id not in existing_post_ids:
+                            with registry.time_stage('sentiment', items=1, category='phone'):
+                                compound, label = get_sentiment(post.title)
+                            with registry.time_stage('clean', items=1, category='phone'):
+                                cleaned_title = clean_text(post.title)
+                                cleaned_body = clean_text(post.selftext)
+                            new_post = RedditPost(
+                                id=post.id, subreddit=sub, title=post.title,
+                                score=post.score, url=post.url, num_comments=post.num_comments,
+                                body=post.selftext, created=dt.datetime.fromtimestamp(post.created_utc),
+                                cleaned_title=cleaned_title,
+                                cleaned_body=cleaned_body,
+                                sentiment_compound=compound, sentiment_label=label,
+                                extracted_phones=None  # This is intentionally left blank
+                            )
+                            new_posts.append(new_post)
+                            existing_post_ids.add(post.id)
+                    if new_posts:
+                        page_ids = [post.id for post in new_posts]
+                        with registry.time_stage('db_write', items=len(new_posts), category='phone'):
+                            db.session.add_all(new_posts)
+                            db.session.commit()
+                        registry.inc('posts_ingested_total', len(new_posts), category='phone')
+                        # Hand the new posts to extraction_worker.py, if one is running
+                        queue.enqueue('phone', page_ids)
+                        new_post_ids.extend(page_ids)
+            except FetchError as e:
+                # Retries are done by now: the subreddit is unavailable or Reddit kept failing
+                print(f"Could not process subreddit r/{sub}. Error: {e}")
+
+    if new_post_ids:
+        print(f"Successfully inserted {len(new_post_ids)} new posts into the database.")
+        if with_comments:
+            collect_comments('phone', new_post_ids, collector=sys.modules[__name__], registry=registry)
+    else:
+        print("No new posts found to insert.")
+
+    publish_snapshot()
+    registry.dump()
+    log_stage_summary(registry)
+
+if __name__ == '__main__':
+    collect_posts()
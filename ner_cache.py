@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- Cache Configuration ---
+# One cache file is shared by Bert.py, laptop_bert.py and tablet_bert.py so that
+# cross-posted titles/bodies only go through the model once.
+DEFAULT_CACHE_PATH = os.environ.get('NER_CACHE_PATH', 'ner_cache.db')
+DEFAULT_MAX_ENTRIES = int(os.environ.get('NER_CACHE_MAX_ENTRIES', 200000))
+# Evict in chunks so we don't run a DELETE after every single insert
+EVICTION_BATCH = 1000
+
+
+def _to_builtin(value):
+    """Converts numpy scalars (e.g. float32 scores) into plain Python values for JSON."""
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _entry(token):
+    """One cached item: a BERT token dict, or a plain list/string from the other backends."""
+    if isinstance(token, dict):
+        return {k: _to_builtin(v) for k, v in token.items()}
+    if isinstance(token, (list, tuple)):
+        return [_to_builtin(v) for v in token]
+    return _to_builtin(token)
+
+
+class NerCache:
+    """
+    Content-addressed, size-bounded LRU cache for token-level NER output.
+    Entries are keyed by a hash of (model id, text) and stored in SQLite.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ner_cache ("
+            " key TEXT PRIMARY KEY,"
+            " model_id TEXT NOT NULL,"
+            " results TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ner_cache_last_access ON ner_cache (last_access)")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM ner_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(text, model_id):
+        return hashlib.sha256(f"{model_id}\x00{text}".encode('utf-8')).hexdigest()
+
+    def get(self, text, model_id):
+        """Returns the cached token list for this text, or None on a miss."""
+        key = self.make_key(text, model_id)
+        with self._lock:
+            row = self._conn.execute("SELECT results FROM ner_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE ner_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, text, model_id, results):
+        key = self.make_key(text, model_id)
+        payload = json.dumps([_entry(token) for token in results])
+        with self._lock:
+            now = time.time()
+            # rowcount is 1 only for a new key; overwriting an existing one (two workers missing
+            # on the same text) is an UPDATE and must not grow _size
+            cur = self._conn.execute(
+                "INSERT INTO ner_cache (key, model_id, results, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO NOTHING",
+                (key, model_id, payload, now),
+            )
+            if cur.rowcount:
+                self._size += 1
+            else:
+                self._conn.execute("UPDATE ner_cache SET results = ?, last_access = ? WHERE key = ?",
+                                   (payload, now, key))
+            if self._size > self.max_entries:
+                # Other processes share the file; only evict if it is really over the limit
+                self._size = self._conn.execute("SELECT COUNT(*) FROM ner_cache").fetchone()[0]
+                if self._size > self.max_entries:
+                    self._evict()
+
+    def _evict(self):
+        # Drop the least recently used rows, plus a batch of headroom
+        headroom = max(1, min(EVICTION_BATCH, self.max_entries // 10))
+        overflow = self._size - self.max_entries + headroom
+        self._conn.execute(
+            "DELETE FROM ner_cache WHERE key IN ("
+            " SELECT key FROM ner_cache ORDER BY last_access ASC LIMIT ?)",
+            (overflow,),
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM ner_cache").fetchone()[0]
+
+    def get_or_compute(self, text, model_id, compute):
+        """
+        Returns cached NER output for `text`, running `compute(text)` and storing
+        the result only on a miss.
+        """
+        cached = self.get(text, model_id)
+        if cached is not None:
+            return cached
+        results = compute(text)
+        self.put(text, model_id, results)
+        return results
+
+    def get_or_compute_many(self, texts, model_id, compute_many):
+        """
+        Batched get_or_compute(): looks every text up first, then calls
+        `compute_many(list_of_texts)` once for the distinct misses only.
+        """
+        results = [self.get(text, model_id) for text in texts]
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        if missing:
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, compute_many(unique)))
+            for text, output in computed.items():
+                self.put(text, model_id, output)
+            for i in missing:
+                results[i] = computed[texts[i]]
+        return results
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'entries': self._size,
+            'max_entries': self.max_entries,
+        }
+
+    def report(self):
+        return (f"NER cache: {self.hits} hits / {self.misses} misses "
+                f"({self.hit_rate:.1%} of inference skipped), {self._size} entries on disk.")
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,150 @@
+import numpy as np
+
+# --- Span Aggregation ---
+# Entities are rebuilt from token character offsets and sliced out of the original
+# text once, so "Google Pixel 8" keeps its spaces and "iPhone 15 Pro" is not glued
+# back together from wordpieces. The extractors run the tokenizer and model
+# themselves (SpanTagger): logits become label-id arrays and entity boundaries are
+# found with array ops over the whole batch, instead of the HF "ner" pipeline
+# building a dict per token and grouping them in Python.
+OUTSIDE, BEGIN, INSIDE = 0, 1, 2
+
+
+def aggregate_spans(text, ner_results):
+    """
+    Groups one text's token dicts, as the HF "ner" pipeline returns them
+    (aggregation_strategy=None), into [(name, start, end, confidence)]. The
+    reference for spans_from_labels(), which applies the same rules to arrays.
+    A B- token starts an entity unless it continues the previous token's word (no
+    gap); an I- token extends the open entity, or starts one if none is open. Any
+    non-whitespace text between two tokens (words tagged O) closes the entity.
+    Confidence is the mean token score. Only offsets are compared per token; the
+    name is sliced from `text` once per entity.
+    """
+    entities = []
+    start = end = None
+    score_sum, count = 0.0, 0
+    for token in ner_results:
+        label = token.get('entity', '')[:2]
+        token_start, token_end = token.get('start') or 0, token.get('end') or 0
+        if start is not None:
+            contiguous = token_start == end
+            if not (contiguous or (label == 'I-' and not text[end:token_start].strip())):
+                name = text[start:end].strip()
+                if name:
+                    entities.append((name, start, end, score_sum / count))
+                start = None
+        if label != 'B-' and label != 'I-':
+            continue
+        if start is None:
+            start, score_sum, count = token_start, 0.0, 0
+        end = token_end
+        score_sum += float(token.get('score', 1.0))
+        count += 1
+    if start is not None:
+        name = text[start:end].strip()
+        if name:
+            entities.append((name, start, end, score_sum / count))
+    return entities
+
+
+def label_kinds(id2label):
+    """Array mapping the model's label ids to OUTSIDE, BEGIN or INSIDE."""
+    kinds = np.full(len(id2label), OUTSIDE, dtype=np.int8)
+    for label_id, label in id2label.items():
+        if label.startswith('B-'):
+            kinds[int(label_id)] = BEGIN
+        elif label.startswith('I-'):
+            kinds[int(label_id)] = INSIDE
+    return kinds
+
+
+def spans_from_labels(texts, kinds, scores, offsets):
+    """
+    aggregate_spans() for a whole padded batch at once. `kinds` and `scores` are
+    (texts, tokens) arrays, `offsets` the tokenizer's (texts, tokens, 2) offset
+    mapping, where special and padding tokens are (0, 0). A B/I token continues
+    the entity of the token right before it if it starts where that one ends
+    (same word) or is an I- token; an O token in between closes the entity, like
+    the non-whitespace gap does in aggregate_spans(). Returns one
+    [(name, start, end, confidence)] list per text.
+    """
+    starts, ends = offsets[..., 0], offsets[..., 1]
+    entity = (kinds != OUTSIDE) & (ends > starts)
+    previous = np.zeros_like(entity)
+    previous[:, 1:] = entity[:, :-1]
+    previous_end = np.zeros_like(ends)
+    previous_end[:, 1:] = ends[:, :-1]
+    continues = entity & previous & ((starts == previous_end) | (kinds == INSIDE))
+
+    begins = np.flatnonzero(entity & ~continues)
+    tokens = np.flatnonzero(entity)
+    # Every entity token gets the number of the run it belongs to
+    runs = np.cumsum((entity & ~continues).ravel())[tokens] - 1
+    counts = np.bincount(runs, minlength=len(begins))
+    confidences = np.bincount(runs, weights=scores.ravel()[tokens], minlength=len(begins)) / np.maximum(counts, 1)
+    lasts = tokens[np.cumsum(counts) - 1]
+
+    results = [[] for _ in texts]
+    for row, start, end, confidence in zip((begins // entity.shape[1]).tolist(), starts.ravel()[begins].tolist(),
+                                           ends.ravel()[lasts].tolist(), confidences.tolist()):
+        name = texts[row][start:end].strip()
+        if name:
+            results[row].append((name, start, end, confidence))
+    return results
+
+
+class SpanTagger:
+    """
+    Token classification without the HF "ner" pipeline: tokenizes a batch with
+    return_offsets_mapping, runs the model once, argmaxes the logits into label
+    ids and groups them with spans_from_labels(). Called like the pipeline it
+    replaces: a list of texts gives one span list per text, a single text its
+    span list.
+    """
+
+    def __init__(self, tokenizer, model, batch_size=32):
+        self.tokenizer = tokenizer
+        self.model = model.eval()
+        self.batch_size = batch_size
+        self.kinds = label_kinds(model.config.id2label)
+
+    def __call__(self, texts, batch_size=None):
+        if isinstance(texts, str):
+            return self([texts])[0]
+        import torch
+
+        batch_size = batch_size or self.batch_size
+        # Texts of similar length share a batch, so little of it is padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results = [None] * len(texts)
+        for first in range(0, len(order), batch_size):
+            chunk = order[first:first + batch_size]
+            batch = [texts[i] for i in chunk]
+            encoded = self.tokenizer(batch, return_offsets_mapping=True, padding=True, truncation=True,
+                                     return_tensors='pt')
+            offsets = encoded.pop('offset_mapping').numpy()
+            with torch.inference_mode():
+                logits = self.model(**encoded.to(self.model.device)).logits
+            scores, label_ids = torch.softmax(logits, dim=-1).max(dim=-1)
+            spans = spans_from_labels(batch, self.kinds[label_ids.cpu().numpy()], scores.cpu().numpy(), offsets)
+            for i, text_spans in zip(chunk, spans):
+                results[i] = text_spans
+        return results
+
+
+def span_names(entities):
+    return [name for name, _, _, _ in entities]
+
+
+def span_offsets(entities):
+    """(name, start, end) triples, the input mention_sentiment uses to place each mention."""
+    return [(name, start, end) for name, start, end, _ in entities]
+
+
+def span_confidences(entities):
+    """{name: confidence}, keeping the best occurrence of a repeated name (cascade.py)."""
+    confidences = {}
+    for name, _, _, confidence in entities:
+        confidences[name] = max(confidence, confidences.get(name, 0.0))
+    return confidences
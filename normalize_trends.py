@@ -4,6 +4,11 @@ from collections import Counter
 import os
 import sys
 import nltk
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from entity_resolution import get_resolver
+from mention_sentiment import sentiment_shares, format_shares
+from compact_posts import load_compact, describe
+from trend_history import TrendHistory
 
 # Ensure the script can find your Flask 'app' module
 sys.path.append(os.getcwd())
@@ -55,6 +60,9 @@ PATTERN_MAP = {
     r"^asus ?(rog|zenfone) ?(phone)? ?(\d{1,2}) ?(pro|ultimate)?$": lambda m: f"ASUS {m.group(1).upper()} Phone {m.group(3)}{' ' + m.group(4).title() if m.group(4) else ''}",
 }
 
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('phone_normalize')
+
 # --- New NLTK Filtering Function ---
 def filter_with_nltk_pos(mentions):
     """
@@ -97,35 +105,59 @@ def normalize_phone_list(phone_list):
                 is_matched = True
                 break
         if not is_matched and len(clean_name) > 2:
-            normalized_names.append(name.title())
+            # Mentions PATTERN_MAP misses ("S24 Ultra", "Galaxy S24U") go to the product catalog,
+            # opened on first use so importing this module creates no catalog DB
+            normalized_names.append(get_resolver('phone').resolve(name) or name.title())
     return normalized_names
 
 def analyze_and_print_trends():
     """
     Main function to fetch, filter with NLTK, normalize, and print trends.
     """
-    all_extracted_phones = []
     print("Connecting to database and fetching extracted data...")
-    with app.app_context():
-        posts = RedditPost.query.filter(RedditPost.extracted_phones.isnot(None)).all()
-        for post in posts:
-            try:
-                all_extracted_phones.extend(post.phones)
-            except (json.JSONDecodeError, TypeError):
-                continue
-    
+    with app.app_context(), registry.time_stage('load', category='phone') as batch:
+        # Only the mention columns, interned into flat arrays (see compact_posts.py)
+        posts = load_compact(RedditPost, 'extracted_phones')
+        batch.items = len(posts)
+    print(describe(posts))
+    all_extracted_phones = posts.mention_names()
+
     print(f"Found a total of {len(all_extracted_phones)} raw mentions to process.")
 
     # --- NEW NLTK FILTERING STEP ---
     print("\nStep 1: Filtering mentions with NLTK Part-of-Speech tagging...")
-    product_candidates = filter_with_nltk_pos(all_extracted_phones)
+    with registry.time_stage('pos_filter', items=len(all_extracted_phones), category='phone'):
+        product_candidates = filter_with_nltk_pos(all_extracted_phones)
     print(f"--> Kept {len(product_candidates)} candidates after NLTK filtering.")
     
     # --- NORMALIZATION STEP (now runs on the NLTK-filtered list) ---
     print("\nStep 2: Normalizing candidates with regex and custom rules...")
-    final_list = normalize_phone_list(product_candidates)
+    with registry.time_stage('normalize', items=len(product_candidates), category='phone'):
+        final_list = normalize_phone_list(product_candidates)
     
     trend_counts = Counter(final_list)
+
+    # Per-mention sentiment goes through the same filter and normalization, once per raw name
+    canonical_names = {}
+    def canonical(name):
+        if name not in canonical_names:
+            normalized = normalize_phone_list(filter_with_nltk_pos([name]))
+            canonical_names[name] = normalized[0] if normalized else None
+        return canonical_names[name]
+    with registry.time_stage('mention_sentiment', category='phone'):
+        shares = sentiment_shares(posts.sentiment_pairs(), canonical)
+    # Append this run's ranking for /api/trends/history (see trend_history.py)
+    if trend_counts:
+        with registry.time_stage('history', items=len(trend_counts), category='phone'):
+            trend_history = TrendHistory()
+            trend_history.record('phone', trend_counts, shares)
+            trend_history.close()
+
+    registry.dump()
+    log_stage_summary(registry)
+    resolver = get_resolver('phone')
+    resolver.flush()
+    print(resolver.report())
     
     print("\n--- Top 20 Final Smartphone Trends ---")
     print("-" * 55)
@@ -134,10 +166,11 @@ def analyze_and_print_trends():
         print("No definitive product trends could be identified after cleaning.")
         return
 
-    print(f"{'Rank':<5} | {'Smartphone Model':<35} | {'Mentions'}")
-    print("-" * 55)
+    print(f"{'Rank':<5} | {'Smartphone Model':<35} | {'Mentions':>8} | {'Pos%':>5} | {'Neg%':>5}")
+    print("-" * 70)
     for i, (model, count) in enumerate(trend_counts.most_common(30), 1):
-        print(f"{i:<5} | {model:<35} | {count}")
+        positive, negative = format_shares(shares.get(model))
+        print(f"{i:<5} | {model:<35} | {count:>8} | {positive:>5} | {negative:>5}")
 
 # --- Main execution block ---
 if __name__ == '__main__':
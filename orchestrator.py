@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import asyncio
+import argparse
+import datetime as dt
+
+from categories import CATEGORIES, NER_BACKENDS, get_category
+from pipeline_metrics import MetricsRegistry, log_event
+
+# --- Orchestrator Configuration ---
+# Every run and every stage it ran is recorded here (see `python orchestrator.py status`)
+ORCHESTRATOR_DB_PATH = os.environ.get('ORCHESTRATOR_DB_PATH', 'orchestrator.db')
+# Seconds between the starts of two runs; a run that overruns starts the next one right away
+DEFAULT_INTERVAL = 3600
+# Collection waits on Reddit, so a couple can run at once; NER already uses every core
+NETWORK_SLOTS = int(os.environ.get('ORCHESTRATOR_NETWORK_SLOTS', 2))
+CPU_SLOTS = int(os.environ.get('ORCHESTRATOR_CPU_SLOTS', 1))
+STAGE_TIMEOUT = float(os.environ.get('ORCHESTRATOR_STAGE_TIMEOUT', 3600))
+# Grace period for a stage to exit after SIGTERM before it is killed
+TERMINATE_GRACE = 30
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Per-category DAG, in dependency order, and the resource each stage waits on
+CATEGORY_STAGES = ('collect', 'extract', 'normalize')
+# Run once per cycle over every category whose DAG finished
+AGGREGATE_STAGES = ('co_mention', 'recommend', 'snapshot')
+STAGE_RESOURCES = {'collect': 'network'}
+
+
+def stage_command(category, stage, backend=None):
+    """The script a category stage runs, as it would be typed by hand."""
+    cfg = get_category(category)
+    if stage == 'collect':
+        return [sys.executable, f"{cfg['collect_module']}.py"]
+    if stage == 'extract':
+        # Only the jobs the collector just queued, then exit (no model kept warm between runs)
+        command = [sys.executable, 'extraction_worker.py', '--categories', category, '--drain']
+        return command + ['--backend', backend] if backend else command
+    if stage == 'normalize':
+        return [sys.executable, f"{cfg['normalize_module']}.py"]
+    raise ValueError(f"Unknown category stage '{stage}'")
+
+
+def aggregate_command(stage, categories):
+    if stage == 'co_mention':
+        return [sys.executable, 'co_mention.py', 'rebuild', '--categories', *categories]
+    if stage == 'recommend':
+        return [sys.executable, 'recommend.py', 'build', '--categories', *categories]
+    if stage == 'snapshot':
+        return [sys.executable, 'serving_snapshot.py']
+    raise ValueError(f"Unknown aggregate stage '{stage}'")
+
+
+class RunStore:
+    """
+    SQLite record of orchestrator runs: one pipeline_run row per cycle, one
+    stage_run row per stage (queue wait, wall time, posts handled) and the
+    stage_summary lines each stage's script printed (its own inner stages).
+    """
+
+    def __init__(self, path=ORCHESTRATOR_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pipeline_run ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " categories TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'running',"
+            " started_at REAL NOT NULL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_run ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " run_id INTEGER NOT NULL,"
+            " category TEXT NOT NULL,"
+            " stage TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'running',"
+            " queued_at REAL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " exit_code INTEGER,"
+            " items INTEGER,"
+            " error TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_summary ("
+            " stage_run_id INTEGER NOT NULL,"
+            " source TEXT,"
+            " inner_stage TEXT,"
+            " items INTEGER,"
+            " seconds REAL,"
+            " posts_per_sec REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_stage_run_run ON stage_run (run_id)")
+
+    def start_run(self, categories):
+        cur = self._conn.execute("INSERT INTO pipeline_run (categories, started_at) VALUES (?, ?)",
+                                 (','.join(categories), time.time()))
+        return cur.lastrowid
+
+    def finish_run(self, run_id, status):
+        self._conn.execute("UPDATE pipeline_run SET status = ?, finished_at = ? WHERE id = ?",
+                           (status, time.time(), run_id))
+
+    def start_stage(self, run_id, category, stage, queued_at):
+        cur = self._conn.execute(
+            "INSERT INTO stage_run (run_id, category, stage, queued_at, started_at) VALUES (?, ?, ?, ?, ?)",
+            (run_id, category, stage, queued_at, time.time()))
+        return cur.lastrowid
+
+    def finish_stage(self, stage_id, status, exit_code=None, items=None, error=None, summaries=()):
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.execute(
+                "UPDATE stage_run SET status = ?, finished_at = ?, exit_code = ?, items = ?, error = ? WHERE id = ?",
+                (status, time.time(), exit_code, items, error, stage_id))
+            self._conn.executemany(
+                "INSERT INTO stage_summary (stage_run_id, source, inner_stage, items, seconds, posts_per_sec) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(stage_id, s.get('source'), s.get('stage'), s.get('items'), s.get('seconds'), s.get('posts_per_sec'))
+                 for s in summaries])
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def skip_stage(self, run_id, category, stage, reason):
+        self._conn.execute(
+            "INSERT INTO stage_run (run_id, category, stage, status, error) VALUES (?, ?, ?, 'skipped', ?)",
+            (run_id, category, stage, reason))
+
+    def recent_runs(self, limit=10):
+        runs = self._conn.execute(
+            "SELECT id, categories, status, started_at, finished_at FROM pipeline_run ORDER BY id DESC LIMIT ?",
+            (limit,)).fetchall()
+        result = []
+        for run_id, categories, status, started_at, finished_at in runs:
+            stages = self._conn.execute(
+                "SELECT category, stage, status, queued_at, started_at, finished_at, items FROM stage_run "
+                "WHERE run_id = ? ORDER BY id", (run_id,)).fetchall()
+            result.append({'id': run_id, 'categories': categories, 'status': status,
+                           'started_at': started_at, 'finished_at': finished_at, 'stages': stages})
+        return result
+
+    def stage_averages(self, limit=10):
+        """Per (category, stage): mean wall seconds, mean queue wait and posts/s over the last `limit` runs."""
+        return self._conn.execute(
+            "SELECT category, stage, COUNT(*), AVG(finished_at - started_at), AVG(started_at - queued_at),"
+            " SUM(items) / NULLIF(SUM(finished_at - started_at), 0) "
+            "FROM stage_run WHERE status = 'ok' AND run_id IN (SELECT id FROM pipeline_run ORDER BY id DESC LIMIT ?) "
+            "GROUP BY category, stage ORDER BY category, MIN(id)", (limit,)).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+
+class Orchestrator:
+    """
+    Runs collect -> extract -> normalize for every category as separate
+    scripts, then the cross-category aggregates, once per interval. Stages
+    wait on a network or CPU slot instead of on each other, so one
+    category's NER runs while the next category is still being collected.
+    """
+
+    def __init__(self, categories, store=None, backend=None, network_slots=NETWORK_SLOTS,
+                 cpu_slots=CPU_SLOTS, stage_timeout=STAGE_TIMEOUT):
+        self.categories = list(categories)
+        self.store = store or RunStore()
+        self.backend = backend
+        self.network_slots = network_slots
+        self.cpu_slots = cpu_slots
+        self.stage_timeout = stage_timeout
+        self.registry = MetricsRegistry('orchestrator')
+        self._slots = None
+        self._stop = None
+
+    def request_stop(self):
+        if not self._stop.is_set():
+            print("Shutdown requested, stopping the running stages...")
+        self._stop.set()
+
+    async def _relay(self, proc, label, summaries):
+        """Echoes a stage's output with its label and keeps its stage_summary lines."""
+        async for raw in proc.stdout:
+            line = raw.decode(errors='replace').rstrip()
+            print(f"[{label}] {line}", flush=True)
+            if line.startswith('{'):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('event') == 'stage_summary':
+                    summaries.append(record)
+
+    async def _terminate(self, proc):
+        if proc.returncode is not None:
+            return
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), TERMINATE_GRACE)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+    async def run_stage(self, run_id, category, stage, command):
+        """Runs one stage's script once a slot of its resource is free; returns True on success."""
+        resource = STAGE_RESOURCES.get(stage, 'cpu')
+        label = f"{category}/{stage}"
+        queued_at = time.time()
+        async with self._slots[resource]:
+            stage_id = self.store.start_stage(run_id, category, stage, queued_at)
+            log_event('orchestrator_stage_started', run=run_id, category=category, stage=stage,
+                      resource=resource, waited=round(time.time() - queued_at, 3))
+            start = time.perf_counter()
+            summaries = []
+            proc = await asyncio.create_subprocess_exec(
+                *command, cwd=SCRIPT_DIR, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            error = None
+            try:
+                await asyncio.wait_for(self._relay(proc, label, summaries), self.stage_timeout)
+                await proc.wait()
+            except asyncio.TimeoutError:
+                error = f"timed out after {self.stage_timeout:.0f}s"
+                await self._terminate(proc)
+            except asyncio.CancelledError:
+                await self._terminate(proc)
+                self.store.finish_stage(stage_id, 'cancelled', proc.returncode, error='orchestrator stopped')
+                raise
+            seconds = time.perf_counter() - start
+
+        if error is None and proc.returncode != 0:
+            error = f"exit code {proc.returncode}"
+        # Posts the stage handled: the busiest of the inner stages its script reported
+        items = max((s.get('items') or 0 for s in summaries), default=0)
+        status = 'ok' if error is None else 'failed'
+        self.store.finish_stage(stage_id, status, proc.returncode, int(items), error, summaries)
+        self.registry.observe('orchestrator_stage_seconds', seconds, category=category, stage=stage)
+        self.registry.inc('orchestrator_stage_items_total', items, category=category, stage=stage)
+        self.registry.inc('orchestrator_stages_total', category=category, stage=stage, status=status)
+        log_event('orchestrator_stage_finished', run=run_id, category=category, stage=stage, status=status,
+                  seconds=round(seconds, 3), items=items,
+                  posts_per_sec=round(items / seconds, 3) if seconds else None, error=error)
+        return error is None
+
+    async def run_category(self, run_id, category):
+        for i, stage in enumerate(CATEGORY_STAGES):
+            if not await self.run_stage(run_id, category, stage, stage_command(category, stage, self.backend)):
+                for skipped in CATEGORY_STAGES[i + 1:]:
+                    self.store.skip_stage(run_id, category, skipped, f"{stage} failed")
+                return False
+        return True
+
+    async def run_once(self):
+        """One cycle: every category's DAG concurrently, then the aggregates over the ones that finished."""
+        run_id = self.store.start_run(self.categories)
+        start = time.perf_counter()
+        status = 'failed'
+        try:
+            tasks = [asyncio.ensure_future(self.run_category(run_id, category)) for category in self.categories]
+            try:
+                done = await asyncio.gather(*tasks)
+            except asyncio.CancelledError:
+                # Let every stage terminate its script and record itself before the run is closed
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finished = [category for category, ok in zip(self.categories, done) if ok]
+            aggregated = bool(finished)
+            for i, stage in enumerate(AGGREGATE_STAGES):
+                if not finished:
+                    break
+                if not await self.run_stage(run_id, 'all', stage, aggregate_command(stage, finished)):
+                    for skipped in AGGREGATE_STAGES[i + 1:]:
+                        self.store.skip_stage(run_id, 'all', skipped, f"{stage} failed")
+                    aggregated = False
+                    break
+            if aggregated and len(finished) == len(self.categories):
+                status = 'ok'
+            elif finished:
+                status = 'partial'
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.store.finish_run(run_id, status)
+            self.registry.set_gauge('orchestrator_last_run_seconds', round(seconds, 3))
+            self.registry.inc('orchestrator_runs_total', status=status)
+            self.registry.dump()
+            log_event('orchestrator_run_finished', run=run_id, status=status, seconds=round(seconds, 3))
+        return status
+
+    async def run(self, interval=DEFAULT_INTERVAL, once=False):
+        self._slots = {'network': asyncio.Semaphore(self.network_slots), 'cpu': asyncio.Semaphore(self.cpu_slots)}
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.request_stop)
+
+        stop_wait = asyncio.ensure_future(self._stop.wait())
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                cycle = asyncio.ensure_future(self.run_once())
+                await asyncio.wait([cycle, stop_wait], return_when=asyncio.FIRST_COMPLETED)
+                if not cycle.done():
+                    cycle.cancel()
+                    await asyncio.gather(cycle, return_exceptions=True)
+                    break
+                cycle.result()
+                if once:
+                    break
+                delay = interval - (time.monotonic() - started)
+                if delay <= 0:
+                    log_event('orchestrator_run_overran', interval=interval, overrun=round(-delay, 3))
+                    continue
+                print(f"Next run at {(dt.datetime.now() + dt.timedelta(seconds=delay)).isoformat(timespec='seconds')}.")
+                try:
+                    await asyncio.wait_for(asyncio.shield(stop_wait), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            stop_wait.cancel()
+            self.store.close()
+
+
+def print_status(store, limit=10):
+    runs = store.recent_runs(limit)
+    if not runs:
+        print("No orchestrator runs recorded yet. Run: python orchestrator.py run --once")
+        return
+    print(f"{'Run':>4} | {'Started':<19} | {'Status':<9} | {'Wall s':>8} | {'Stage s':>8} | {'Overlap':>7}")
+    print("-" * 70)
+    for run in runs:
+        wall = (run['finished_at'] or time.time()) - run['started_at']
+        stage_seconds = sum((finished - started) for _, _, _, _, started, finished, _ in run['stages']
+                            if started and finished)
+        started = dt.datetime.fromtimestamp(run['started_at']).isoformat(sep=' ', timespec='seconds')
+        # Sum of stage times over wall time: 1.0 means nothing overlapped
+        overlap = stage_seconds / wall if wall else 0.0
+        print(f"{run['id']:>4} | {started:<19} | {run['status']:<9} | {wall:>8.1f} | {stage_seconds:>8.1f} | {overlap:>6.2f}x")
+
+    print(f"\nStage averages over the last {limit} runs:")
+    print(f"{'Category':<8} | {'Stage':<10} | {'Runs':>4} | {'Seconds':>8} | {'Waited':>7} | {'Posts/s':>8}")
+    print("-" * 62)
+    for category, stage, count, seconds, waited, rate in store.stage_averages(limit):
+        rate_text = f"{rate:>8.1f}" if rate else f"{'-':>8}"
+        print(f"{category:<8} | {stage:<10} | {count:>4} | {seconds:>8.1f} | {waited:>7.1f} | {rate_text}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run collect -> extract -> normalize -> aggregate on a schedule.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run')
+    run_parser.add_argument('--categories', nargs='+', default=list(CATEGORIES), choices=list(CATEGORIES))
+    run_parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="Seconds between run starts.")
+    run_parser.add_argument('--once', action='store_true', help="Run a single cycle and exit.")
+    run_parser.add_argument('--backend', default=None, choices=NER_BACKENDS, help="NER model for the extract stage.")
+    run_parser.add_argument('--network-slots', type=int, default=NETWORK_SLOTS,
+                            help="Collect stages allowed to run at once.")
+    run_parser.add_argument('--cpu-slots', type=int, default=CPU_SLOTS,
+                            help="Extract/normalize/aggregate stages allowed to run at once.")
+    run_parser.add_argument('--stage-timeout', type=float, default=STAGE_TIMEOUT)
+    status_parser = sub.add_parser('status')
+    status_parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        orchestrator = Orchestrator(args.categories, backend=args.backend, network_slots=args.network_slots,
+                                    cpu_slots=args.cpu_slots, stage_timeout=args.stage_timeout)
+        asyncio.run(orchestrator.run(args.interval, once=args.once))
+    else:
+        store = RunStore()
+        print_status(store, args.runs)
+        store.close()
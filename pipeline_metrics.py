@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import glob
+import threading
+import datetime as dt
+from contextlib import contextmanager
+
+# --- Metrics Configuration ---
+# Scripts dump their registry here when they finish; app.py's /metrics endpoint
+# reads every snapshot in this directory alongside its own request metrics.
+METRICS_DIR = os.environ.get('PIPELINE_METRICS_DIR', 'pipeline_metrics')
+# Latency buckets (seconds) shared by every histogram
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and latency histograms for one pipeline script
+    (or the Flask app). Snapshots are plain JSON so separate processes can be
+    merged when rendering the Prometheus endpoint.
+    """
+
+    def __init__(self, source, buckets=DEFAULT_BUCKETS):
+        self.source = source
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    @contextmanager
+    def time_stage(self, stage, items=0, **labels):
+        """
+        Times one batch of a pipeline stage. Set `batch.items` inside the block
+        if the number of posts is only known at the end.
+        """
+        batch = _StageBatch(items)
+        start = time.perf_counter()
+        try:
+            yield batch
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe('pipeline_stage_batch_seconds', elapsed, stage=stage, **labels)
+            self.inc('pipeline_stage_seconds_total', elapsed, stage=stage, **labels)
+            self.inc('pipeline_stage_items_total', batch.items, stage=stage, **labels)
+            key = _label_key(dict(stage=stage, **labels))
+            with self._lock:
+                total_items = self._counters.get(('pipeline_stage_items_total', key), 0)
+                total_seconds = self._counters.get(('pipeline_stage_seconds_total', key), 0)
+            if total_seconds:
+                self.set_gauge('pipeline_stage_posts_per_second', round(total_items / total_seconds, 3),
+                               stage=stage, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = {}
+
+            def entry(name, kind):
+                return metrics.setdefault(name, {'type': kind, 'help': self._help.get(name, ''), 'samples': []})
+
+            for (name, labels), value in self._counters.items():
+                entry(name, 'counter')['samples'].append({'labels': dict(labels), 'value': value})
+            for (name, labels), value in self._gauges.items():
+                entry(name, 'gauge')['samples'].append({'labels': dict(labels), 'value': value})
+            for (name, labels), hist in self._histograms.items():
+                entry(name, 'histogram')['samples'].append({
+                    'labels': dict(labels),
+                    'buckets': list(zip(self.buckets, hist['buckets'])),
+                    'sum': hist['sum'],
+                    'count': hist['count'],
+                })
+        return {'source': self.source, 'written_at': dt.datetime.now().isoformat(timespec='seconds'),
+                'metrics': metrics}
+
+    def dump(self, directory=METRICS_DIR):
+        """Writes this registry's snapshot to <directory>/<source>.json (atomically)."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.source}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        return path
+
+
+class _StageBatch:
+    def __init__(self, items):
+        self.items = items
+
+
+def log_event(event, **fields):
+    """Prints one structured JSON log line (timestamp + event name + fields)."""
+    record = {'ts': dt.datetime.now().isoformat(timespec='milliseconds'), 'event': event}
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+
+def log_stage_summary(registry):
+    """Emits one JSON log line per stage with its throughput and latency totals."""
+    snapshot = registry.snapshot()['metrics']
+    rates = {tuple(sorted(s['labels'].items())): s['value']
+             for s in snapshot.get('pipeline_stage_posts_per_second', {}).get('samples', [])}
+    items = {tuple(sorted(s['labels'].items())): s['value']
+             for s in snapshot.get('pipeline_stage_items_total', {}).get('samples', [])}
+    for sample in snapshot.get('pipeline_stage_batch_seconds', {}).get('samples', []):
+        labels = sample['labels']
+        key = tuple(sorted(labels.items()))
+        log_event('stage_summary', source=registry.source, **labels,
+                  batches=sample['count'], items=items.get(key, 0),
+                  seconds=round(sample['sum'], 4), posts_per_sec=rates.get(key))
+
+
+def load_snapshots(directory=METRICS_DIR):
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return snapshots
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in sorted(labels.items()):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render_prometheus(snapshots):
+    """Renders a list of registry snapshots in the Prometheus text exposition format."""
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap['metrics'].items():
+            target = merged.setdefault(name, {'type': metric['type'], 'help': metric.get('help', ''), 'samples': []})
+            for sample in metric['samples']:
+                sample = dict(sample)
+                sample['labels'] = dict(sample['labels'], source=snap['source'])
+                target['samples'].append(sample)
+
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        if metric['help']:
+            lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for sample in metric['samples']:
+            labels = sample['labels']
+            if metric['type'] == 'histogram':
+                for bound, count in sample['buckets']:
+                    lines.append(f"{name}_bucket{_format_labels(dict(labels, le=bound))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(dict(labels, le='+Inf'))} {sample['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {sample['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {sample['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {sample['value']}")
+    return '\n'.join(lines) + '\n'
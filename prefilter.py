@@ -0,0 +1,254 @@
+import os
+import re
+import sys
+import argparse
+from collections import deque
+
+from categories import CATEGORIES, get_category, bert_module, normalize_module, vocabulary
+
+# --- Prefilter Configuration ---
+# strict   : only posts that mention a known brand/series keyword go to the model
+# balanced : also keep posts with model-number looking tokens (s24, a55, x1, m3...)
+# safe     : also keep posts with any mid-sentence capitalised / camel-case word
+# off      : gate disabled, every post is sent to the model
+MODES = ('strict', 'balanced', 'safe', 'off')
+DEFAULT_MODE = os.environ.get('PREFILTER_MODE', 'balanced')
+# Texts per model call when labelling an evaluation sample
+LABEL_BATCH_SIZE = 64
+
+# Words that appear in GENERIC_BRANDS / PATTERN_MAP but are far too common in
+# ordinary English to count as a product signal on their own.
+COMMON_WORDS = {
+    "one", "nothing", "india", "china", "reddit", "gemini", "phone", "note", "hot",
+    "zero", "find", "go", "pro", "air", "book", "pad", "tab", "edge", "of", "th",
+    "inch", "play", "power", "kids", "fire", "studio", "advanced", "slim", "dash",
+    "gaming", "laptop", "tablet", "new", "used",
+}
+
+MODEL_TOKEN_RE = re.compile(r'\b(?=[a-z]*\d)(?=\d*[a-z])[a-z0-9]{2,8}\b')
+PROPER_NOUN_RE = re.compile(r'[a-z0-9,;:]\s+[A-Z]|\b[a-z]+[A-Z]')
+
+
+class AhoCorasick:
+    """
+    Minimal Aho-Corasick automaton over characters. Finds every keyword occurrence
+    in a single pass over the text, independent of how many keywords there are.
+    """
+
+    def __init__(self, words=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for word in words:
+            self.add(word)
+        self.build()
+
+    def add(self, word):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._goto[node][ch] = nxt
+            node = nxt
+        if word not in self._out[node]:
+            self._out[node] = self._out[node] + (word,)
+
+    def build(self):
+        """Computes failure links breadth-first; call after the last add()."""
+        queue = deque(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text):
+        """Yields (start, keyword) for every keyword occurrence in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for word in out[node]:
+                yield i - len(word) + 1, word
+
+
+def _is_word_boundary(text, start, end):
+    before = text[start - 1] if start > 0 else ' '
+    after = text[end] if end < len(text) else ' '
+    return not before.isalnum() and not after.isalnum()
+
+
+def brand_keywords(generic_brands, noisy_terms, pattern_map, drop_common=True):
+    """
+    Collects brand/series keywords from a category's GENERIC_BRANDS and the literal
+    words inside its PATTERN_MAP regexes, dropping noisy (and, by default, very
+    common) words.
+    """
+    noisy = {term.lower().strip() for term in noisy_terms}
+    keywords = {brand.lower() for brand in generic_brands}
+    for pattern in pattern_map:
+        literal = re.sub(r'\[[^\]]*\]|\\[a-zA-Z]', ' ', pattern)  # drop [fmx] classes and \d escapes
+        keywords.update(re.findall(r'[a-z]{2,}', literal))
+    common = COMMON_WORDS if drop_common else set()
+    return sorted(k for k in keywords if k not in noisy and k not in common)
+
+
+class ProductPrefilter:
+    """
+    Cheap gate in front of the NER model: decides whether a post carries enough
+    product signal to be worth running through BERT.
+    """
+
+    def __init__(self, keywords, mode=DEFAULT_MODE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown prefilter mode '{mode}'. Expected one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.keywords = list(keywords)
+        self.automaton = AhoCorasick(self.keywords)
+        self.seen = 0
+        self.passed = 0
+
+    @classmethod
+    def for_category(cls, category, mode=DEFAULT_MODE):
+        return cls(brand_keywords(*vocabulary(category)), mode=mode)
+
+    def matched_keywords(self, text):
+        lowered = text.lower()
+        return [word for start, word in self.automaton.iter_matches(lowered)
+                if _is_word_boundary(lowered, start, start + len(word))]
+
+    def has_signal(self, text):
+        """Returns True if the text should be sent to the model (does not update stats)."""
+        if self.mode == 'off':
+            return True
+        if not text or not isinstance(text, str):
+            return False
+        lowered = text.lower()
+        for start, word in self.automaton.iter_matches(lowered):
+            if _is_word_boundary(lowered, start, start + len(word)):
+                return True
+        if self.mode in ('balanced', 'safe') and MODEL_TOKEN_RE.search(lowered):
+            return True
+        if self.mode == 'safe' and PROPER_NOUN_RE.search(text):
+            return True
+        return False
+
+    def should_extract(self, text):
+        """Same as has_signal(), but counts the decision towards the skip ratio."""
+        keep = self.has_signal(text)
+        self.seen += 1
+        if keep:
+            self.passed += 1
+        return keep
+
+    @property
+    def skip_ratio(self):
+        return (self.seen - self.passed) / self.seen if self.seen else 0.0
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'seen': self.seen,
+            'sent_to_model': self.passed,
+            'skipped': self.seen - self.passed,
+            'skip_ratio': round(self.skip_ratio, 4),
+        }
+
+    def report(self):
+        return (f"Prefilter ({self.mode}): skipped {self.seen - self.passed} of {self.seen} posts "
+                f"({self.skip_ratio:.1%}) with no product signal.")
+
+
+def measure_recall_loss(prefilter, labeled_sample):
+    """
+    Measures how many product-bearing posts the gate would drop.
+    `labeled_sample` is an iterable of (text, products) pairs; a post counts as
+    positive when `products` is non-empty.
+    """
+    total = positives = skipped = missed = 0
+    for text, products in labeled_sample:
+        total += 1
+        keep = prefilter.has_signal(text)
+        if not keep:
+            skipped += 1
+        if products:
+            positives += 1
+            if not keep:
+                missed += 1
+    return {
+        'mode': prefilter.mode,
+        'sample_size': total,
+        'positives': positives,
+        'skip_ratio': round(skipped / total, 4) if total else 0.0,
+        'missed_positives': missed,
+        'recall_loss': round(missed / positives, 4) if positives else 0.0,
+    }
+
+
+def bert_mentions(category, texts, batch_size=LABEL_BATCH_SIZE):
+    """
+    Raw dslim/bert-base-NER mentions for every text, with the prefilter and the
+    gazetteer out of the way. The stored extracted_* column is no reference:
+    posts the prefilter skipped are stored as [] and EXTRACTOR_MODE=merge or
+    `gazetteer.py extract` add dictionary matches. Goes through the NER cache,
+    so texts the extractor already ran on cost no model call.
+    """
+    from ner_spans import span_names
+    module = bert_module(category)
+    tagger = module.load_ner_pipeline()
+    mentions = []
+    for start in range(0, len(texts), batch_size):
+        found = module.ner_cache.get_or_compute_many(
+            texts[start:start + batch_size], module.SPANS_MODEL_ID, lambda batch: tagger(batch, batch_size=len(batch)))
+        mentions.extend(span_names(spans) for spans in found)
+    return mentions
+
+
+def labeled_sample_from_db(category, limit=2000):
+    """
+    Labels stored posts with a fresh BERT run (see bert_mentions()): the
+    normalized mentions BERT finds with the gate off are the ground truth.
+    """
+    cfg = get_category(category)
+    module = normalize_module(category)
+    model = module.RedditPost
+    normalize = getattr(module, cfg['normalize_fn'])
+    with getattr(module, cfg['app']).app_context():
+        rows = model.query.with_entities(model.title, model.body).limit(limit).all()
+    # Same text the extractors build, so the NER cache answers posts they already ran on
+    texts = [f"{title}. {body or ''}" if title else (body or '') for title, body in rows]
+    return [(text, normalize(mentions)) for text, mentions in zip(texts, bert_mentions(category, texts))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate the NER prefilter against fresh BERT labels.")
+    parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    parser.add_argument('--sample', type=int, default=2000, help="Number of labeled posts to evaluate on.")
+    args = parser.parse_args()
+
+    sample = labeled_sample_from_db(args.category, args.sample)
+    if not sample:
+        print(f"No {args.category} posts found to evaluate on. Run the collector first.")
+        sys.exit(0)
+
+    keywords = brand_keywords(*vocabulary(args.category))
+    print(f"Evaluating {len(sample)} labeled {args.category} posts against {len(keywords)} keywords...")
+    print(f"{'Mode':<10} | {'Skip ratio':<10} | {'Recall loss':<11} | {'Missed'}")
+    print("-" * 50)
+    for mode in MODES:
+        result = measure_recall_loss(ProductPrefilter(keywords, mode=mode), sample)
+        print(f"{mode:<10} | {result['skip_ratio']:<10.1%} | {result['recall_loss']:<11.2%} | "
+              f"{result['missed_positives']}/{result['positives']}")
@@ -0,0 +1,399 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+import statistics
+import datetime as dt
+from array import array
+from collections import Counter, defaultdict
+
+from categories import CATEGORIES, get_category, collect_module, normalizer
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+
+# --- Recommendation Configuration ---
+# build_features() writes one file per category here; app.py loads them at startup
+FEATURES_DIR = os.environ.get('RECOMMEND_FEATURES_DIR', 'recommend_features')
+# Momentum compares the last MOMENTUM_DAYS with the MOMENTUM_DAYS before that
+MOMENTUM_DAYS = 7
+# Products with fewer mentions are too noisy to recommend
+MIN_MENTIONS = 3
+# A product needs this many price mentions before we trust its typical price
+MIN_PRICE_MENTIONS = 3
+MAX_COMPETITORS = 5
+# How much each normalized feature contributes to the score. Competition is the product's
+# share of mentions against its top co-mentioned rivals (from co_mention.py's graph).
+WEIGHTS = {'popularity': 0.25, 'momentum': 0.20, 'sentiment': 0.25, 'engagement': 0.15, 'competition': 0.15}
+# The aspect feature only counts with prefer=<aspect>, and then this much
+PREFER_WEIGHT = 0.35
+# VADER compound at or above this counts as a positive mention (same cut as the collectors)
+POSITIVE_THRESHOLD = 0.05
+RELOAD_CHECK_INTERVAL = 5.0
+
+# Words that tie a post to what the user cares about (prefer=...)
+ASPECT_KEYWORDS = {
+    'camera': {'camera', 'cameras', 'photo', 'photos', 'picture', 'pictures', 'video', 'lens', 'zoom', 'portrait'},
+    'battery': {'battery', 'charging', 'charge', 'charger', 'sot', 'endurance', 'mah'},
+    'display': {'display', 'screen', 'oled', 'amoled', 'brightness', 'refresh', 'hz', 'resolution'},
+    'performance': {'performance', 'gaming', 'snapdragon', 'processor', 'chip', 'cpu', 'gpu', 'lag', 'speed', 'ram'},
+    'software': {'software', 'update', 'updates', 'ui', 'bloatware', 'bloat', 'os', 'skin'},
+    'value': {'price', 'value', 'budget', 'cheap', 'affordable', 'deal', 'worth', 'cost'},
+}
+ASPECTS = sorted(ASPECT_KEYWORDS)
+WORD_RE = re.compile(r'[a-z0-9]+')
+# "$450", "$ 1,099", "450 dollars", "600 usd"
+PRICE_RE = re.compile(r'\$\s?(\d{1,2},\d{3}|\d{2,4})(?![\d,])|\b(\d{2,4})\s?(?:usd|dollars|bucks)\b')
+
+
+def _post_prices(text):
+    prices = []
+    for match in PRICE_RE.finditer(text):
+        value = int((match.group(1) or match.group(2)).replace(',', ''))
+        if 50 <= value <= 5000:
+            prices.append(value)
+    return prices
+
+
+def _rows(category):
+    """
+    Yields (mentions, created, sentiment, engagement, text, link) for every
+    extracted post and comment; link is (title, url) for posts, None for comments.
+    """
+    cfg = get_category(category)
+    collector = collect_module(category)
+    column = cfg['extracted_column']
+    with getattr(collector, cfg['app']).app_context():
+        post = collector.RedditPost
+        query = post.query.with_entities(getattr(post, column), post.created, post.sentiment_compound,
+                                         post.score, post.num_comments, post.title, post.body, post.url)
+        for extracted, created, sentiment, score, num_comments, title, body, url in \
+                query.filter(getattr(post, column).isnot(None)).yield_per(2000):
+            yield extracted, created, sentiment, score + num_comments, f"{title} {body or ''}", (title, url)
+        comment = collector.RedditComment
+        query = comment.query.with_entities(getattr(comment, column), comment.created,
+                                            comment.sentiment_compound, comment.score, comment.body)
+        for extracted, created, sentiment, score, body in \
+                query.filter(getattr(comment, column).isnot(None)).yield_per(2000):
+            yield extracted, created, sentiment, score, body, None
+
+
+def build_features(category, registry=None):
+    """
+    Aggregates every extracted post/comment of a category into per-product
+    features and writes them to <FEATURES_DIR>/<category>.json. Competitors
+    and the competitive share come from the co-mention graph (co_mention.py rebuild).
+    """
+    from co_mention import CoMentionGraph
+
+    registry = registry or MetricsRegistry(f"{category}_recommend")
+    normalize = normalizer(category)
+    mentions = Counter()
+    recent, previous = Counter(), Counter()
+    sentiment_sum, engagement_sum = Counter(), Counter()
+    positive = Counter()
+    # Highest-engagement post per product: (engagement, title, url)
+    top_post = {}
+    aspect_hits = defaultdict(Counter)
+    prices = defaultdict(list)
+    rows = []
+
+    with registry.time_stage('recommend_load', category=category) as batch:
+        for extracted, created, sentiment, engagement, text, link in _rows(category):
+            try:
+                names = set(normalize(json.loads(extracted)))
+            except (json.JSONDecodeError, TypeError):
+                continue
+            if names:
+                rows.append((names, created, sentiment or 0.0, max(engagement or 0, 0), text or '', link))
+        batch.items = len(rows)
+    if not rows:
+        print(f"No extracted {category} posts to build recommendation features from.")
+        return None
+
+    with registry.time_stage('recommend_features', items=len(rows), category=category):
+        newest = max(created for _, created, _, _, _, _ in rows)
+        recent_start = newest - dt.timedelta(days=MOMENTUM_DAYS)
+        previous_start = recent_start - dt.timedelta(days=MOMENTUM_DAYS)
+        for names, created, sentiment, engagement, text, link in rows:
+            lowered = text.lower()
+            words = set(WORD_RE.findall(lowered))
+            aspects = [aspect for aspect in ASPECTS if words & ASPECT_KEYWORDS[aspect]]
+            post_prices = _post_prices(lowered)
+            for name in names:
+                mentions[name] += 1
+                if created >= recent_start:
+                    recent[name] += 1
+                elif created >= previous_start:
+                    previous[name] += 1
+                sentiment_sum[name] += sentiment
+                if sentiment >= POSITIVE_THRESHOLD:
+                    positive[name] += 1
+                engagement_sum[name] += math.log1p(engagement)
+                if link is not None and engagement > top_post.get(name, (-1,))[0]:
+                    top_post[name] = (engagement, *link)
+                for aspect in aspects:
+                    aspect_hits[name][aspect] += 1
+                # Only trust a price when the post is about a single product
+                if len(names) == 1:
+                    prices[name].extend(post_prices)
+
+        products = sorted(name for name, count in mentions.items() if count >= MIN_MENTIONS)
+        index = {name: i for i, name in enumerate(products)}
+
+    with registry.time_stage('recommend_competitors', items=len(products), category=category):
+        graph = CoMentionGraph(category)
+        if not graph.products:
+            print(f"No co-mention graph for {category} yet (python co_mention.py rebuild); skipping competitors.")
+        # Competitor graph in CSR layout: row i's neighbours are indices[indptr[i]:indptr[i + 1]]
+        indptr, indices, weights = [0], [], []
+        # Mentions / (mentions + rival mentions), both counted by the graph; None without rivals
+        competitive_share = []
+        for name in products:
+            rivals = [rival for rival in graph.alternatives(name, k=MAX_COMPETITORS * 2)
+                      if rival['name'] in index][:MAX_COMPETITORS]
+            for rival in rivals:
+                indices.append(index[rival['name']])
+                weights.append(rival['co_mentions'])
+            indptr.append(len(indices))
+            if rivals:
+                own = int(graph.mentions[graph.index[name]])
+                rival_mentions = sum(int(graph.mentions[graph.index[rival['name']]]) for rival in rivals)
+                competitive_share.append(round(own / max(own + rival_mentions, 1), 4))
+            else:
+                competitive_share.append(None)
+        graph.close()
+
+        features = {
+            'category': category,
+            'built_at': dt.datetime.now().isoformat(timespec='seconds'),
+            'products': products,
+            'mentions': [mentions[name] for name in products],
+            'momentum': [round((recent[name] + 1) / (previous[name] + 1), 4) for name in products],
+            'sentiment': [round(sentiment_sum[name] / mentions[name], 4) for name in products],
+            'engagement': [round(engagement_sum[name] / mentions[name], 4) for name in products],
+            'positive_share': [round(positive[name] / mentions[name], 4) for name in products],
+            'competitive_share': competitive_share,
+            'top_post': [list(top_post[name][1:]) if name in top_post else None for name in products],
+            'aspects': {aspect: [round(aspect_hits[name][aspect] / mentions[name], 4) for name in products]
+                        for aspect in ASPECTS},
+            'price': [statistics.median(prices[name]) if len(prices[name]) >= MIN_PRICE_MENTIONS else None
+                      for name in products],
+            'competitors': {'indptr': indptr, 'indices': indices, 'weights': weights},
+        }
+
+    os.makedirs(FEATURES_DIR, exist_ok=True)
+    path = os.path.join(FEATURES_DIR, f"{category}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(features, f)
+    os.replace(tmp_path, path)
+    print(f"Wrote features for {len(products)} {category} products ({len(rows)} posts/comments) to {path}")
+    return path
+
+
+def _rank_normalize(values):
+    """
+    Maps values onto [0, 1] by rank so one viral product can't flatten everyone else.
+    Missing values (NaN) sit in the middle.
+    """
+    order = sorted((i for i, value in enumerate(values) if value == value), key=values.__getitem__)
+    ranks = array('d', [0.5] * len(values))
+    scale = max(len(order) - 1, 1)
+    for rank, i in enumerate(order):
+        ranks[i] = rank / scale
+    return ranks
+
+
+class CategoryFeatures:
+    """
+    One category's product features as flat arrays indexed by product id, with
+    the competitor graph in CSR form. Scores are computed straight from these
+    arrays, so a request never touches the posts table.
+    """
+
+    def __init__(self, data):
+        self.category = data['category']
+        self.built_at = data['built_at']
+        self.products = data['products']
+        self.mentions = array('l', data['mentions'])
+        self.momentum = array('d', data['momentum'])
+        self.sentiment = array('d', data['sentiment'])
+        self.engagement = array('d', data['engagement'])
+        self.price = array('d', [p if p is not None else float('nan') for p in data['price']])
+        self.aspects = {aspect: array('d', values) for aspect, values in data['aspects'].items()}
+        # Feature files built before product cards existed have neither
+        self.positive_share = array('d', data.get('positive_share') or [float('nan')] * len(self.products))
+        self.top_post = data.get('top_post') or [None] * len(self.products)
+        # None for products without co-mentioned rivals; older files have no competitive share at all
+        self.has_competition = 'competitive_share' in data
+        self.competitive_share = array('d', [s if s is not None else float('nan')
+                                             for s in data.get('competitive_share') or []])
+        graph = data['competitors']
+        self.indptr = array('l', graph['indptr'])
+        self.indices = array('l', graph['indices'])
+        self.weights = array('l', graph['weights'])
+        # Normalized once at load; requests only combine them
+        self.popularity_rank = _rank_normalize([math.log1p(m) for m in self.mentions])
+        self.momentum_rank = _rank_normalize(self.momentum)
+        self.engagement_rank = _rank_normalize(self.engagement)
+        self.sentiment_unit = array('d', [(s + 1) / 2 for s in self.sentiment])
+        self.aspect_rank = {aspect: _rank_normalize(values) for aspect, values in self.aspects.items()}
+        self.competition_rank = _rank_normalize(self.competitive_share)
+
+    def _competitive_share(self, i):
+        if not self.has_competition:
+            return None
+        share = self.competitive_share[i]
+        return share if share == share else None
+
+    def competitors(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return [{'name': self.products[self.indices[j]], 'co_mentions': self.weights[j]} for j in range(start, end)]
+
+    def _ranked(self, budget=None, prefer=None):
+        """[(score in [0, 1], product index)], best first."""
+        weights = dict(WEIGHTS, aspect=PREFER_WEIGHT if prefer else 0.0)
+        if not self.has_competition:
+            weights['competition'] = 0.0
+        total = sum(weights.values())
+        aspect_rank = self.aspect_rank[prefer] if prefer else None
+
+        scored = []
+        for i in range(len(self.products)):
+            price = self.price[i]
+            # Unknown prices stay in; known ones must fit the budget (10% slack)
+            if budget is not None and price == price and price > budget * 1.1:
+                continue
+            score = (weights['popularity'] * self.popularity_rank[i]
+                     + weights['momentum'] * self.momentum_rank[i]
+                     + weights['sentiment'] * self.sentiment_unit[i]
+                     + weights['engagement'] * self.engagement_rank[i]
+                     + (weights['competition'] * self.competition_rank[i] if self.has_competition else 0.0)
+                     + (weights['aspect'] * aspect_rank[i] if aspect_rank else 0.0))
+            scored.append((score / total, i))
+        scored.sort(reverse=True)
+        return scored
+
+    def recommend(self, budget=None, prefer=None, limit=10):
+        results = []
+        for score, i in self._ranked(budget, prefer)[:limit]:
+            price = self.price[i]
+            result = {
+                'name': self.products[i],
+                'score': round(score * 100, 1),
+                'mentions': self.mentions[i],
+                'momentum': self.momentum[i],
+                'sentiment': self.sentiment[i],
+                'typical_price': price if price == price else None,
+                'competitive_share': self._competitive_share(i),
+                'competitors': self.competitors(i),
+            }
+            if prefer:
+                result[f"{prefer}_share"] = self.aspects[prefer][i]
+            results.append(result)
+        return results
+
+    def cards(self, limit=24):
+        """
+        The client's product cards, best trend score first: name, score (0-100),
+        a one-line description, sentiment summary and the top post as link.
+        """
+        cards = []
+        for score, i in self._ranked()[:limit]:
+            positive = self.positive_share[i]
+            title, link = self.top_post[i] or (None, None)
+            description = [f"{self.mentions[i]} mentions"]
+            if positive == positive:
+                description.append(f"{positive:.0%} positive")
+            if self.momentum[i] >= 1.2:
+                description.append(f"up {self.momentum[i]:.1f}x this week")
+            elif self.momentum[i] <= 0.8:
+                description.append(f"down {1 / self.momentum[i]:.1f}x this week")
+            cards.append({
+                'name': self.products[i],
+                'score': round(score * 100),
+                'description': ', '.join(description),
+                'mentions': self.mentions[i],
+                'momentum': self.momentum[i],
+                'sentiment': {'average': self.sentiment[i],
+                              'positive_share': positive if positive == positive else None},
+                'top_post': title,
+                'link': link,
+            })
+        return cards
+
+
+class Recommender:
+    """Loads every category's feature file and reloads one when it is rebuilt."""
+
+    def __init__(self, directory=FEATURES_DIR, check_interval=RELOAD_CHECK_INTERVAL):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._features = {}
+        self._mtimes = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            for category in CATEGORIES:
+                path = os.path.join(self.directory, f"{category}.json")
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                if self._mtimes.get(category) == mtime:
+                    continue
+                with open(path) as f:
+                    self._features[category] = CategoryFeatures(json.load(f))
+                self._mtimes[category] = mtime
+        finally:
+            self._lock.release()
+
+    def features(self, category):
+        self._maybe_reload()
+        return self._features.get(category)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build per-product recommendation features, or query them.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build')
+    build_parser.add_argument('--categories', nargs='+', default=list(CATEGORIES), choices=list(CATEGORIES))
+    query_parser = sub.add_parser('query')
+    query_parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    query_parser.add_argument('--budget', type=float, default=None)
+    query_parser.add_argument('--prefer', choices=ASPECTS, default=None)
+    query_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    if args.command == 'build':
+        registry = MetricsRegistry('recommend_build')
+        for category in args.categories:
+            build_features(category, registry)
+        registry.dump()
+        log_stage_summary(registry)
+    else:
+        features = Recommender().features(args.category)
+        if features is None:
+            print(f"No features for {args.category}. Run: python recommend.py build")
+        else:
+            start = time.perf_counter()
+            results = features.recommend(args.budget, args.prefer, args.limit)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for rank, result in enumerate(results, 1):
+                rivals = ', '.join(c['name'] for c in result['competitors'][:3])
+                print(f"{rank:>2}. {result['name']:<32} score {result['score']:>5}  "
+                      f"mentions {result['mentions']:>5}  vs {rivals}")
+            print(f"Ranked {len(features.products)} products in {elapsed_ms:.2f} ms")
@@ -0,0 +1,110 @@
+import os
+import time
+import random
+
+import prawcore
+
+from pipeline_metrics import MetricsRegistry, log_event
+
+# --- Fetch Configuration ---
+# Listing pages are requested (and committed by the collectors) this many posts at a time
+PAGE_SIZE = 100
+# Transient failures (network, 5xx, 429) are retried this many times per page
+MAX_RETRIES = int(os.environ.get('REDDIT_MAX_RETRIES', 5))
+# Full-jitter exponential backoff: sleep uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+# Once fewer requests than this are left in the rate-limit window, the remaining ones
+# are spread evenly over the time until it resets
+RATE_LIMIT_RESERVE = int(os.environ.get('REDDIT_RATE_LIMIT_RESERVE', 30))
+
+TRANSIENT_ERRORS = (prawcore.exceptions.RequestException, prawcore.exceptions.ServerError,
+                    prawcore.exceptions.TooManyRequests)
+
+
+class FetchError(Exception):
+    """A page could not be fetched: a permanent error, or retries ran out."""
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class RedditFetcher:
+    """
+    Pages through subreddit listings for the collectors: one request per
+    PAGE_SIZE posts, paced by the rate-limit headers Reddit returns
+    (X-Ratelimit-Remaining/-Reset, read through reddit.auth.limits), and
+    retried with jittered exponential backoff on transient errors. Permanent
+    errors (private, banned or missing subreddits) are raised right away.
+    """
+
+    def __init__(self, reddit, registry=None, category=None, max_retries=MAX_RETRIES,
+                 reserve=RATE_LIMIT_RESERVE, sleep=time.sleep):
+        self.reddit = reddit
+        self.registry = registry or MetricsRegistry('reddit_fetch')
+        self.labels = {'category': category} if category else {}
+        self.max_retries = max_retries
+        self.reserve = reserve
+        self.sleep = sleep
+
+    def _pace(self):
+        """Waits before the next request when the rate-limit budget runs low."""
+        limits = self.reddit.auth.limits
+        remaining, reset_at = limits.get('remaining'), limits.get('reset_timestamp')
+        if remaining is None or reset_at is None:
+            return
+        self.registry.set_gauge('reddit_ratelimit_remaining', remaining, **self.labels)
+        if remaining >= self.reserve:
+            return
+        delay = max(reset_at - time.time(), 0) / max(remaining, 1)
+        if delay > 0:
+            self.registry.inc('reddit_ratelimit_wait_seconds_total', delay, **self.labels)
+            self.sleep(delay)
+
+    def call(self, request, what):
+        """Runs `request()` with pacing and retries; `what` names it in logs and errors."""
+        for attempt in range(self.max_retries + 1):
+            self._pace()
+            try:
+                return request()
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise FetchError(f"{what}: gave up after {attempt + 1} attempts ({e})") from e
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                # A 429 says how long to wait; never retry sooner than that
+                delay = max(delay, _retry_after(e) or 0)
+                log_event('reddit_fetch_retry', what=what, attempt=attempt + 1, error=f"{type(e).__name__}: {e}",
+                          sleep=round(delay, 2))
+                self.registry.inc('reddit_fetch_retries_total', error=type(e).__name__, **self.labels)
+                self.sleep(delay)
+            except prawcore.exceptions.PrawcoreException as e:
+                raise FetchError(f"{what}: {type(e).__name__}: {e}") from e
+
+    def new_posts(self, subreddit, limit=1000, page_size=PAGE_SIZE):
+        """
+        Yields a subreddit's newest submissions a page at a time (lists of PRAW
+        submissions), so the caller can store each page before the next request.
+        """
+        after, fetched = None, 0
+        while fetched < limit:
+            size = min(page_size, limit - fetched)
+            params = {'after': after} if after else None
+
+            def request():
+                return list(self.reddit.subreddit(subreddit).new(limit=size, params=params))
+
+            with self.registry.time_stage('fetch', **self.labels) as batch:
+                page = self.call(request, f"r/{subreddit} page {fetched // page_size + 1}")
+                batch.items = len(page)
+            if not page:
+                return
+            yield page
+            fetched += len(page)
+            if len(page) < size:
+                return
+            after = page[-1].fullname
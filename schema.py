@@ -0,0 +1,18 @@
+def ensure_columns(db, *models):
+    """
+    db.create_all() only creates missing tables, so columns added to a model
+    later are missing from existing SQLite files. Adds them with ALTER TABLE;
+    call inside an app context. Only nullable columns can be added this way.
+    """
+    with db.engine.begin() as conn:
+        for model in models:
+            table = model.__table__
+            existing = {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')}
+            if not existing:
+                continue  # Table not created yet; create_all() will add it whole
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+                print(f"Added column {table.name}.{column.name}")
@@ -0,0 +1,76 @@
+import os
+import asyncio
+import argparse
+
+# Production serving defaults; must be set before app.py is imported (also in
+# every worker process uvicorn spawns, which re-imports this module)
+os.environ.setdefault('APP_READ_ONLY', '1')
+os.environ.setdefault('SERVE_SNAPSHOT', '1')
+
+from asgiref.wsgi import WsgiToAsgi
+from app import app, trend_broadcaster
+
+wsgi_application = WsgiToAsgi(app)
+
+STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # Stop nginx-style proxies from buffering the stream
+    (b'x-accel-buffering', b'no'),
+]
+
+
+async def trends_stream(scope, receive, send):
+    """
+    /api/trends/stream as a native ASGI handler. WsgiToAsgi runs the Flask app
+    on a single worker thread, so the endless SSE generator of app.py would
+    block every other request of the process; here each stream is an async
+    generator waiting on the event loop.
+    """
+    headers = dict(scope['headers'])
+    last_event_id = headers[b'last-event-id'].decode('latin-1') if b'last-event-id' in headers else None
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # uvicorn silently drops writes to a closed connection, so watch for the disconnect
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    stream = trend_broadcaster.stream_async(last_event_id)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+        async for message in stream:
+            if disconnected.done():
+                return
+            await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+        # Dropped for falling behind: end the response, the browser reconnects
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        disconnected.cancel()
+        await stream.aclose()
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: uvicorn serve:application --workers 4"""
+    if scope['type'] == 'http' and scope['path'] == '/api/trends/stream' and scope['method'] == 'GET':
+        await trends_stream(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the trends API with uvicorn worker processes.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--live', action='store_true',
+                        help="Query the DB on every request instead of serving the published snapshot.")
+    args = parser.parse_args()
+
+    if args.live:
+        # Env for the worker processes, config for this one (workers=1 reuses it)
+        os.environ['SERVE_SNAPSHOT'] = '0'
+        app.config['SERVE_SNAPSHOT'] = False
+
+    import uvicorn
+    uvicorn.run('serve:application', host=args.host, port=args.port, workers=args.workers, log_level='warning')
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import threading
+import datetime as dt
+
+from pipeline_metrics import log_event
+
+# --- Snapshot Configuration ---
+# Pipelines publish the precomputed API payloads here after every run; app.py
+# serves them (SERVE_SNAPSHOT=1) instead of aggregating the DB on each request.
+SNAPSHOT_PATH = os.environ.get('SERVING_SNAPSHOT_PATH', 'serving_snapshot.json')
+# How often a worker process stats the file to see if a new snapshot landed
+CHECK_INTERVAL = 1.0
+
+
+def publish_snapshot(path=SNAPSHOT_PATH):
+    """
+    Rebuilds the serving snapshot from the phone DB and swaps it in atomically
+    (write to a temp file, then os.replace). Failures are logged, not raised, so
+    a pipeline run never fails because of the serving layer.
+    """
+    try:
+        from app import app, build_serving_snapshot
+
+        start = time.perf_counter()
+        with app.app_context():
+            payloads = build_serving_snapshot()
+        snapshot = {'version': time.time(), 'built_at': dt.datetime.now().isoformat(timespec='seconds'),
+                    'payloads': payloads}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+        log_event('serving_snapshot_published', path=path, seconds=round(time.perf_counter() - start, 4))
+        return snapshot['version']
+    except Exception as e:
+        log_event('serving_snapshot_failed', path=path, error=str(e))
+        return None
+
+
+class SnapshotReader:
+    """
+    Per-process view of the published snapshot. Payloads are kept as ready-made
+    JSON bodies; a reload builds the new dict and then swaps one reference, so a
+    request sees either the old snapshot or the new one, never a mix.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._bodies = None
+        self._mtime = None
+        self._version = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        # One thread reloads; the others keep serving the current snapshot
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            with open(self.path) as f:
+                snapshot = json.load(f)
+            bodies = {key: json.dumps(value) for key, value in snapshot['payloads'].items()}
+            self._bodies, self._mtime, self._version = bodies, mtime, snapshot['version']
+        except (OSError, ValueError, KeyError) as e:
+            log_event('serving_snapshot_unreadable', path=self.path, error=str(e))
+        finally:
+            self._reload_lock.release()
+
+    def body(self, key):
+        """JSON body for one endpoint payload, or None if no snapshot has been published."""
+        self._maybe_reload()
+        bodies = self._bodies
+        return bodies.get(key) if bodies else None
+
+    @property
+    def version(self):
+        self._maybe_reload()
+        return self._version
+
+
+if __name__ == '__main__':
+    version = publish_snapshot()
+    print(f"Published serving snapshot to {SNAPSHOT_PATH}" if version else "Snapshot publish failed (see log line above).")
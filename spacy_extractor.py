@@ -0,0 +1,86 @@
+import os
+import json
+import time
+
+from gazetteer import merge_mentions
+from mention_sentiment import score_mentions_batch
+
+# --- spaCy Backend Configuration ---
+SPACY_MODEL = os.environ.get('SPACY_MODEL', 'en_core_web_sm')
+# Only the NER component (and the tok2vec layer it listens to) is needed for doc.ents
+SPACY_EXCLUDE = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter']
+ENTITY_LABELS = {'PRODUCT', 'ORG'}
+SPACY_BATCH_SIZE = int(os.environ.get('SPACY_BATCH_SIZE', 256))
+# Worker processes for whole-database runs; the worker's micro-batches stay in-process
+SPACY_N_PROCESS = int(os.environ.get('SPACY_N_PROCESS', 1))
+
+# Loaded on first use and shared by every category
+nlp = None
+
+
+def load_spacy():
+    """Loads the trimmed spaCy pipeline once; raises OSError if the model is not downloaded."""
+    global nlp
+    if nlp is None:
+        import spacy
+        print(f"Loading spaCy model {SPACY_MODEL} (ner only)...")
+        load_start = time.perf_counter()
+        nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+        print(f"spaCy model loaded in {time.perf_counter() - load_start:.1f}s "
+              f"(components: {', '.join(nlp.pipe_names)}).")
+    return nlp
+
+
+def doc_entities(doc):
+    """PRODUCT/ORG entities of a Doc as JSON-friendly (text, start, end) lists, the cached form."""
+    return [[ent.text, ent.start_char, ent.end_char] for ent in doc.ents if ent.label_ in ENTITY_LABELS]
+
+
+def pipe_entities(texts, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS):
+    """Streams texts through nlp.pipe and yields each one's entities, in order."""
+    for doc in load_spacy().pipe(texts, batch_size=batch_size, n_process=n_process):
+        yield doc_entities(doc)
+
+
+class SpacyExtractor:
+    """
+    NER_BACKEND=spacy: stands in for a category's *_bert.py module wherever the
+    worker and streaming pipeline use one. Models, app/db, prefilter, gazetteer
+    and metrics come from the wrapped module; only the NER step differs, and the
+    results go to the same extracted_* and mention_sentiment columns.
+    """
+
+    def __init__(self, category, module):
+        self.category = category
+        self.module = module
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def load_ner_pipeline(self):
+        return load_spacy()
+
+    def extract_posts(self, posts):
+        module = self.module
+        texts = [f"{post.title}. {post.body or ''}" if post.title else (post.body or '') for post in posts]
+        keep = [module.prefilter.should_extract(text) for text in texts]
+        to_run = [text for text, wanted in zip(texts, keep) if wanted]
+        with module.registry.time_stage('ner', items=len(to_run), category=self.category, backend='spacy'):
+            ner_outputs = iter(module.ner_cache.get_or_compute_many(
+                to_run, f"spacy:{SPACY_MODEL}", lambda batch: list(pipe_entities(batch, n_process=1))))
+
+        results, spans = [], []
+        for post, wanted in zip(posts, keep):
+            found = [(text.strip(), start, end) for text, start, end in next(ner_outputs)] if wanted else []
+            entities = [text for text, _, _ in found if text]
+            spans.append(found)
+            if module.gazetteer is not None:
+                cleaned_text = f"{post.cleaned_title or ''} {post.cleaned_body or ''}"
+                entities = merge_mentions(entities, module.gazetteer.extract(cleaned_text), module.normalize_mentions)
+            results.append(list(dict.fromkeys(entities)))
+
+        with module.registry.time_stage('mention_sentiment', items=len(posts), category=self.category):
+            scored = score_mentions_batch(texts, results, spans)
+        for post, pairs in zip(posts, scored):
+            post.mention_sentiment = json.dumps(pairs)
+        return results
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import json
+import queue
+import argparse
+import threading
+import datetime as dt
+from collections import OrderedDict
+
+from categories import CATEGORIES, NER_BACKENDS, get_category, collect_module, extractor_module, normalizer
+from pipeline_metrics import MetricsRegistry, log_event, log_stage_summary
+from serving_snapshot import publish_snapshot
+from heavy_hitters import HeavyHitters, TrendingWindows, process_source
+
+# --- Streaming Configuration ---
+# Every stage talks to the next through a queue of this size. A full queue
+# blocks the producer, so a slow NER stage throttles fetching instead of
+# letting posts pile up in memory.
+QUEUE_SIZE = 256
+NER_BATCH_SIZE = 16
+# Longest a partial NER/DB batch waits before it is flushed anyway
+MAX_BATCH_WAIT = 1.0
+# Ids we have already seen in this run; bounded so memory stays flat
+SEEN_IDS_LIMIT = 50000
+REPORT_INTERVAL = 60
+
+_DONE = object()
+
+
+def _iter_queue(inbox):
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            return
+        yield item
+
+
+def _iter_batches(inbox, size, max_wait):
+    """Yields lists of up to `size` items, flushing early once the oldest has waited `max_wait`."""
+    batch = []
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = inbox.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+        if item is _DONE:
+            if batch:
+                yield batch
+            return
+        if item is not None:
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + max_wait
+        if batch and (len(batch) >= size or time.monotonic() >= deadline):
+            yield batch
+            batch, deadline = [], None
+
+
+class StreamingPipeline:
+    """
+    fetch -> dedupe -> clean/sentiment -> NER -> normalize/aggregate -> persist,
+    each stage a generator running in its own thread and connected by bounded queues.
+    Posts are committed with their extracted entities as soon as their
+    micro-batch finishes, so /api/trends counts them within seconds.
+    """
+
+    def __init__(self, category, source, queue_size=QUEUE_SIZE,
+                 batch_size=NER_BATCH_SIZE, max_batch_wait=MAX_BATCH_WAIT, backend=None):
+        self.category = category
+        self.cfg = get_category(category)
+        self.source = source
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+        self.collector = collect_module(category)
+        self.extractor = extractor_module(category, backend)
+        self.normalize = normalizer(category)
+        self.registry = MetricsRegistry(f"{category}_stream")
+        # Fixed-memory top-K for this run, plus the windows behind /api/trending (see heavy_hitters.py)
+        self.trend_counts = HeavyHitters()
+        self.trending = TrendingWindows(process_source(f"{category}_stream"))
+        self._seen_ids = OrderedDict()
+        self._queues = []
+        self._threads = []
+        self._stopping = threading.Event()
+
+    # --- Stages ---
+
+    def fetch_stage(self):
+        for submission in self.source:
+            if self._stopping.is_set():
+                return
+            if submission is None:  # source had nothing new this poll
+                continue
+            if submission['id'] in self._seen_ids:
+                continue
+            self._seen_ids[submission['id']] = True
+            if len(self._seen_ids) > SEEN_IDS_LIMIT:
+                self._seen_ids.popitem(last=False)
+            self.registry.inc('stream_posts_fetched_total', category=self.category)
+            yield submission
+
+    def _existing_ids(self, ids):
+        model = self.extractor.RedditPost
+        return {row.id for row in model.query.with_entities(model.id).filter(model.id.in_(ids)).all()}
+
+    def dedupe_stage(self, batches):
+        """
+        Drops submissions that are already stored, e.g. the newest ~100 a fresh
+        Reddit stream replays on start, before they reach NER and the trend counts.
+        """
+        app = getattr(self.extractor, self.cfg['app'])
+        for submissions in batches:
+            with app.app_context(), self.registry.time_stage('stream_dedupe', items=len(submissions),
+                                                             category=self.category):
+                existing = self._existing_ids([submission['id'] for submission in submissions])
+            if existing:
+                self.registry.inc('stream_posts_known_total', len(existing), category=self.category)
+            for submission in submissions:
+                if submission['id'] not in existing:
+                    yield submission
+
+    def enrich_stage(self, submissions):
+        model = self.extractor.RedditPost
+        for item in submissions:
+            with self.registry.time_stage('clean_sentiment', items=1, category=self.category):
+                compound, label = self.collector.get_sentiment(item['title'])
+                post = model(
+                    id=item['id'], subreddit=item['subreddit'], title=item['title'],
+                    score=item['score'], url=item['url'], num_comments=item['num_comments'],
+                    body=item['body'], created=item['created'],
+                    cleaned_title=self.collector.clean_text(item['title']),
+                    cleaned_body=self.collector.clean_text(item['body']),
+                    sentiment_compound=compound, sentiment_label=label,
+                )
+            yield post
+
+    def ner_stage(self, batches):
+        for posts in batches:
+            with self.registry.time_stage('stream_ner', items=len(posts), category=self.category):
+                entities = self.extractor.extract_posts(posts)
+            for post, names in zip(posts, entities):
+                setattr(post, self.cfg['extracted_column'], json.dumps(names))
+                yield post, names
+
+    def aggregate_stage(self, items):
+        for post, names in items:
+            with self.registry.time_stage('normalize', items=1, category=self.category):
+                normalized = self.normalize(names)
+                self.trend_counts.update(normalized)
+                self.trending.add(self.category, normalized, post.created.timestamp())
+            yield post
+
+    def persist_stage(self, batches):
+        db = getattr(self.extractor, self.cfg['db'])
+        app = getattr(self.extractor, self.cfg['app'])
+        for posts in batches:
+            with app.app_context(), self.registry.time_stage('db_write', items=len(posts), category=self.category):
+                # A collector may have stored the same post since dedupe_stage looked
+                existing = self._existing_ids([post.id for post in posts])
+                fresh = [post for post in posts if post.id not in existing]
+                db.session.add_all(fresh)
+                db.session.commit()
+            now = dt.datetime.now()
+            for post in fresh:
+                self.registry.observe('reddit_to_trend_seconds', (now - post.created).total_seconds(),
+                                      category=self.category)
+            self.registry.inc('stream_posts_stored_total', len(fresh), category=self.category)
+            yield len(fresh)
+
+    # --- Wiring ---
+
+    def _spawn(self, name, produce, inbox=None, batched=False):
+        outbox = queue.Queue(maxsize=self.queue_size)
+
+        def run():
+            try:
+                if inbox is None:
+                    items = produce()
+                elif batched:
+                    items = produce(_iter_batches(inbox, self.batch_size, self.max_batch_wait))
+                else:
+                    items = produce(_iter_queue(inbox))
+                for item in items:
+                    outbox.put(item)
+            except Exception as e:
+                log_event('stream_stage_failed', stage=name, category=self.category, error=str(e))
+                self._stopping.set()
+            finally:
+                outbox.put(_DONE)
+
+        thread = threading.Thread(target=run, name=f"{self.category}-{name}", daemon=True)
+        self._queues.append((name, outbox))
+        self._threads.append(thread)
+        return outbox
+
+    def run(self):
+        self.extractor.load_ner_pipeline()
+        fetched = self._spawn('fetch', self.fetch_stage)
+        unseen = self._spawn('dedupe', self.dedupe_stage, fetched, batched=True)
+        enriched = self._spawn('enrich', self.enrich_stage, unseen)
+        extracted = self._spawn('ner', self.ner_stage, enriched, batched=True)
+        aggregated = self._spawn('aggregate', self.aggregate_stage, extracted)
+        stored = self._spawn('persist', self.persist_stage, aggregated, batched=True)
+        for thread in self._threads:
+            thread.start()
+
+        print(f"Streaming {self.category} posts (Ctrl+C to stop)...")
+        total = 0
+        last_report = time.monotonic()
+        try:
+            for count in _iter_queue(stored):
+                total += count
+                for name, q in self._queues:
+                    self.registry.set_gauge('stream_queue_depth', q.qsize(), stage=name, category=self.category)
+                if time.monotonic() - last_report >= REPORT_INTERVAL:
+                    self.report(total)
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            print("Stopping stream...")
+            self._stopping.set()
+        self.report(total)
+        self.registry.dump()
+        log_stage_summary(self.registry)
+
+    def report(self, total):
+        top = ', '.join(f"{name} ({count})" for name, count in self.trend_counts.top(5))
+        print(f"Stored {total} posts so far. Top {self.category} mentions this run: {top or 'none yet'}")
+        self.registry.dump()
+        self.trending.dump()
+        if self.category == 'phone':
+            publish_snapshot()
+
+
+def reddit_source(category, poll_pause=5.0, error_pause=30.0):
+    """
+    Yields new submissions from all of a category's subreddits as plain dicts (None when idle).
+    One PRAW stream is kept for the whole run: a new stream starts by re-fetching the
+    newest ~100 submissions, so it is only re-created after an error. Replayed ones that are
+    already stored are dropped by StreamingPipeline.dedupe_stage.
+    """
+    collector = collect_module(category)
+    reddit = collector.get_reddit_client()
+    multireddit = reddit.subreddit('+'.join(collector.target_subreddits))
+    while True:
+        try:
+            for submission in multireddit.stream.submissions(pause_after=0, skip_existing=False):
+                if submission is None:
+                    yield None
+                    time.sleep(poll_pause)
+                    continue
+                yield {
+                    'id': submission.id, 'subreddit': submission.subreddit.display_name,
+                    'title': submission.title, 'score': submission.score, 'url': submission.url,
+                    'num_comments': submission.num_comments, 'body': submission.selftext,
+                    'created': dt.datetime.fromtimestamp(submission.created_utc),
+                }
+        except Exception as e:
+            log_event('reddit_stream_failed', category=category, error=str(e), retry_in=error_pause)
+            yield None
+            time.sleep(error_pause)
+
+
+def synthetic_source(n, seed=42):
+    """Synthetic posts from synthetic_corpus.py, for exercising the pipeline without Reddit."""
+    from synthetic_corpus import iter_posts
+    for post in iter_posts(n, seed):
+        yield {key: value for key, value in post.items() if key != 'mentions'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Streaming ingest -> NER -> trend pipeline with backpressure.")
+    parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--batch-size', type=int, default=NER_BATCH_SIZE)
+    parser.add_argument('--max-batch-wait', type=float, default=MAX_BATCH_WAIT)
+    parser.add_argument('--backend', default=None, choices=NER_BACKENDS, help="NER model (default: NER_BACKEND or bert).")
+    parser.add_argument('--synthetic', type=int, default=None, metavar='N',
+                        help="Stream N synthetic posts instead of Reddit (point REDDIT_POSTS_DB_URI at a scratch DB).")
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    source = synthetic_source(args.synthetic) if args.synthetic else reddit_source(args.category)
+    StreamingPipeline(args.category, source, queue_size=args.queue_size,
+                      batch_size=args.batch_size, max_batch_wait=args.max_batch_wait, backend=args.backend).run()
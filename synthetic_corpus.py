@@ -0,0 +1,124 @@
+import random
+import string
+import datetime as dt
+
+# --- Synthetic Reddit Corpus ---
+# Seeded generator for benchmark fixtures. Shapes (title/body lengths, share of
+# empty bodies, subreddit mix, score distribution) roughly follow what the phone
+# collector pulls from the subreddits in mobile_collect_data.py.
+
+SUBREDDIT_MIX = {
+    'smartphones': 14, 'SuggestASmartphone': 12, 'PickMeAPhone': 10, 'PickAnAndroidForMe': 6,
+    'phones': 6, 'iphone': 12, 'GooglePixel': 10, 'samsung': 10, 'oneplus': 5, 'Xiaomi': 5,
+    'motorola': 3, 'IndiaTech': 4, 'gadgetsindia': 3,
+}
+
+# Raw mention templates as people actually write them (not the canonical names)
+PRODUCT_TEMPLATES = [
+    lambda r: f"iPhone {r.choice([12, 13, 14, 15, 16])}{r.choice(['', '', ' Pro', ' Pro Max', ' Plus'])}",
+    lambda r: f"{r.choice(['Samsung Galaxy', 'Galaxy', 'Samsung'])} S{r.choice([21, 22, 23, 24, 25])}{r.choice(['', '', ' Ultra', ' Plus', ' FE'])}",
+    lambda r: f"S{r.choice([23, 24, 25])} Ultra",
+    lambda r: f"Galaxy A{r.choice([14, 15, 25, 34, 35, 54, 55])}",
+    lambda r: f"{r.choice(['Pixel', 'Google Pixel'])} {r.choice([6, 7, 8, 9])}{r.choice(['', '', ' Pro', 'a'])}",
+    lambda r: f"OnePlus {r.choice([10, 11, 12, 13])}{r.choice(['', '', 'R', 'T'])}",
+    lambda r: f"OnePlus Nord {r.choice(['CE 3', 'CE 4', '3', '4'])}",
+    lambda r: f"Redmi Note {r.choice([11, 12, 13, 14])}{r.choice(['', ' Pro', ' Pro+'])}",
+    lambda r: f"POCO {r.choice(['F5', 'F6', 'X6', 'M6'])}{r.choice(['', ' Pro'])}",
+    lambda r: f"Nothing Phone {r.choice(['(1)', '(2)', '2a', '(3)'])}",
+    lambda r: f"Moto {r.choice(['G84', 'G54', 'Edge 40', 'Edge 50'])}",
+    lambda r: f"Xiaomi {r.choice([13, 14])}{r.choice(['', ' Pro', ' Ultra'])}",
+    lambda r: f"Vivo {r.choice(['V29', 'X100', 'V30'])}",
+    lambda r: f"Realme {r.choice(['11', '12', 'GT'])}{r.choice(['', ' Pro'])}",
+]
+
+TITLE_TEMPLATES = [
+    "{p1} vs {p2}?",
+    "Should I upgrade from {p1} to {p2}",
+    "{p1} battery life after six months",
+    "Is the {p1} still worth it in 2024?",
+    "Just got the {p1}, first impressions",
+    "Which phone under ${budget}?",
+    "Need a phone with a good camera for travel",
+    "{p1} or {p2} for a student?",
+    "My {p1} screen cracked again",
+    "Help me pick: {p1}, {p2} or {p3}",
+    "Weekly discussion thread",
+    "lol",
+    "Look at this",
+]
+
+FILLER_WORDS = (
+    "the a i my it is for and to of with this that on but have just so really any was "
+    "phone camera battery screen price budget upgrade deal worth performance software update "
+    "display charging storage gaming photos video night mode 5g carrier unlocked warranty "
+    "thoughts help suggestions think feel love hate good great bad issue problem months years "
+    "daily use heavy light month switch from android ios apps smooth lag heat brightness"
+).split()
+
+
+def _lognormal_words(rng, mu, sigma, cap):
+    return max(1, min(cap, int(rng.lognormvariate(mu, sigma))))
+
+
+def _filler(rng, n):
+    return ' '.join(rng.choice(FILLER_WORDS) for _ in range(n))
+
+
+def _post_id(rng):
+    return ''.join(rng.choice(string.ascii_lowercase + string.digits) for _ in range(7))
+
+
+def generate_post(rng, start_time, span_seconds):
+    """Returns one synthetic post dict plus the raw product mentions it contains."""
+    products = [rng.choice(PRODUCT_TEMPLATES)(rng) for _ in range(3)]
+    template = rng.choice(TITLE_TEMPLATES)
+    title = template.format(p1=products[0], p2=products[1], p3=products[2],
+                            budget=rng.choice([200, 300, 400, 500, 700, 1000]))
+    mentions = [p for i, p in enumerate(products) if f"{{p{i + 1}}}" in template]
+
+    # Roughly 40% of posts are link/image posts with an empty selftext
+    if rng.random() < 0.4:
+        body = ''
+    else:
+        words = _filler(rng, _lognormal_words(rng, 4.0, 0.8, 600)).split()
+        for _ in range(rng.choice([0, 0, 1, 1, 2])):
+            product = rng.choice(PRODUCT_TEMPLATES)(rng)
+            words.insert(rng.randrange(len(words) + 1), product)
+            mentions.append(product)
+        body = ' '.join(words)
+        if len(title.split()) < 4:
+            title = f"{title} {_filler(rng, _lognormal_words(rng, 1.8, 0.5, 20))}"
+
+    subreddit = rng.choices(list(SUBREDDIT_MIX), weights=list(SUBREDDIT_MIX.values()))[0]
+    post_id = _post_id(rng)
+    return {
+        'id': post_id,
+        'subreddit': subreddit,
+        'title': title,
+        'score': int(rng.paretovariate(1.2)) - 1,
+        'url': f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+        'num_comments': int(rng.paretovariate(1.1)) - 1,
+        'body': body,
+        'created': start_time + dt.timedelta(seconds=rng.randrange(span_seconds)),
+        'mentions': mentions,
+    }
+
+
+def iter_posts(n, seed=42, days=30, chunk_size=None):
+    """
+    Yields `n` synthetic posts deterministically for a given seed. With
+    `chunk_size`, yields lists of that many posts instead of single posts, so
+    large corpora never have to be held in memory at once.
+    """
+    rng = random.Random(seed)
+    start_time = dt.datetime(2024, 1, 1)
+    span_seconds = days * 24 * 3600
+    if not chunk_size:
+        for _ in range(n):
+            yield generate_post(rng, start_time, span_seconds)
+        return
+    remaining = n
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        yield [generate_post(rng, start_time, span_seconds) for _ in range(size)]
+        remaining -= size
@@ -1,58 +1,60 @@
 import os
 import sys
 import json
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+import time
+from ner_cache import NerCache
+from prefilter import ProductPrefilter
+from gazetteer import Gazetteer, merge_mentions
+from categories import normalizer
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from mention_sentiment import score_mentions_batch
+from ner_spans import SpanTagger, span_names, span_offsets, span_confidences
 
 # Make sure we can import the tablet DB model
 sys.path.append(os.getcwd())
 try:
-    from tablet_collect_data import tablet_app, tablet_db, RedditPost
+    from tablet_collect_data import tablet_app, tablet_db, RedditPost, RedditComment
 except Exception:
-    from tablet_collect_data import tablet_app, tablet_db, RedditPost
+    from tablet_collect_data import tablet_app, tablet_db, RedditPost, RedditComment
 
 MODEL_NAME = "dslim/bert-base-NER"
-
-print("Loading BERT NER model for tablet extraction... (this may take a moment)")
-try:
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForTokenClassification.from_pretrained(MODEL_NAME)
-    ner_pipeline = pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy=None)
-    print("Model loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    raise
-
-
-def group_consecutive_entities(ner_results):
-    grouped_entities = []
-    current_entity_words = []
-
-    for token in ner_results:
-        entity_label = token.get('entity', '')
-        word = token.get('word', '')
-
-        if entity_label.startswith('B-'):
-            if current_entity_words:
-                grouped_entities.append("".join(current_entity_words).replace('##', ''))
-            current_entity_words = [word]
-        elif entity_label.startswith('I-'):
-            if current_entity_words:
-                current_entity_words.append(word)
-        else:
-            if current_entity_words:
-                grouped_entities.append("".join(current_entity_words).replace('##', ''))
-            current_entity_words = []
-
-    if current_entity_words:
-        grouped_entities.append("".join(current_entity_words).replace('##', ''))
-
-    cleaned = []
-    for ent in grouped_entities:
-        ent_fixed = ent.replace('##', '')
-        ent_fixed = ent_fixed.strip()
-        if ent_fixed:
-            cleaned.append(ent_fixed)
-    return cleaned
+# The NER cache holds entity spans (see ner_spans.py), not the old pipeline's token dicts
+SPANS_MODEL_ID = f"{MODEL_NAME}:spans"
+# Posts per extract_posts() call when re-processing a whole database
+EXTRACT_BATCH_SIZE = 64
+
+# Shared across the phone/laptop/tablet extractors (see ner_cache.py)
+ner_cache = NerCache()
+# Skips posts with no brand/model signal before they reach the model (PREFILTER_MODE)
+prefilter = ProductPrefilter.for_category('tablet')
+# EXTRACTOR_MODE=merge adds dictionary matches from gazetteer.py on top of the BERT output
+EXTRACTOR_MODE = os.environ.get('EXTRACTOR_MODE', 'bert')
+gazetteer = Gazetteer.for_category('tablet') if EXTRACTOR_MODE == 'merge' else None
+normalize_mentions = normalizer('tablet')
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('tablet_extract')
+
+# The model is loaded on first use so the helpers above can be imported cheaply
+ner_pipeline = None
+
+def load_ner_pipeline():
+    """Loads the BERT NER pipeline once and reuses it for every later call."""
+    global ner_pipeline
+    if ner_pipeline is None:
+        print("Loading BERT NER model for tablet extraction... (this may take a moment)")
+        load_start = time.perf_counter()
+        try:
+            from transformers import AutoTokenizer, AutoModelForTokenClassification
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+            model = AutoModelForTokenClassification.from_pretrained(MODEL_NAME)
+            # Tokenizer + model without the HF "ner" pipeline; returns entity spans per text
+            ner_pipeline = SpanTagger(tokenizer, model)
+            print("Model loaded successfully.")
+            registry.set_gauge('model_load_seconds', round(time.perf_counter() - load_start, 3), category='tablet')
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            raise
+    return ner_pipeline
 
 
 def extract_full_tablet_names(text: str):
@@ -60,15 +62,51 @@ def extract_full_tablet_names(text: str):
         return []
 
     try:
-        ner_results = ner_pipeline(text)
+        with registry.time_stage('ner', items=1, category='tablet'):
+            found = ner_cache.get_or_compute(text, SPANS_MODEL_ID, load_ner_pipeline())
     except Exception as e:
         print(f"NER pipeline failed on text: {e}")
         return []
 
-    full_names = group_consecutive_entities(ner_results)
+    full_names = span_names(found)
     return full_names
 
 
+def extract_posts(posts, with_confidence=False):
+    """
+    Batched extraction used by extraction_worker.py: prefilters every post, runs a
+    single NER call over the cache misses and groups entities per post. Also sets
+    `mention_sentiment` on each post, scored around each mention's NER offsets.
+    With `with_confidence`, also returns each post's {entity: confidence} (cascade.py).
+    """
+    # Comments have no title, so they are run on their body alone
+    texts = [f"{post.title}. {post.body or ''}" if post.title else (post.body or '') for post in posts]
+    keep = [prefilter.should_extract(text) for text in texts]
+    to_run = [text for text, wanted in zip(texts, keep) if wanted]
+    with registry.time_stage('ner', items=len(to_run), category='tablet'):
+        # One tokenizer + model pass over the misses; entities come back as spans (see ner_spans.py)
+        found_per_post = iter(ner_cache.get_or_compute_many(
+            to_run, SPANS_MODEL_ID, lambda batch: load_ner_pipeline()(batch, batch_size=len(batch))))
+
+    results, spans, confidences = [], [], []
+    for post, wanted in zip(posts, keep):
+        found = next(found_per_post) if wanted else []
+        entities = span_names(found)
+        spans.append(span_offsets(found))
+        confidences.append(span_confidences(found))
+        if gazetteer is not None:
+            cleaned_text = f"{post.cleaned_title or ''} {post.cleaned_body or ''}"
+            entities = merge_mentions(entities, gazetteer.extract(cleaned_text), normalize_mentions)
+        # Deduplicate while preserving order
+        results.append(list(dict.fromkeys(e.strip() for e in entities if e.strip())))
+
+    with registry.time_stage('mention_sentiment', items=len(posts), category='tablet'):
+        scored = score_mentions_batch(texts, results, spans)
+    for post, pairs in zip(posts, scored):
+        post.mention_sentiment = json.dumps(pairs)
+    return (results, confidences) if with_confidence else results
+
+
 def process_all_tablet_posts(only_missing=True):
     with tablet_app.app_context():
         if only_missing:
@@ -81,31 +119,29 @@ def process_all_tablet_posts(only_missing=True):
             return
 
         print(f"Processing {len(posts)} posts for tablet entity extraction...")
+        load_ner_pipeline()
 
         updated = 0
-        for post in posts:
-            text = f"{post.title or ''}. {post.body or ''}"
-            entities = extract_full_tablet_names(text)
-            seen = set()
-            deduped = []
-            for e in entities:
-                e_clean = e.strip()
-                if not e_clean:
-                    continue
-                if e_clean not in seen:
-                    seen.add(e_clean)
-                    deduped.append(e_clean)
-
-            try:
-                post.extracted_tablets = json.dumps(deduped)
+        # Same batched path as the worker, so mention sentiment is filled in too
+        for start in range(0, len(posts), EXTRACT_BATCH_SIZE):
+            chunk = posts[start:start + EXTRACT_BATCH_SIZE]
+            for post, entities in zip(chunk, extract_posts(chunk)):
+                post.extracted_tablets = json.dumps(entities)
                 tablet_db.session.add(post)
                 updated += 1
-            except Exception as e:
-                print(f"Failed to set extracted_tablets for post {post.id}: {e}")
 
         if updated:
-            tablet_db.session.commit()
+            with registry.time_stage('db_write', items=updated, category='tablet'):
+                tablet_db.session.commit()
         print(f"Finished. Updated {updated} posts.")
+        print(ner_cache.report())
+        print(prefilter.report())
+        registry.inc('ner_cache_lookups_total', ner_cache.hits, category='tablet', result='hit')
+        registry.inc('ner_cache_lookups_total', ner_cache.misses, category='tablet', result='miss')
+        registry.set_gauge('ner_cache_hit_rate', round(ner_cache.hit_rate, 4), category='tablet')
+        registry.set_gauge('prefilter_skip_ratio', round(prefilter.skip_ratio, 4), category='tablet')
+        registry.dump()
+        log_stage_summary(registry)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,14 @@
+import sys
 import praw
 import datetime as dt
 import re
 import nltk
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from job_queue import JobQueue
+from reddit_fetch import RedditFetcher, FetchError
+from comment_ingest import COLLECT_COMMENTS, collect_comments
+from schema import ensure_columns
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import json
@@ -28,6 +34,7 @@ class RedditPost(tablet_db.Model):
     sentiment_compound = tablet_db.Column(tablet_db.Float, nullable=True)
     sentiment_label = tablet_db.Column(tablet_db.String(50), nullable=True)
     extracted_tablets = tablet_db.Column(tablet_db.Text, nullable=True)  # JSON string list
+    mention_sentiment = tablet_db.Column(tablet_db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
 
     @property
     def tablets(self):
@@ -45,9 +52,47 @@ class RedditPost(tablet_db.Model):
     def __repr__(self):
         return f"<Tablet Post ID: {self.id}>"
 
+class RedditComment(tablet_db.Model):
+    id = tablet_db.Column(tablet_db.String, primary_key=True)
+    post_id = tablet_db.Column(tablet_db.String, tablet_db.ForeignKey('reddit_post.id'), nullable=False, index=True)
+    parent_id = tablet_db.Column(tablet_db.String, nullable=True)
+    depth = tablet_db.Column(tablet_db.Integer, nullable=False, default=0)
+    body = tablet_db.Column(tablet_db.Text, nullable=False)
+    score = tablet_db.Column(tablet_db.Integer, nullable=False)
+    created = tablet_db.Column(tablet_db.DateTime, nullable=False)
+    cleaned_body = tablet_db.Column(tablet_db.Text, nullable=True)
+    sentiment_compound = tablet_db.Column(tablet_db.Float, nullable=True)
+    sentiment_label = tablet_db.Column(tablet_db.String(50), nullable=True)
+    extracted_tablets = tablet_db.Column(tablet_db.Text, nullable=True)  # Same JSON list format as posts
+    mention_sentiment = tablet_db.Column(tablet_db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
+
+    post = tablet_db.relationship('RedditPost', backref=tablet_db.backref('comments', lazy='dynamic'))
+
+    # Comments have no title; these let them go through tablet_bert.extract_posts() as-is
+    @property
+    def title(self):
+        return ''
+
+    @property
+    def cleaned_title(self):
+        return None
+
+    @property
+    def tablets(self):
+        if self.extracted_tablets:
+            try:
+                return json.loads(self.extracted_tablets)
+            except json.JSONDecodeError:
+                return []
+        return []
+
+    def __repr__(self):
+        return f"<Tablet Comment ID: {self.id} on {self.post_id}>"
+
 # Create tables if they don't exist
 with tablet_app.app_context():
     tablet_db.create_all()
+    ensure_columns(tablet_db, RedditPost, RedditComment)
 
 # NLTK setup (lightweight checks)
 try:
@@ -94,16 +139,6 @@ def clean_text(text):
     cleaned_tokens = [lemmatizer.lemmatize(word) for word in tokens if word not in stop_words]
     return ' '.join(cleaned_tokens)
 
-# Reddit API credentials (re-using existing credentials in the repo)
-reddit = praw.Reddit(
-    client_id="",
-    client_secret="",
-    user_agent="",
-    username="",
-    password="",
-)
-print("Authenticated to Reddit for tablet collector.")
-
 # Top 10 tablet-related subreddits (reasonable selection)
 target_subreddits = [
     'tablets',
@@ -121,43 +156,86 @@ target_subreddits = [
 ]
 
 post_limit = 1000  # per-subreddit fetch limit
-new_posts = []
 
-print("Fetching tablet-related posts and preparing to insert into tablet_reddit_posts.db...")
-with tablet_app.app_context():
-    # load existing ids from the tablet DB to avoid duplicates
-    existing_post_ids = {post.id for post in RedditPost.query.with_entities(RedditPost.id).all()}
-
-    for sub in target_subreddits:
-        try:
-            subreddit = reddit.subreddit(sub)
-            for post in subreddit.new(limit=post_limit):
-                if post.id not in existing_post_ids:
-                    compound, label = get_sentiment(post.title)
-                    new_post = RedditPost(
-                        id=post.id,
-                        subreddit=sub,
-                        title=post.title,
-                        score=post.score,
-                        url=post.url,
-                        num_comments=post.num_comments,
-                        body=post.selftext,
-                        created=dt.datetime.fromtimestamp(post.created_utc),
-                        cleaned_title=clean_text(post.title),
-                        cleaned_body=clean_text(post.selftext),
-                        sentiment_compound=compound,
-                        sentiment_label=label,
-                        extracted_tablets=None
-                    )
-                    new_posts.append(new_post)
-                    existing_post_ids.add(post.id)
-        except Exception as e:
-            print(f"Could not process subreddit r/{sub}. Error: {e}")
-
-if new_posts:
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('tablet_collect')
+
+# Reddit API credentials (re-using existing credentials in the repo)
+def get_reddit_client():
+    return praw.Reddit(
+        client_id="",
+        client_secret="",
+        user_agent="",
+        username="",
+        password="",
+    )
+
+def collect_posts(with_comments=COLLECT_COMMENTS):
+    """Fetches new tablet posts from every target subreddit and inserts them into tablet_reddit_posts.db."""
+    reddit = get_reddit_client()
+    print("Authenticated to Reddit for tablet collector.")
+
+    fetcher = RedditFetcher(reddit, registry=registry, category='tablet')
+    queue = JobQueue()
+    new_post_ids = []
+
+    print("Fetching tablet-related posts and preparing to insert into tablet_reddit_posts.db...")
     with tablet_app.app_context():
-        tablet_db.session.add_all(new_posts)
-        tablet_db.session.commit()
-    print(f"Inserted {len(new_posts)} new tablet posts into tablet_reddit_posts.db")
-else:
-    print("No new tablet posts found to insert.")
+        # load existing ids from the tablet DB to avoid duplicates
+        existing_post_ids = {post.id for post in RedditPost.query.with_entities(RedditPost.id).all()}
+
+        for sub in target_subreddits:
+            try:
+                # Each page is committed and queued before the next request, so a failure
+                # halfway through a subreddit (or the run) keeps what was already fetched
+                for submissions in fetcher.new_posts(sub, limit=post_limit):
+                    new_posts = []
+                    for post in submissions:
+                        if post.id not in existing_post_ids:
+                            with registry.time_stage('sentiment', items=1, category='tablet'):
+                                compound, label = get_sentiment(post.title)
+                            with registry.time_stage('clean', items=1, category='tablet'):
+                                cleaned_title = clean_text(post.title)
+                                cleaned_body = clean_text(post.selftext)
+                            new_post = RedditPost(
+                                id=post.id,
+                                subreddit=sub,
+                                title=post.title,
+                                score=post.score,
+                                url=post.url,
+                                num_comments=post.num_comments,
+                                body=post.selftext,
+                                created=dt.datetime.fromtimestamp(post.created_utc),
+                                cleaned_title=cleaned_title,
+                                cleaned_body=cleaned_body,
+                                sentiment_compound=compound,
+                                sentiment_label=label,
+                                extracted_tablets=None
+                            )
+                            new_posts.append(new_post)
+                            existing_post_ids.add(post.id)
+                    if new_posts:
+                        page_ids = [post.id for post in new_posts]
+                        with registry.time_stage('db_write', items=len(new_posts), category='tablet'):
+                            tablet_db.session.add_all(new_posts)
+                            tablet_db.session.commit()
+                        registry.inc('posts_ingested_total', len(new_posts), category='tablet')
+                        # Hand the new posts to extraction_worker.py, if one is running
+                        queue.enqueue('tablet', page_ids)
+                        new_post_ids.extend(page_ids)
+            except FetchError as e:
+                # Retries are done by now: the subreddit is unavailable or Reddit kept failing
+                print(f"Could not process subreddit r/{sub}. Error: {e}")
+
+    if new_post_ids:
+        print(f"Inserted {len(new_post_ids)} new tablet posts into tablet_reddit_posts.db")
+        if with_comments:
+            collect_comments('tablet', new_post_ids, collector=sys.modules[__name__], registry=registry)
+    else:
+        print("No new tablet posts found to insert.")
+
+    registry.dump()
+    log_stage_summary(registry)
+
+if __name__ == '__main__':
+    collect_posts()
@@ -4,6 +4,12 @@ from collections import Counter
 import os
 import sys
 import nltk
+from pipeline_metrics import MetricsRegistry, log_stage_summary
+from entity_resolution import get_resolver
+from mention_sentiment import sentiment_shares, format_shares
+from compact_posts import load_compact, describe
+from trend_history import TrendHistory
+from schema import ensure_columns
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
@@ -28,6 +34,7 @@ class RedditPost(tablet_db.Model):
     sentiment_compound = tablet_db.Column(tablet_db.Float, nullable=True)
     sentiment_label = tablet_db.Column(tablet_db.String(50), nullable=True)
     extracted_tablets = tablet_db.Column(tablet_db.Text, nullable=True)
+    mention_sentiment = tablet_db.Column(tablet_db.Text, nullable=True)  # JSON [[mention, compound], ...] per extracted mention
 
     @property
     def tablets(self):
@@ -38,6 +45,10 @@ class RedditPost(tablet_db.Model):
                 return []
         return []
 
+# Older databases predate the mention_sentiment column
+with tablet_app.app_context():
+    ensure_columns(tablet_db, RedditPost)
+
 # --- NLTK Configuration ---
 try:
     nltk.data.find('tokenizers/punkt')
@@ -78,6 +89,9 @@ PATTERN_MAP = {
     r"^(amazon)? ?fire ?(hd)? ?(\d{1,2}) ?(plus|kids)?$": lambda m: f"Amazon Fire {'HD ' if m.group(2) else ''}{m.group(3)}{' ' + m.group(4).title() if m.group(4) else ''}",
 }
 
+# Per-stage timings, dumped to pipeline_metrics/ for app.py's /metrics endpoint
+registry = MetricsRegistry('tablet_normalize')
+
 def filter_with_nltk_pos(mentions):
     """
     Filters a list of mentions, keeping only those that are likely product names
@@ -115,32 +129,59 @@ def normalize_tablet_list(tablet_list):
                 is_matched = True
                 break
         if not is_matched and len(clean_name) > 3:
-            normalized_names.append(name.title())
+            # Otherwise the product catalog, opened on first use so importing this module
+            # creates no catalog DB
+            normalized_names.append(get_resolver('tablet').resolve(name) or name.title())
     return normalized_names
 
 def analyze_and_print_trends():
     """
     Main function to fetch, filter, normalize, and print tablet trends.
     """
-    all_extracted_tablets = []
     print("Connecting to tablet database and fetching extracted data...")
-    with tablet_app.app_context():
-        posts = RedditPost.query.filter(RedditPost.extracted_tablets.isnot(None)).all()
-        for post in posts:
-            all_extracted_tablets.extend(post.tablets)
-    
+    with tablet_app.app_context(), registry.time_stage('load', category='tablet') as batch:
+        # Only the mention columns, interned into flat arrays (see compact_posts.py)
+        posts = load_compact(RedditPost, 'extracted_tablets')
+        batch.items = len(posts)
+    print(describe(posts))
+    all_extracted_tablets = posts.mention_names()
+
     print(f"Found a total of {len(all_extracted_tablets)} raw tablet mentions to process.")
 
     # Step 1: NLTK Filtering
     print("\nStep 1: Filtering mentions with NLTK Part-of-Speech tagging...")
-    product_candidates = filter_with_nltk_pos(all_extracted_tablets)
+    with registry.time_stage('pos_filter', items=len(all_extracted_tablets), category='tablet'):
+        product_candidates = filter_with_nltk_pos(all_extracted_tablets)
     print(f"--> Kept {len(product_candidates)} candidates after NLTK filtering.")
     
     # Step 2: Normalization
     print("\nStep 2: Normalizing candidates with regex and custom rules...")
-    final_list = normalize_tablet_list(product_candidates)
+    with registry.time_stage('normalize', items=len(product_candidates), category='tablet'):
+        final_list = normalize_tablet_list(product_candidates)
     
     trend_counts = Counter(final_list)
+
+    # Per-mention sentiment goes through the same filter and normalization, once per raw name
+    canonical_names = {}
+    def canonical(name):
+        if name not in canonical_names:
+            normalized = normalize_tablet_list(filter_with_nltk_pos([name]))
+            canonical_names[name] = normalized[0] if normalized else None
+        return canonical_names[name]
+    with registry.time_stage('mention_sentiment', category='tablet'):
+        shares = sentiment_shares(posts.sentiment_pairs(), canonical)
+    # Append this run's ranking for /api/trends/history (see trend_history.py)
+    if trend_counts:
+        with registry.time_stage('history', items=len(trend_counts), category='tablet'):
+            trend_history = TrendHistory()
+            trend_history.record('tablet', trend_counts, shares)
+            trend_history.close()
+
+    registry.dump()
+    log_stage_summary(registry)
+    resolver = get_resolver('tablet')
+    resolver.flush()
+    print(resolver.report())
     
     print("\n--- Top 20 Final Tablet Trends ---")
     print("-" * 55)
@@ -149,10 +190,11 @@ def analyze_and_print_trends():
         print("No definitive product trends could be identified after cleaning.")
         return
 
-    print(f"{'Rank':<5} | {'Tablet Model':<35} | {'Mentions'}")
-    print("-" * 55)
+    print(f"{'Rank':<5} | {'Tablet Model':<35} | {'Mentions':>8} | {'Pos%':>5} | {'Neg%':>5}")
+    print("-" * 70)
     for i, (model, count) in enumerate(trend_counts.most_common(30), 1):
-        print(f"{i:<5} | {model:<35} | {count}")
+        positive, negative = format_shares(shares.get(model))
+        print(f"{i:<5} | {model:<35} | {count:>8} | {positive:>5} | {negative:>5}")
 
 if __name__ == '__main__':
     analyze_and_print_trends()
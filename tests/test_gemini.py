@@ -0,0 +1,159 @@
+"""
+Gemini.py against gemini_stub.py: prompt packing, mapping answers back to
+posts, retries, the NER cache and the BERT fallback. Needs no API key.
+"""
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import Gemini
+from Gemini import GeminiClient, GeminiExtractor, pack, parse_response
+from gemini_stub import start_stub
+from ner_cache import NerCache
+from pipeline_metrics import MetricsRegistry
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Retries still happen, just without the sleeps between them
+    monkeypatch.setattr(Gemini, 'BACKOFF_BASE', 0.0)
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server, url = start_stub(**options)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(url, **options):
+    options.setdefault('requests_per_minute', 0)
+    return GeminiClient('phone', base_url=url, api_key='test', **options)
+
+
+def texts_about(n):
+    return [f"Post {i}: thinking about the Pixel {i} or the Galaxy S{i}" for i in range(n)]
+
+
+def test_pack_by_count_and_characters():
+    assert [len(batch) for batch in pack(['x'] * 60, posts_per_prompt=25)] == [25, 25, 10]
+    assert pack(['a' * 400] * 5, posts_per_prompt=25, max_chars=1000) == [[0, 1], [2, 3], [4]]
+
+
+def test_packed_prompts_per_request(stub):
+    client = make_client(stub(), posts_per_prompt=25)
+    results = client.extract_many(texts_about(60))
+    assert client.requests == 3
+    assert client.posts_sent == 60
+    assert all(names is not None for names in results)
+
+
+def test_answers_map_back_to_their_posts(stub):
+    texts = texts_about(30)
+    results = make_client(stub(), posts_per_prompt=7).extract_many(texts)
+    assert results == [[f"Pixel {i}", f"Galaxy S{i}"] for i in range(30)]
+
+
+def test_parse_response_fenced_json_and_missing_ids():
+    text = '```json\n{"0": ["Pixel 8"], "2": [" iPhone 15 ", ""], "3": "not a list"}\n```'
+    assert parse_response(text, 4) == [["Pixel 8"], None, ["iPhone 15"], None]
+    assert parse_response('[{"id": 1, "products": ["Galaxy S24"]}]', 2) == [None, ["Galaxy S24"]]
+    assert parse_response('not json', 2) == [None, None]
+
+
+def test_retries_503_then_gives_up(stub):
+    client = make_client(stub(fail_rate=1.0, fail_status=503))
+    assert client.extract_many(texts_about(3)) == [None, None, None]
+    assert client.requests == Gemini.MAX_ATTEMPTS
+    assert client.retries == Gemini.MAX_ATTEMPTS - 1
+    assert client.failed_posts == 3
+
+
+def test_does_not_retry_400(stub):
+    client = make_client(stub(fail_rate=1.0, fail_status=400))
+    assert client.extract_many(texts_about(3)) == [None, None, None]
+    assert client.requests == 1
+    assert client.retries == 0
+
+
+def test_rate_limit_holds_across_calls(stub, monkeypatch):
+    client = make_client(stub(), requests_per_minute=600)
+    starts = []
+    post = GeminiClient._post
+
+    def timed_post(self, prompt):
+        starts.append(time.monotonic())
+        return post(self, prompt)
+
+    monkeypatch.setattr(GeminiClient, '_post', timed_post)
+    client.extract_many(texts_about(1))
+    client.extract_many(texts_about(2)[1:])
+    assert len(starts) == 2
+    # 600 requests per minute: the second call's request waits for the first's 0.1 s slot
+    assert starts[1] - starts[0] >= 0.09
+
+
+def test_second_call_is_answered_from_the_cache(stub, tmp_path):
+    cache = NerCache(str(tmp_path / 'ner_cache.db'))
+    client = make_client(stub(), cache=cache)
+    texts = texts_about(10)
+    first = client.extract_many(texts)
+    requests = client.requests
+    assert client.extract_many(texts) == first
+    assert client.requests == requests
+    assert cache.hits == len(texts)
+    cache.close()
+
+
+class FakeBert:
+    """Stands in for a *_bert.py module: the prefilter, metrics and the fallback extractor."""
+
+    def __init__(self):
+        self.prefilter = SimpleNamespace(should_extract=lambda text: 'skip' not in text)
+        self.registry = MetricsRegistry('test_gemini')
+        self.gazetteer = None
+        self.ner_cache = None
+        self.fallback_posts = []
+
+    def extract_posts(self, posts):
+        self.fallback_posts.extend(posts)
+        for post in posts:
+            post.mention_sentiment = json.dumps([["BERT Phone", 0.0]])
+        return [["BERT Phone"] for _ in posts]
+
+    def counter(self, name):
+        samples = self.registry.snapshot()['metrics'].get(name, {'samples': []})['samples']
+        return sum(sample['value'] for sample in samples)
+
+
+def make_posts(titles):
+    return [SimpleNamespace(title=title, body='', cleaned_title=title.lower(), cleaned_body='') for title in titles]
+
+
+def test_extractor_uses_gemini_answers(stub):
+    module = FakeBert()
+    extractor = GeminiExtractor('phone', module, client=make_client(stub()))
+    posts = make_posts(["Pixel 8 or Galaxy S24?", "skip this one"])
+    assert extractor.extract_posts(posts) == [["Pixel 8", "Galaxy S24"], []]
+    assert module.fallback_posts == []
+    assert [name for name, _ in json.loads(posts[0].mention_sentiment)] == ["Pixel 8", "Galaxy S24"]
+
+
+def test_extractor_falls_back_to_bert(stub):
+    module = FakeBert()
+    extractor = GeminiExtractor('phone', module, client=make_client(stub(fail_rate=1.0)))
+    posts = make_posts(["Pixel 8 or Galaxy S24?", "skip this one", "iPhone 15 battery"])
+    assert extractor.extract_posts(posts) == [["BERT Phone"], [], ["BERT Phone"]]
+    assert module.fallback_posts == [posts[0], posts[2]]
+    assert module.counter('gemini_fallback_posts_total') == 2
+    assert json.loads(posts[1].mention_sentiment) == []
@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+import argparse
+import datetime as dt
+
+from categories import CATEGORIES
+
+# --- History Configuration ---
+# Every normalize run appends its ranking here; app.py serves product history
+# and rank changes from it.
+HISTORY_PATH = os.environ.get('TREND_HISTORY_PATH', 'trend_history.db')
+# Products below this many mentions in a run are noise and are not recorded
+MIN_MENTIONS = int(os.environ.get('TREND_HISTORY_MIN_MENTIONS', 2))
+MAX_PRODUCTS = int(os.environ.get('TREND_HISTORY_MAX_PRODUCTS', 1000))
+DEFAULT_WINDOW_DAYS = 7
+
+
+def _timestamp(value):
+    """Epoch seconds from a datetime, an ISO string ("2026-10-01", "2026-10-01T12:00") or a number."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            value = dt.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _locked(method):
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    wrapper.__name__, wrapper.__doc__ = method.__name__, method.__doc__
+    return wrapper
+
+
+def _format_time(epoch):
+    return dt.datetime.fromtimestamp(epoch).isoformat(sep=' ', timespec='minutes') if epoch else '-'
+
+
+def _share(entry, key):
+    """Sentiment share in permille, so a point is stored as small integers only."""
+    if not entry or not entry['mentions']:
+        return None
+    return round(1000 * entry[key] / entry['mentions'])
+
+
+class TrendHistory:
+    """
+    Append-only history of the normalize scripts' rankings. One trend_snapshot
+    row per run and one narrow trend_point row (mentions, rank, sentiment in
+    permille) per product in that run. Points are clustered by product, so a
+    product's history is one range scan. A second index by snapshot serves
+    "ranking at time T" for rank changes.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        # The API shares one connection between request threads
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trend_snapshot ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " category TEXT NOT NULL,"
+            " taken_at REAL NOT NULL,"
+            " total_mentions INTEGER NOT NULL,"
+            " products INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_trend_snapshot_taken ON trend_snapshot (category, taken_at)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trend_product ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " category TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " UNIQUE (category, name))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trend_point ("
+            " product_id INTEGER NOT NULL,"
+            " snapshot_id INTEGER NOT NULL,"
+            " mentions INTEGER NOT NULL,"
+            " rank INTEGER NOT NULL,"
+            " positive_permille INTEGER,"
+            " negative_permille INTEGER,"
+            " PRIMARY KEY (product_id, snapshot_id)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_trend_point_snapshot ON trend_point (snapshot_id, rank)"
+        )
+        self._product_ids = {}
+
+    def _product_id(self, category, name):
+        key = (category, name)
+        if key not in self._product_ids:
+            self._conn.execute("INSERT OR IGNORE INTO trend_product (category, name) VALUES (?, ?)", key)
+            self._product_ids[key] = self._conn.execute(
+                "SELECT id FROM trend_product WHERE category = ? AND name = ?", key).fetchone()[0]
+        return self._product_ids[key]
+
+    @_locked
+    def record(self, category, trend_counts, shares=None, taken_at=None):
+        """
+        Appends one run's ranking: `trend_counts` is the normalize scripts'
+        Counter, `shares` their sentiment_shares() result. Returns the snapshot id.
+        """
+        ranked = sorted(((name, count) for name, count in trend_counts.items() if count >= MIN_MENTIONS),
+                        key=lambda item: (-item[1], item[0]))[:MAX_PRODUCTS]
+        shares = shares or {}
+        taken_at = _timestamp(taken_at) or time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            snapshot_id = self._conn.execute(
+                "INSERT INTO trend_snapshot (category, taken_at, total_mentions, products) VALUES (?, ?, ?, ?)",
+                (category, taken_at, sum(trend_counts.values()), len(ranked))).lastrowid
+            self._conn.executemany(
+                "INSERT INTO trend_point (product_id, snapshot_id, mentions, rank, positive_permille, negative_permille) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self._product_id(category, name), snapshot_id, count, rank,
+                  _share(shares.get(name), 'positive'), _share(shares.get(name), 'negative'))
+                 for rank, (name, count) in enumerate(ranked, 1)])
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            # Ids interned inside the rolled-back transaction no longer exist
+            self._product_ids.clear()
+            raise
+        return snapshot_id
+
+    @_locked
+    def snapshot_at(self, category, when=None):
+        """(id, taken_at) of the last snapshot taken at or before `when` (default: the latest)."""
+        when = _timestamp(when)
+        if when is None:
+            return self._conn.execute(
+                "SELECT id, taken_at FROM trend_snapshot WHERE category = ? ORDER BY taken_at DESC LIMIT 1",
+                (category,)).fetchone()
+        return self._conn.execute(
+            "SELECT id, taken_at FROM trend_snapshot WHERE category = ? AND taken_at <= ? "
+            "ORDER BY taken_at DESC LIMIT 1", (category, when)).fetchone()
+
+    @_locked
+    def history(self, category, name, since=None, until=None):
+        """
+        A product's points in recording order, as columns (chart-ready and small
+        as JSON): {'taken_at': [epoch seconds], 'mentions', 'rank',
+        'positive_share', 'negative_share'}. None if the product was never recorded.
+        """
+        row = self._conn.execute("SELECT id FROM trend_product WHERE category = ? AND name = ?",
+                                 (category, name)).fetchone()
+        if row is None:
+            return None
+        since, until = _timestamp(since), _timestamp(until)
+        query = ("SELECT s.taken_at, p.mentions, p.rank, p.positive_permille, p.negative_permille "
+                 "FROM trend_point p JOIN trend_snapshot s ON s.id = p.snapshot_id WHERE p.product_id = ?")
+        params = [row[0]]
+        if since is not None:
+            query += " AND s.taken_at >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND s.taken_at <= ?"
+            params.append(until)
+        # Snapshots are appended in time order, so the primary key order is time order
+        rows = self._conn.execute(query + " ORDER BY p.snapshot_id", params).fetchall()
+        taken_at, mentions, ranks, positive, negative = zip(*rows) if rows else ((),) * 5
+        return {
+            'name': name,
+            'taken_at': [int(value) for value in taken_at],
+            'mentions': list(mentions),
+            'rank': list(ranks),
+            'positive_share': [None if value is None else value / 1000 for value in positive],
+            'negative_share': [None if value is None else value / 1000 for value in negative],
+        }
+
+    def _ranking(self, snapshot_id, limit):
+        return self._conn.execute(
+            "SELECT p.product_id, t.name, p.rank, p.mentions FROM trend_point p "
+            "JOIN trend_product t ON t.id = p.product_id WHERE p.snapshot_id = ? AND p.rank <= ? ORDER BY p.rank",
+            (snapshot_id, limit)).fetchall()
+
+    @_locked
+    def rank_changes(self, category, start=None, end=None, limit=30):
+        """
+        The top `limit` products at `end` with their rank and mentions at
+        `start`: positive `change` means the product climbed. Products that
+        were below the recorded cut at `start` have rank_before None.
+        Defaults to the last DEFAULT_WINDOW_DAYS days; 'from'/'to' in the result
+        are the epoch seconds of the two runs actually compared.
+        """
+        after = self.snapshot_at(category, end)
+        if after is None:
+            return None
+        start = _timestamp(start)
+        before = self.snapshot_at(category, after[1] - DEFAULT_WINDOW_DAYS * 86400 if start is None else start)
+        current = self._ranking(after[0], limit)
+        previous = {}
+        if before is not None:
+            ids = [product_id for product_id, _, _, _ in current]
+            previous = {product_id: (rank, mentions) for product_id, rank, mentions in self._conn.execute(
+                f"SELECT product_id, rank, mentions FROM trend_point WHERE snapshot_id = ? "
+                f"AND product_id IN ({', '.join('?' for _ in ids)})", [before[0], *ids])}
+        changes = []
+        for product_id, name, rank, mentions in current:
+            rank_before, mentions_before = previous.get(product_id, (None, 0))
+            changes.append({
+                'name': name,
+                'rank': rank,
+                'rank_before': rank_before,
+                'change': None if rank_before is None else rank_before - rank,
+                'mentions': mentions,
+                'mentions_before': mentions_before,
+            })
+        return {
+            'category': category,
+            'from': int(before[1]) if before else None,
+            'to': int(after[1]),
+            'changes': changes,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ranking history recorded by the normalize scripts.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    history_parser = sub.add_parser('history', help="One product's mentions and rank over time.")
+    history_parser.add_argument('product', help="Canonical product name, e.g. \"Google Pixel 8\"")
+    history_parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    history_parser.add_argument('--since', default=None, help="ISO date/time, e.g. 2026-09-01")
+    changes_parser = sub.add_parser('changes', help="Rank changes of the current top products.")
+    changes_parser.add_argument('--category', default='phone', choices=sorted(CATEGORIES))
+    changes_parser.add_argument('--from', dest='start', default=None,
+                                help=f"ISO date/time (default: {DEFAULT_WINDOW_DAYS} days before --to)")
+    changes_parser.add_argument('--to', dest='end', default=None, help="ISO date/time (default: latest run)")
+    changes_parser.add_argument('--limit', type=int, default=30)
+    args = parser.parse_args()
+
+    sys.path.append(os.getcwd())
+    store = TrendHistory()
+    start = time.perf_counter()
+    if args.command == 'history':
+        points = store.history(args.category, args.product, since=args.since)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if points is None:
+            print(f"No history for {args.product}.")
+        else:
+            for taken_at, rank, mentions in zip(points['taken_at'], points['rank'], points['mentions']):
+                print(f"{_format_time(taken_at)}  rank {rank:>4}  mentions {mentions:>6}")
+            print(f"{len(points['taken_at'])} points for {args.product} in {elapsed_ms:.2f} ms")
+    else:
+        result = store.rank_changes(args.category, args.start, args.end, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if result is None:
+            print(f"No {args.category} history yet. Run: python {CATEGORIES[args.category]['normalize_module']}.py")
+        else:
+            print(f"{args.category} ranking {_format_time(result['from'])} -> {_format_time(result['to'])}")
+            for row in result['changes']:
+                change = 'new' if row['change'] is None else f"{row['change']:+d}"
+                print(f"{row['rank']:>4}. {row['name']:<35} {change:>5}  mentions {row['mentions_before']:>6} -> {row['mentions']:>6}")
+            print(f"Computed in {elapsed_ms:.2f} ms")
+    store.close()